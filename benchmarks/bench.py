@@ -0,0 +1,351 @@
+""" Benchmarks for recipe parsing, tictac construction and pipeline
+    throughput on synthetic recipes and corpora.
+
+    Results are written as json and can be compared against a baseline:
+
+    python benchmarks/bench.py -o results.json
+    python benchmarks/bench.py --baseline results.json
+
+    Exits with status 1 if any timing regressed by more than the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import shutil
+import platform
+import tempfile
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# run as a script from a checkout, so benchmark the tictacs next to us
+# rather than an installed one - the imports have to come after this
+sys.path.insert(0, ROOT)
+
+from tictacs import from_recipe  # noqa: E402
+from tictacs.parse import Conjurer, create_tac  # noqa: E402
+from tictacs.cache import RecipeCache  # noqa: E402
+
+EXAMPLE_RECIPE = os.path.join(ROOT, 'recipes', 'example.yaml')
+# keys of results that are not timings and are not compared - keys that
+# are one of them or end with _ and one of them, eg: pickle_bytes
+SIZE_KEYS = ('bytes', 'nodes', 'docs')
+
+
+def make_corpus(n_docs, vocabulary=5000, length=20, seed=0):
+    """ Create a corpus of documents of words drawn from a zipf like
+        distribution, labelled by whether they contain more frequent
+        words than rare ones.
+
+    :n_docs: int - number of documents
+    :vocabulary: int - number of distinct words
+    :length: int - average number of words in a document
+    :returns: texts, labels
+
+    """
+    rnd = random.Random(seed)
+    words = ['w%d' % i for i in range(vocabulary)]
+    weights = [1. / (rank + 1) for rank in range(vocabulary)]
+    texts, labels = [], []
+    for _ in range(n_docs):
+        doc = rnd.choices(words, weights, k=rnd.randint(length // 2,
+                                                        length * 3 // 2))
+        texts.append(' '.join(doc))
+        labels.append(int(sum(1 for w in doc if int(w[1:]) < 50) >
+                          len(doc) // 2))
+    return texts, labels
+
+
+def make_recipe(depth, width, n_labels=0):
+    """ Create a recipe of nested Pipelines and FeatureUnions
+
+    :depth: int - levels of nesting
+    :width: int - number of branches of each FeatureUnion
+    :n_labels: int - number of labeled estimators defined outside the
+               pipeline, that leaves of the pipeline refer to
+    :returns: str - the yaml recipe and int - number of nodes
+
+    """
+    lines = []
+    for i in range(n_labels):
+        lines += ['label_def_%d:' % i,
+                  '  label: labeled_%d' % i,
+                  '  estimator: CountVectorizer',
+                  '  estimator_pkg: sklearn.feature_extraction.text',
+                  '  estimator_params:',
+                  '    max_features: %d' % (100 + i)]
+    counter = [0]
+
+    def node(level, indent):
+        pad = ' ' * indent
+        counter[0] += 1
+        name = 'node_%d' % counter[0]
+        if level == 0:
+            if n_labels:
+                return ['%s- labeled_%d' % (pad, counter[0] % n_labels)]
+            return ['%s- label: %s' % (pad, name),
+                    '%s  estimator: CountVectorizer' % pad,
+                    '%s  estimator_pkg: sklearn.feature_extraction.text'
+                    % pad]
+        out = ['%s- label: %s' % (pad, name),
+               '%s  estimator: FeatureUnion' % pad,
+               '%s  estimator_pkg: sklearn.pipeline' % pad,
+               '%s  estimator_params:' % pad,
+               '%s    transformer_list:' % pad]
+        for _ in range(width):
+            out += node(level - 1, indent + 6)
+        return out
+
+    lines += ['pipeline:',
+              '  label: root',
+              '  estimator: Pipeline',
+              '  estimator_pkg: sklearn.pipeline',
+              '  estimator_params:',
+              '    steps:']
+    lines += node(depth, 6)
+    lines += ['      - label: classifier',
+              '        estimator: LinearSVC',
+              '        estimator_pkg: sklearn.svm']
+    return '\n'.join(lines) + '\n', counter[0] + 2
+
+
+def measure(func, repeat=5):
+    """ Call func repeat times and get the best time in seconds """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_parse(tmpdir, shapes, repeat):
+    """ Latency of Conjurer.parse and from_recipe on synthetic recipes """
+    results = dict()
+    cache = RecipeCache(os.path.join(tmpdir, 'plans'))
+    for depth, width, n_labels in shapes:
+        text, nodes = make_recipe(depth, width, n_labels)
+        path = os.path.join(tmpdir, 'd%d_w%d_l%d.yaml'
+                            % (depth, width, n_labels))
+        with open(path, 'w') as f:
+            f.write(text)
+        name = 'recipe depth=%d width=%d labels=%d' % (depth, width,
+                                                       n_labels)
+        results[name] = {
+            'nodes': nodes,
+            'parse': measure(lambda: Conjurer(path).parse(), repeat),
+            'parse_cached': measure(
+                lambda: Conjurer(path, cache=cache).parse(), repeat),
+            'parse_lazy': measure(
+                lambda: Conjurer(path, lazy=True).parse(), repeat),
+            'from_recipe': measure(lambda: from_recipe(path), repeat),
+        }
+    return results
+
+
+def bench_construct(tmpdir, repeat, n=1000):
+    """ Cost of creating tictac classes, constructing tictacs and cloning
+        them, n times each """
+    from sklearn.base import clone
+    text, nodes = make_recipe(2, 3)
+    path = os.path.join(tmpdir, 'construct.yaml')
+    with open(path, 'w') as f:
+        f.write(text)
+    parser = Conjurer(path)
+    parsed = parser.parse()
+    base = parser.class_type
+    tictac_class = create_tac(base, parsed)
+    tictac = tictac_class(**parsed)
+
+    def create():
+        for _ in range(n):
+            create_tac(base, parsed)
+
+    def construct():
+        for _ in range(n):
+            tictac_class(**parsed)
+
+    def clone_tictac():
+        for _ in range(n):
+            clone(tictac)
+
+    return {'construct n=%d' % n: {
+        'nodes': nodes,
+        'create_tac': measure(create, repeat),
+        'construct': measure(construct, repeat),
+        'clone': measure(clone_tictac, repeat),
+    }}
+
+
+def bench_example(sizes, repeat):
+    """ Fit and predict throughput of the example recipe and the cost of
+        pickling the fitted tictac """
+    results = dict()
+    for size in sizes:
+        texts, labels = make_corpus(size)
+        tictac = from_recipe(EXAMPLE_RECIPE)
+        fit = measure(lambda: tictac.fit(texts, labels), max(1, repeat // 2))
+        predict = measure(lambda: tictac.predict(texts), max(1, repeat // 2))
+        data = pickle.dumps(tictac, pickle.HIGHEST_PROTOCOL)
+        results['example docs=%d' % size] = {
+            'docs': size,
+            'fit': fit,
+            'predict': predict,
+            'fit_docs_per_s': size / fit,
+            'predict_docs_per_s': size / predict,
+            'pickle': measure(
+                lambda: pickle.dumps(tictac, pickle.HIGHEST_PROTOCOL),
+                repeat),
+            'unpickle': measure(lambda: pickle.loads(data), repeat),
+            'pickle_bytes': len(data),
+        }
+    return results
+
+
+def bench_union(sizes, repeat):
+    """ Fit and transform time of sklearn's FeatureUnion against the
+        ThreadedUnion on vectorizer branches that share their analysis """
+    from sklearn.pipeline import FeatureUnion
+    from sklearn.feature_extraction.text import CountVectorizer, \
+        TfidfVectorizer
+    from tictacs.union import ThreadedUnion
+
+    def branches():
+        return [('counts', CountVectorizer()),
+                ('tfidf', TfidfVectorizer(min_df=2)),
+                ('binary', CountVectorizer(binary=True, max_features=1000)),
+                ('chars', CountVectorizer(analyzer='char_wb',
+                                          ngram_range=(2, 3)))]
+    results = dict()
+    for size in sizes:
+        texts, _ = make_corpus(size)
+        for name, union in (('FeatureUnion', FeatureUnion(branches())),
+                            ('ThreadedUnion', ThreadedUnion(branches()))):
+            union.fit(texts)
+            results['union %s docs=%d' % (name, size)] = {
+                'docs': size,
+                'fit_transform': measure(lambda: union.fit_transform(texts),
+                                         max(1, repeat // 2)),
+                'transform': measure(lambda: union.transform(texts),
+                                     max(1, repeat // 2)),
+            }
+    return results
+
+
+def bench_slim(sizes, repeat):
+    """ Predict throughput and memory footprint of the fitted example
+        recipe after slimming it with dict and compact vocabularies """
+    from tictacs.slim import footprint
+    results = dict()
+    for size in sizes:
+        texts, labels = make_corpus(size)
+        for vocabulary in (False, True):
+            tictac = from_recipe(EXAMPLE_RECIPE).fit(texts, labels)
+            tictac.slim(vocabulary=vocabulary)
+            predict = measure(lambda: tictac.predict(texts),
+                              max(1, repeat // 2))
+            results['slim %s docs=%d' % ('compact' if vocabulary else 'dict',
+                                         size)] = {
+                'docs': size,
+                'predict': predict,
+                'predict_docs_per_s': size / predict,
+                'footprint_bytes': footprint(tictac),
+            }
+    return results
+
+
+def is_size(key):
+    """ Check whether a key of the results is a size rather than a timing
+
+    :key: str - eg: pickle_bytes, but not fit_docs_per_s
+    :returns: bool
+
+    """
+    return key in SIZE_KEYS or \
+        key.endswith(tuple('_' + size for size in SIZE_KEYS))
+
+
+def compare(results, baseline, tolerance):
+    """ Find timings that got slower than the baseline
+
+    :results: dictionary of results of this run
+    :baseline: dictionary of results of a previous run
+    :tolerance: float - allowed relative slow down, eg: 0.1 for 10%
+    :returns: list of str - descriptions of the regressions
+
+    """
+    regressions = []
+    for name, metrics in sorted(results.items()):
+        for key, value in sorted(metrics.items()):
+            old = baseline.get(name, {}).get(key)
+            if old is None or is_size(key):
+                continue
+            if key.endswith('_per_s'):
+                # throughput - higher is better
+                worse = value < old / (1 + tolerance)
+            else:
+                worse = value > old * (1 + tolerance)
+            if worse:
+                regressions.append('%s %s: %.6g -> %.6g (%+.1f%%)'
+                                   % (name, key, old, value,
+                                      100. * (value - old) / old))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks for tictacs')
+    parser.add_argument('--output', '-o',
+                        help='File to write the results to as json')
+    parser.add_argument('--baseline', '-b',
+                        help='Results of a previous run to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slow down reported as a regression')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='Numbers of documents to fit the example '
+                             'recipe on, eg: 1000 10000 100000 1000000')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Times to repeat each measurement')
+    parser.add_argument('--quick', action='store_true',
+                        help='Only run small sizes')
+    args = parser.parse_args()
+    if args.quick:
+        args.sizes = [1000]
+        args.repeat = 3
+        shapes = [(1, 2, 0), (2, 3, 10)]
+    else:
+        shapes = [(1, 2, 0), (2, 3, 10), (3, 4, 50), (4, 4, 200)]
+    tmpdir = tempfile.mkdtemp(prefix='tictacs-bench-')
+    try:
+        results = dict()
+        results.update(bench_parse(tmpdir, shapes, args.repeat))
+        results.update(bench_construct(tmpdir, args.repeat))
+        results.update(bench_example(args.sizes, args.repeat))
+        results.update(bench_union(args.sizes, args.repeat))
+        results.update(bench_slim(args.sizes, args.repeat))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    output = {'python': platform.python_version(),
+              'platform': platform.platform(),
+              'results': results}
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against %s' % args.baseline)
+
+
+if __name__ == '__main__':
+    main()
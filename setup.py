@@ -15,6 +15,9 @@ setup(
         install_requires=[
             'pyyaml',
             ],
+        entry_points={
+            'console_scripts': ['tictacs = tictacs.__main__:main'],
+            },
         setup_requires=['pytest-runner'],
         test_requires=['pytest']
         )
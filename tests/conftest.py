@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+@pytest.fixture
+def write_recipe(tmpdir):
+    """ Write recipes to the temporary directory of a test
+
+    :returns: function(content, name='recipe.yaml') that writes the
+              content and returns the py.path of the recipe
+
+    """
+    def write(content, name='recipe.yaml'):
+        path = tmpdir.join(name)
+        path.write(content)
+        return path
+    return write
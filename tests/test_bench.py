@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import os
+import importlib.util
+
+path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'benchmarks', 'bench.py')
+spec = importlib.util.spec_from_file_location('bench', path)
+bench = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench)
+
+
+class TestCompare(object):
+
+    """test regressions against a baseline are reported"""
+
+    baseline = {'throughput': {'docs': 1000, 'fit': 1.,
+                               'fit_docs_per_s': 1000.,
+                               'predict_docs_per_s': 5000.,
+                               'pickle_bytes': 100}}
+
+    def test_throughput_drop(self):
+        results = {'throughput': {'docs': 1000, 'fit': 1.,
+                                  'fit_docs_per_s': 100.,
+                                  'predict_docs_per_s': 5000.,
+                                  'pickle_bytes': 1000}}
+        regressions = bench.compare(results, self.baseline, 0.1)
+        assert len(regressions) == 1
+        assert 'fit_docs_per_s' in regressions[0]
+
+    def test_slower(self):
+        results = {'throughput': dict(self.baseline['throughput'], fit=2.)}
+        assert len(bench.compare(results, self.baseline, 0.1)) == 1
+        assert bench.compare(self.baseline, self.baseline, 0.1) == []
+
+    def test_sizes(self):
+        assert bench.is_size('docs') and bench.is_size('pickle_bytes')
+        assert not bench.is_size('fit_docs_per_s')
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from tictacs.cache import RecipeCache, read_recipe
+
+recipe = """
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: svm
+        estimator: LinearSVC
+        estimator_pkg: sklearn.svm
+"""
+
+
+class TestRecipeCache(object):
+
+    """test plans are stored, reused across instances and invalidated"""
+
+    def test_reuse(self, tmpdir, write_recipe):
+        """test a second cache in the same location reads the stored plan"""
+        path = write_recipe(recipe)
+        location = str(tmpdir.join('cache'))
+        entries = RecipeCache(location).load(str(path))
+        assert entries['pipeline']['label'] == 'example'
+        assert len(os.listdir(location)) == 1
+        other = RecipeCache(location)
+        # if the plan is read from disk compile is never called
+        other.compile = None
+        assert other.load(str(path)) == entries
+
+    def test_copies(self, tmpdir, write_recipe):
+        """test modifying the returned entries doesn't affect the cache"""
+        path = write_recipe(recipe)
+        cache = RecipeCache(str(tmpdir.join('cache')))
+        cache.load(str(path))['pipeline']['label'] = 'changed'
+        assert cache.load(str(path))['pipeline']['label'] == 'example'
+
+    def test_invalidate(self, tmpdir, write_recipe):
+        """test changing the recipe creates a new plan"""
+        path = write_recipe(recipe)
+        cache = RecipeCache(str(tmpdir.join('cache')))
+        cache.load(str(path))
+        path.write(recipe.replace('example', 'changed'))
+        assert cache.load(str(path))['pipeline']['label'] == 'changed'
+
+
+fragment = """
+svm_def:
+  label: svm
+  estimator: LinearSVC
+  estimator_pkg: sklearn.svm
+  estimator_params:
+    C: 1
+    tol: 0.001
+"""
+
+
+class TestIncludes(object):
+
+    """test fragments are merged into recipes and parsed once"""
+
+    @pytest.fixture
+    def write(self, write_recipe):
+        return lambda name, content: str(write_recipe(content, name))
+
+    def test_merge(self, tmpdir, write):
+        write('fragment.yaml', fragment)
+        path = write('recipe.yaml', 'include: [fragment.yaml]\n'
+                     'svm_def: {estimator_params: {C: 10}}\n' + recipe)
+        entries = RecipeCache(str(tmpdir.join('cache'))).load(path)
+        assert 'include' not in entries
+        assert entries['svm_def']['estimator_params'] == {'C': 10,
+                                                          'tol': 0.001}
+        assert entries['pipeline']['label'] == 'example'
+
+    def test_fragment_parsed_once(self, tmpdir, write):
+        fragment_path = write('fragment.yaml', fragment)
+        paths = [write('recipe%d.yaml' % i, 'include: '
+                       'fragment.yaml\nname: %d\n' % i + recipe)
+                 for i in range(3)]
+        cache = RecipeCache(str(tmpdir.join('cache')))
+        compiled = []
+        compile = cache.compile
+
+        def counting(recipe, content, including=()):
+            compiled.append(recipe)
+            return compile(recipe, content, including)
+        cache.compile = counting
+        for path in paths:
+            assert cache.load(path)['svm_def']['label'] == 'svm'
+        assert compiled.count(fragment_path) == 1
+        # other processes read the plans from disk
+        other = RecipeCache(cache.location)
+        other.compile = None
+        assert other.load(paths[0])['name'] == 0
+
+    def test_fragment_changed(self, tmpdir, write):
+        fragment_path = write('fragment.yaml', fragment)
+        path = write('recipe.yaml',
+                     'include: fragment.yaml\n' + recipe)
+        cache = RecipeCache(str(tmpdir.join('cache')))
+        cache.load(path)
+        with open(fragment_path, 'w') as f:
+            f.write(fragment.replace('C: 1', 'C: 5'))
+        assert cache.load(path)['svm_def']['estimator_params']['C'] == 5
+        assert read_recipe(path)[0]['svm_def']['estimator_params']['C'] == 5
+
+    def test_old_fragments_dropped(self, write):
+        """test only the plan of the latest content of a fragment is kept"""
+        from tictacs.cache import FragmentCache
+        fragment_path = write('fragment.yaml', fragment)
+        path = write('recipe.yaml',
+                     'include: fragment.yaml\n' + recipe)
+        cache = FragmentCache()
+        with open(path, 'rb') as f:
+            content = f.read()
+        for C in range(10):
+            with open(fragment_path, 'w') as f:
+                f.write(fragment.replace('C: 1', 'C: %d' % C))
+            plan = cache.compile(path, content)
+            assert plan['entries']['svm_def']['estimator_params']['C'] == C
+        assert len(cache.memory) == 1
+
+    def test_cycle(self, tmpdir, write):
+        write('a.yaml', 'include: b.yaml\n')
+        path = write('b.yaml', 'include: a.yaml\n')
+        with pytest.raises(ValueError):
+            read_recipe(path)
+        with pytest.raises(ValueError):
+            RecipeCache(str(tmpdir.join('cache'))).load(path)
+
+    def test_missing(self, write):
+        path = write('recipe.yaml',
+                     'include: missing.yaml\n' + recipe)
+        with pytest.raises(ValueError):
+            read_recipe(path)
+
+
+class TestYaml(object):
+
+    """test recipes are loaded safely"""
+
+    def test_tuple(self):
+        from tictacs.cache import load_yaml
+        assert load_yaml('a: !tuple [1, 2]\n') == {'a': (1, 2)}
+
+    @pytest.mark.parametrize('tag', ['!!python/tuple [1, 2]',
+                                     '!!python/name:os.getcwd ""'])
+    def test_python_tags(self, write_recipe, tag):
+        path = write_recipe('a: %s\n' % tag + recipe)
+        with pytest.raises(ValueError) as error:
+            read_recipe(str(path))
+        assert 'python tags' in str(error.value)
+
+
+class TestStoredPlans(object):
+
+    """test plans on disk are json and are never unpickled"""
+
+    def test_json(self, tmpdir, write_recipe):
+        import json
+        path = write_recipe(recipe + '        estimator_params:\n'
+                            '          ngram_range: !tuple [1, 2]\n')
+        location = str(tmpdir.join('cache'))
+        entries = RecipeCache(location).load(str(path))
+        name, = os.listdir(location)
+        with open(os.path.join(location, name)) as f:
+            assert json.load(f)['recipe'] == str(path)
+        other = RecipeCache(location)
+        other.compile = None
+        loaded = other.load(str(path))
+        assert loaded == entries
+        steps = loaded['pipeline']['estimator_params']['steps']
+        assert steps[0]['estimator_params']['ngram_range'] == (1, 2)
+
+    def test_pickle_ignored(self, tmpdir, write_recipe):
+        import pickle
+        path = write_recipe(recipe)
+        cache = RecipeCache(str(tmpdir.join('cache')))
+        cache.load(str(path))
+        name, = os.listdir(cache.location)
+        with open(os.path.join(cache.location, name), 'wb') as f:
+            f.write(pickle.dumps({'version': 3, 'deps': [], 'entries': {}}))
+        other = RecipeCache(cache.location)
+        assert other.load(str(path))['pipeline']['label'] == 'example'
+
+    @pytest.mark.skipif(not hasattr(os, 'getuid'), reason='posix only')
+    def test_untrusted_directory(self, tmpdir, write_recipe):
+        path = write_recipe(recipe)
+        cache = RecipeCache(str(tmpdir.join('cache')))
+        cache.load(str(path))
+        assert os.stat(cache.location).st_mode & 0o777 == 0o700
+        os.chmod(cache.location, 0o777)
+        other = RecipeCache(cache.location)
+        other.compile = None
+        with pytest.raises(TypeError):
+            other.load(str(path))
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import pytest
+import pickle
+from tictacs import from_recipe
+from tictacs.parse import Conjurer, create_tac
+from tictacs.memo import MemoizedStep
+from tictacs.compile import compile_recipe, load_plan, plan_path
+from tictacs.__main__ import main
+
+pytest.importorskip('sklearn')
+
+recipe = """
+threshold: 0.5
+words:
+  label: words
+  estimator: CountVectorizer
+  estimator_pkg: sklearn.feature_extraction.text
+  estimator_params:
+    ngram_range: !tuple [1, 2]
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: union
+        estimator: FeatureUnion
+        estimator_pkg: sklearn.pipeline
+        estimator_params:
+          transformer_list:
+            - words
+            - label: chars
+              estimator: CountVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+              estimator_params:
+                analyzer: char
+      - label: svm
+        estimator: LinearSVC
+        estimator_pkg: sklearn.svm
+        estimator_params:
+          C: %s
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr']
+labels = [0, 1, 0, 1]
+
+
+def parse(filename):
+    parser = Conjurer(filename)
+    entries = parser.parse()
+    return create_tac(parser.class_type, entries)(**entries)
+
+
+class TestCompile(object):
+
+    """test compiled plans build the same tictac as parsing the recipe"""
+
+    def test_same_tictac(self, write_recipe):
+        path = write_recipe(recipe % 1)
+        assert compile_recipe(str(path)) == plan_path(str(path))
+        assert load_plan(str(path)) is not None
+        compiled, parsed = from_recipe(str(path)), parse(str(path))
+        # same base class, but the compiled one has the plan's constructor
+        assert type(compiled).__bases__ == type(parsed).__bases__
+        assert type(compiled).__init__ is not type(parsed).__init__
+        assert compiled.threshold == 0.5
+        assert repr(compiled.get_params()) == repr(parsed.get_params())
+        compiled.fit(texts, labels)
+        parsed.fit(texts, labels)
+        assert list(compiled.predict(texts)) == list(parsed.predict(texts))
+        copy = pickle.loads(pickle.dumps(compiled))
+        assert list(copy.predict(texts)) == list(parsed.predict(texts))
+
+    def test_memory(self, tmpdir, write_recipe):
+        path = write_recipe(recipe % 1)
+        compile_recipe(str(path))
+        tictac = from_recipe(str(path), memory=str(tmpdir.join('memo')))
+        assert all(isinstance(step, MemoizedStep) for _, step in tictac.steps)
+        assert tictac.fit(texts, labels).score(texts, labels) == 1.
+
+    def test_stale_plan(self, write_recipe):
+        path = write_recipe(recipe % 1)
+        compile_recipe(str(path))
+        path.write(recipe % 10)
+        assert load_plan(str(path)) is None
+        assert dict(from_recipe(str(path)).steps)['svm'].C == 10
+
+    def test_foreign_plan_not_run(self, tmpdir, write_recipe):
+        """test plans of other recipes are not executed"""
+        path = write_recipe(recipe % 1)
+        marker = tmpdir.join('ran')
+        tmpdir.join('recipe_plan.py').write(
+            'COMPILED_VERSION = 2\nRECIPE_DIGEST = "other"\n'
+            'open(%r, "w").close()\n' % str(marker))
+        assert load_plan(str(path)) is None
+        assert not marker.check()
+
+    def test_missing_keys(self, write_recipe):
+        path = write_recipe(recipe.replace(
+            '  estimator_pkg: sklearn.feature_extraction.text\n'
+            '  estimator_params:\n    ngram_range',
+            '  estimator_params:\n    ngram_range') % 1)
+        with pytest.raises(ValueError):
+            compile_recipe(str(path))
+        assert main(['compile', str(path)]) == 1
+
+    @pytest.mark.parametrize('key', ['my threshold', 'class'])
+    def test_invalid_root_key(self, write_recipe, key):
+        """test root keys that can't be arguments fail at compile time"""
+        path = write_recipe(recipe.replace('threshold:', '%r:' % key, 1) % 1)
+        with pytest.raises(ValueError, match='identifier'):
+            compile_recipe(str(path))
+
+    def test_cli(self, tmpdir, write_recipe):
+        path = write_recipe(recipe % 1)
+        output = str(tmpdir.join('out.py'))
+        assert main(['compile', str(path), '-o', output]) == 0
+        assert tmpdir.join('out.py').check()
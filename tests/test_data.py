@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from tictacs import from_recipe  # noqa: E402
+from tictacs.data import get_source, can_partial_fit  # noqa: E402
+from tictacs.data import takes_classes, fit_dataset  # noqa: E402
+from tictacs.data import Dataset, Source, partial_fit  # noqa: E402
+
+recipe = """
+data:
+  X: texts.txt
+  y:
+    source: csv
+    path: labels.csv
+    column: label
+    dtype: int
+  chunk_size: 3
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: vectorizer
+        estimator: %s
+        estimator_pkg: sklearn.feature_extraction.text
+      - label: classifier
+        estimator: SGDClassifier
+        estimator_pkg: sklearn.linear_model
+        estimator_params:
+          random_state: 0
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr',
+         'a dog runs', 'the cat sleeps', 'dogs bark loud', 'cats like milk']
+labels = [0, 1] * 4
+
+
+def write_data(tmpdir):
+    tmpdir.join('texts.txt').write('\n'.join(texts) + '\n')
+    tmpdir.join('labels.csv').write('id,label\n' + ''.join(
+        '%d,%d\n' % (i, label) for i, label in enumerate(labels)))
+
+
+class TestSources(object):
+
+    """test sources read their samples in chunks"""
+
+    def test_text_and_csv(self, tmpdir):
+        write_data(tmpdir)
+        source = get_source('texts.txt', str(tmpdir), chunk_size=3)
+        assert [len(chunk) for chunk in source.chunks()] == [3, 3, 2]
+        assert list(source) == texts
+        source = get_source({'path': 'labels.csv', 'column': 'label',
+                             'dtype': 'int'}, str(tmpdir))
+        assert list(source.read()) == labels
+
+    @pytest.mark.parametrize('compressed', [False, True])
+    def test_npz(self, tmpdir, compressed):
+        path = str(tmpdir.join('arrays.npz'))
+        a, b = np.arange(20.).reshape(10, 2), np.arange(5)
+        (np.savez_compressed if compressed else np.savez)(path, a=a, b=b)
+        source = get_source({'path': path, 'key': 'a', 'chunk_size': 4})
+        assert isinstance(source.array(), np.memmap) != compressed
+        assert [chunk.shape[0] for chunk in source.chunks()] == [4, 4, 2]
+        assert np.array_equal(source.read(), a)
+        with pytest.raises(ValueError):
+            get_source(path).array()
+
+    def test_npz_objects(self, tmpdir):
+        """test arrays of python objects are refused"""
+        path = str(tmpdir.join('objects.npz'))
+        np.savez(path, a=np.array(['a', 1], dtype=object))
+        with pytest.raises(ValueError, match='python objects'):
+            get_source(path).array()
+
+    def test_abstract(self):
+        with pytest.raises(TypeError):
+            Source('texts.txt')
+
+    def test_length_mismatch(self, tmpdir):
+        """test samples and targets have to end together"""
+        write_data(tmpdir)
+        tmpdir.join('short.txt').write('0\n1\n0\n1\n')
+        for X, y in (('texts.txt', 'short.txt'), ('short.txt', 'texts.txt')):
+            dataset = Dataset(get_source(X, str(tmpdir)),
+                              get_source(y, str(tmpdir)), chunk_size=3)
+            with pytest.raises(ValueError, match='numbers of samples'):
+                list(dataset.chunks())
+
+
+class TestFitData(object):
+
+    """test fitting on the data section of a recipe"""
+
+    def test_out_of_core(self, tmpdir, write_recipe):
+        """test a pipeline that can partial_fit is fitted in chunks"""
+        write_data(tmpdir)
+        path = write_recipe(recipe % 'HashingVectorizer')
+        tictac = from_recipe(str(path))
+        assert can_partial_fit(tictac)
+        classifier = tictac.steps[1][1]
+        tictac.fit_data(epochs=2)
+        # updated once for each sample of each epoch
+        assert classifier.t_ == 2 * len(texts) + 1
+        assert list(classifier.classes_) == [0, 1]
+        assert len(tictac.predict(texts)) == len(texts)
+
+    def test_in_memory(self, tmpdir, write_recipe):
+        """test other pipelines are fitted on all of the data"""
+        write_data(tmpdir)
+        path = write_recipe(recipe % 'CountVectorizer')
+        tictac = from_recipe(str(path))
+        assert not can_partial_fit(tictac)
+        tictac.fit_data()
+        assert len(tictac.steps[0][1].vocabulary_) > 0
+
+    def test_memoized(self, tmpdir, write_recipe):
+        """test updating a memoized tictac doesn't change the cached steps"""
+        from tictacs.memo import StepCache
+        write_data(tmpdir)
+        path = write_recipe(recipe % 'HashingVectorizer')
+        cache = StepCache()
+        first = from_recipe(str(path), memory=cache).fit(texts, labels)
+        second = from_recipe(str(path), memory=cache).fit(texts, labels)
+        coef = first.steps[1][1].coef_.copy()
+        partial_fit(second, texts, [1 - label for label in labels])
+        assert np.array_equal(first.steps[1][1].coef_, coef)
+        assert not np.array_equal(second.steps[1][1].coef_, coef)
+
+    def test_regressor_classes(self, tmpdir):
+        """test the targets of a regressor aren't scanned for classes"""
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import SGDClassifier, SGDRegressor
+        from sklearn.pipeline import make_pipeline
+
+        class Unscanned(Dataset):
+            def get_classes(self):
+                raise AssertionError('Targets scanned for classes')
+        write_data(tmpdir)
+        dataset = Unscanned(get_source('texts.txt', str(tmpdir)),
+                            get_source({'path': 'labels.csv',
+                                        'column': 'label',
+                                        'dtype': 'float'}, str(tmpdir)),
+                            chunk_size=3)
+        regressor = make_pipeline(HashingVectorizer(), SGDRegressor())
+        assert not takes_classes(regressor)
+        assert takes_classes(make_pipeline(HashingVectorizer(),
+                                           SGDClassifier()))
+        fit_dataset(regressor, dataset)
+        assert len(regressor.predict(texts)) == len(texts)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from tictacs import from_recipe  # noqa: E402
+from tictacs.evaluate import ConfusionCounts, ErrorSums  # noqa: E402
+from tictacs.evaluate import evaluate  # noqa: E402
+
+recipe = """
+evaluation:
+  method: kfold
+  folds: 3
+  metrics: [accuracy, f1_macro]
+  chunk_size: 2
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: count
+        estimator: CountVectorizer
+        estimator_pkg: sklearn.feature_extraction.text
+      - label: svm
+        estimator: LinearSVC
+        estimator_pkg: sklearn.svm
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr',
+         'a dog runs', 'the cat sleeps', 'dogs bark loud', 'cats like milk',
+         'dog food', 'cat food', 'the big dog', 'a small cat']
+labels = [0, 1] * 6
+
+
+class TestCounts(object):
+
+    def test_classification(self):
+        from sklearn import metrics
+        rng = np.random.RandomState(0)
+        y_true = rng.choice(['a', 'b', 'c'], 100)
+        y_pred = rng.choice(['a', 'b', 'c', 'd'], 100)
+        counts = ConfusionCounts(['a', 'b', 'c', 'd'])
+        for start in range(0, 100, 30):
+            counts.update(y_true[start:start + 30], y_pred[start:start + 30])
+        values = counts.metrics(['accuracy', 'f1_macro', 'recall_weighted'])
+        assert np.isclose(values['accuracy'],
+                          metrics.accuracy_score(y_true, y_pred))
+        assert np.isclose(values['f1_macro'],
+                          metrics.f1_score(y_true, y_pred, average='macro'))
+        assert np.isclose(values['recall_weighted'],
+                          metrics.recall_score(y_true, y_pred,
+                                               average='weighted'))
+        with pytest.raises(ValueError):
+            counts.update(['a'], ['e'])
+
+    def test_regression(self):
+        from sklearn import metrics
+        rng = np.random.RandomState(0)
+        y_true, y_pred = rng.rand(50), rng.rand(50)
+        sums = ErrorSums()
+        sums.update(y_true[:20], y_pred[:20])
+        other = ErrorSums()
+        other.update(y_true[20:], y_pred[20:])
+        values = sums.merge(other).metrics(['mse', 'r2'])
+        assert np.isclose(values['mse'],
+                          metrics.mean_squared_error(y_true, y_pred))
+        assert np.isclose(values['r2'], metrics.r2_score(y_true, y_pred))
+
+
+class TestEvaluate(object):
+
+    @pytest.mark.parametrize('n_jobs', [1, 2, -1])
+    def test_kfold(self, write_recipe, n_jobs):
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path))
+        result = tictac.evaluate(texts, labels, n_jobs=n_jobs)
+        assert len(result['folds']) == 3
+        assert all(fold['error'] is None for fold in result['folds'])
+        assert sum(fold['n_test'] for fold in result['folds']) == len(texts)
+        assert set(result['metrics']) == set(['accuracy', 'f1_macro'])
+        assert 0. <= result['pooled']['accuracy'] <= 1.
+
+    def test_holdout(self, write_recipe):
+        path = write_recipe(recipe)
+        result = evaluate(str(path), texts, labels,
+                          evaluation={'method': 'holdout',
+                                      'test_size': 0.5})
+        assert len(result['folds']) == 1
+        assert result['folds'][0]['n_test'] == 6
+
+    def test_cached_upstream(self, tmpdir, write_recipe):
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path))
+        memory = str(tmpdir.join('memory'))
+        tictac.evaluate(texts, labels, memory=memory)
+        tictac.set_params(svm__C=10.)
+        from tictacs.memo import StepCache
+        cache = StepCache(memory)
+        files = len(cache._files())
+        tictac.evaluate(texts, labels, memory=cache)
+        # the count vectorizer of each fold was found, only svm refitted
+        assert cache.hits >= 3
+        assert len(cache._files()) > files
+
+    def test_unknown(self, write_recipe):
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path))
+        with pytest.raises(ValueError):
+            tictac.evaluate(texts, labels, metrics=['r2'])
+        with pytest.raises(ValueError):
+            tictac.evaluate(texts, labels, method='bootstrap')
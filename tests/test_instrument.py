@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import json
+import pytest
+import tracemalloc
+from tictacs import from_recipe
+from tictacs.instrument import Profile
+
+pytest.importorskip('sklearn')
+
+recipe = """
+%s
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: union
+        estimator: FeatureUnion
+        estimator_pkg: sklearn.pipeline
+        estimator_params:
+          transformer_list:
+            - label: count words
+              estimator: CountVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+            - label: count chars
+              estimator: CountVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+              estimator_params:
+                analyzer: char
+      - label: svm
+        estimator: LinearSVC
+        estimator_pkg: sklearn.svm
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr']
+labels = [0, 1, 0, 1]
+
+
+@pytest.fixture(autouse=True)
+def stop_tracing():
+    """stop the tracemalloc the tests start so it doesn't slow down others"""
+    tracing = tracemalloc.is_tracing()
+    yield
+    if not tracing:
+        tracemalloc.stop()
+
+
+class TestInstrument(object):
+
+    """test every node records its calls"""
+
+    def test_nested(self, write_recipe):
+        """test nested transformers show up in the report"""
+        path = write_recipe(recipe % '')
+        tictac = from_recipe(str(path), instrument=True)
+        tictac.fit(texts, labels)
+        tictac.predict(texts)
+        report = json.loads(tictac.profile.to_json())
+        # the tictac itself records the whole predict
+        assert report['example']['methods']['predict']['calls'] == 1
+        assert report['example']['methods']['fit']['rows_in'] == 4
+        example = report['example']['children']
+        assert example['svm']['methods']['predict']['calls'] == 1
+        assert example['svm']['methods']['predict']['rows_in'] == 4
+        union = example['union']
+        assert union['methods']['fit_transform']['rows_out'] == 4
+        assert set(union['children']) == set(['count words', 'count chars'])
+        folded = tictac.profile.to_folded().split('\n')
+        assert any(line.startswith('example;union;count chars ')
+                   for line in folded)
+
+    def test_recipe_switch(self, write_recipe, caplog):
+        """test instrument: true in the recipe turns it on"""
+        path = write_recipe(recipe % 'instrument: true')
+        tictac = from_recipe(str(path))
+        assert 'interpreted as data' not in caplog.text
+        assert isinstance(tictac.profile, Profile)
+        tictac.fit(texts, labels)
+        assert ('example', 'svm') in tictac.profile.stats
+
+    def test_alloc(self, write_recipe):
+        """test instrument: true records the bytes each call allocates"""
+        path = write_recipe(recipe % 'instrument: true')
+        tictac = from_recipe(str(path))
+        tictac.fit(texts, labels)
+        union = tictac.profile.report()['example']['children']['union']
+        assert union['methods']['fit_transform']['alloc'] is not None
+        tracemalloc.stop()
+        timings = from_recipe(str(path), instrument=Profile())
+        timings.fit(texts, labels)
+        assert all(entry['alloc'] is None
+                   for methods in timings.profile.stats.values()
+                   for entry in methods.values())
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from tictacs.memo import StepCache, digest
+
+recipe = """
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: union
+        estimator: FeatureUnion
+        estimator_pkg: sklearn.pipeline
+        estimator_params:
+          transformer_list:
+            - label: count words
+              estimator: CountVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+            - label: count chars
+              estimator: TfidfVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+              estimator_params:
+                analyzer: char
+      - label: classifier
+        estimator: %s
+        estimator_pkg: %s
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr']
+labels = [0, 1, 0, 1]
+
+
+class TestStepCache(object):
+
+    """test digests and the two levels of the cache"""
+
+    def test_digest(self):
+        """test digests depend on content and not identity"""
+        assert digest(['a', 'bc']) == digest(['a', 'bc'])
+        assert digest(['a', 'bc']) != digest(['ab', 'c'])
+        assert digest([1, 2]) != digest((1, 2))
+
+    def test_disk(self, tmpdir):
+        """test entries are shared through the directory"""
+        location = str(tmpdir.join('steps'))
+        StepCache(location).set('key', [1, 2, 3])
+        cache = StepCache(location)
+        assert cache.get('key') == [1, 2, 3]
+        assert cache.get('other') is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_no_copies(self):
+        """test lookups in memory return the stored entry itself"""
+        cache = StepCache()
+        value = [1, 2, 3]
+        cache.set('key', value)
+        assert cache.get('key') is value and cache.get('key') is value
+
+    def test_eviction(self, tmpdir):
+        """test the directory is kept under max_bytes"""
+        location = str(tmpdir.join('steps'))
+        cache = StepCache(location, max_bytes=2000, memory_bytes=0)
+        for i in range(10):
+            cache.set('key%d' % i, 'x' * 500)
+        assert sum(os.path.getsize(os.path.join(location, name))
+                   for name in os.listdir(location)) <= 2000
+        assert cache.get('key9') is not None
+        assert cache.get('key0') is None
+
+
+class TestMemoizedRecipes(object):
+
+    """test steps shared between recipes are only fitted once"""
+
+    def test_shared_prefix(self, tmpdir, write_recipe):
+        """test the union is fitted once for two different classifiers"""
+        pytest.importorskip('sklearn')
+        from tictacs import from_recipe
+        svm = write_recipe(recipe % ('LinearSVC', 'sklearn.svm'), 'svm.yaml')
+        lr = write_recipe(recipe % ('LogisticRegression',
+                                    'sklearn.linear_model'), 'lr.yaml')
+        cache = StepCache(str(tmpdir.join('steps')))
+        first = from_recipe(str(svm), memory=cache)
+        first.fit(texts, labels)
+        hits = cache.hits
+        second = from_recipe(str(lr), memory=cache)
+        second.fit(texts, labels)
+        # fitted union and its output were both found
+        assert cache.hits == hits + 2
+        assert list(second.predict(texts)) == list(first.predict(texts))
+
+    def test_set_params(self, write_recipe):
+        """test changing parameters changes the key"""
+        pytest.importorskip('sklearn')
+        from tictacs import from_recipe
+        path = write_recipe(recipe % ('LinearSVC', 'sklearn.svm'))
+        tictac = from_recipe(str(path), memory=StepCache())
+        tictac.fit(texts, labels)
+        width = tictac.named_steps['union'].transform(texts).shape[1]
+        tictac.set_params(**{'union__count words__max_features': 1})
+        tictac.fit(texts, labels)
+        assert tictac.named_steps['union'].transform(texts).shape[1] < width
+
+    def test_unpicklable_step(self):
+        """test steps around local functions are memoized too"""
+        pytest.importorskip('sklearn')
+        from sklearn.pipeline import Pipeline
+        from sklearn.svm import LinearSVC
+        from sklearn.feature_extraction.text import CountVectorizer
+        from tictacs.memo import memoize, MemoizedStep
+        from tictacs.wrappers import FunctionWrapper
+        pipeline = Pipeline([('lower', FunctionWrapper(
+                                 lambda X: [x.lower() for x in X])),
+                             ('count', CountVectorizer()),
+                             ('svm', LinearSVC())])
+        cache = StepCache()
+        memoize(pipeline, cache)
+        assert all(isinstance(step, MemoizedStep)
+                   for _, step in pipeline.steps)
+        pipeline.fit(texts, labels)
+        hits = cache.hits
+        pipeline.fit(texts, labels)
+        assert cache.hits > hits
+        assert list(pipeline.predict(texts)) == labels
+
+    def test_slim_detaches(self, write_recipe):
+        """test slimming a tictac doesn't change the fitted steps cached"""
+        np = pytest.importorskip('numpy')
+        pytest.importorskip('sklearn')
+        from tictacs import from_recipe
+        from tictacs.slim import slim
+        path = write_recipe(recipe % ('LinearSVC', 'sklearn.svm'))
+        cache = StepCache()
+        first = from_recipe(str(path), memory=cache).fit(texts, labels)
+        second = from_recipe(str(path), memory=cache).fit(texts, labels)
+        coef = second.named_steps['classifier'].coef_
+        assert first.named_steps['classifier'].coef_ is coef
+        slim(first, downcast=True)
+        assert first.named_steps['classifier'].coef_.dtype == np.float32
+        assert second.named_steps['classifier'].coef_ is coef
+        assert coef.dtype == np.float64
+        assert list(first.predict(texts)) == list(second.predict(texts))
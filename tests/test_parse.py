@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+import pytest
+from tictacs import from_recipe
+
+pytest.importorskip('sklearn')
+
+recipe = """
+unused:
+  label: unused
+  estimator: Missing
+  estimator_pkg: tictacs_missing_package
+svm_def:
+  label: svm
+  estimator: LinearSVC
+  estimator_pkg: sklearn.svm
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: count
+        estimator: CountVectorizer
+        estimator_pkg: sklearn.feature_extraction.text
+      - svm
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr']
+labels = [0, 1, 0, 1]
+
+
+class TestLazy(object):
+
+    """test lazy tictacs are only built when used"""
+
+    def test_unused_not_imported(self, write_recipe):
+        """test labels the pipeline doesn't use are never imported"""
+        path = write_recipe(recipe)
+        with pytest.raises(ImportError):
+            from_recipe(str(path))
+        tictac = from_recipe(str(path), lazy=True)
+        assert not tictac.built
+        tictac.fit(texts, labels)
+        assert tictac.built
+        assert 'unused' not in tictac.timings
+        assert set(tictac.timings) == set(['count', 'svm', 'example'])
+        assert len(tictac.predict(texts)) == len(texts)
+
+    def test_get_params_builds(self, write_recipe):
+        """test get_params triggers the build"""
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path), lazy=True)
+        assert 'svm' in tictac.get_params()
+
+
+shared = """
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: count
+        estimator: CountVectorizer
+        estimator_pkg: sklearn.feature_extraction.text
+      - label: classifier
+        estimator: %s
+        estimator_pkg: %s
+"""
+
+
+class TestFromRecipes(object):
+
+    """test identical steps of different recipes are merged"""
+
+    def test_shared_steps(self, tmpdir):
+        """test the common vectorizer is one instance fitted once"""
+        from tictacs import from_recipes
+        paths = []
+        for name, pkg in [('LinearSVC', 'sklearn.svm'),
+                          ('LogisticRegression', 'sklearn.linear_model'),
+                          ('LinearSVC', 'sklearn.svm')]:
+            path = tmpdir.join('%d.yaml' % len(paths))
+            path.write(shared % (name, pkg))
+            paths.append(str(path))
+        group = from_recipes(paths)
+        assert len(group) == 3
+        # one vectorizer and two distinct classifiers
+        assert len(group.nodes()) == 3
+        first, second, third = [group[path] for path in paths]
+        assert first.steps[0][1] is second.steps[0][1]
+        assert first.steps[1][1] is third.steps[1][1]
+        group.fit(texts, labels)
+        predictions = group.predict(texts)
+        assert list(predictions) == paths
+        assert list(predictions[paths[1]]) == list(second.predict(texts))
+
+    def test_fit_member(self, tmpdir):
+        """test fitting one tictac on its own leaves the others as they are"""
+        from tictacs import from_recipes
+        paths = []
+        for name, pkg in [('LinearSVC', 'sklearn.svm'),
+                          ('LogisticRegression', 'sklearn.linear_model')]:
+            path = tmpdir.join('%d.yaml' % len(paths))
+            path.write(shared % (name, pkg))
+            paths.append(str(path))
+        group = from_recipes(paths, memory=str(tmpdir.join('memo')),
+                             lazy=True)
+        group.fit(texts, labels)
+        first, second = [group[path] for path in paths]
+        vocabulary = dict(second.steps[0][1].vocabulary_)
+        first.fit(['other words entirely', 'and more'], [0, 1])
+        assert first.steps[0][1] is not second.steps[0][1]
+        assert second.steps[0][1].vocabulary_ == vocabulary
+        assert list(group.predict(texts)[paths[1]]) == \
+            list(second.predict(texts))
+
+
+class TestStream(object):
+
+    """test chunked prediction gives the same results in the same order"""
+
+    @pytest.mark.parametrize('n_jobs,backend', [(1, 'thread'),
+                                                (3, 'thread'),
+                                                (2, 'process'),
+                                                (-1, 'thread'),
+                                                (None, 'thread')])
+    def test_predict_stream(self, write_recipe, n_jobs, backend):
+        path = write_recipe(shared % ('LinearSVC', 'sklearn.svm'))
+        tictac = from_recipe(str(path))
+        tictac.fit(texts, labels)
+        stream = (text for text in texts * 5)
+        chunks = list(tictac.predict_stream(stream, chunk_size=3,
+                                            n_jobs=n_jobs, backend=backend))
+        assert [len(chunk) for chunk in chunks] == [3] * 6 + [2]
+        assert [p for chunk in chunks for p in chunk] == \
+            list(tictac.predict(texts * 5))
+
+
+class TestTictacClasses(object):
+
+    """test tictac classes are created once per shape of recipe"""
+
+    def test_reused(self, write_recipe):
+        from sklearn.base import clone
+        path = write_recipe(shared % ('LinearSVC', 'sklearn.svm'))
+        first, second = from_recipe(str(path)), from_recipe(str(path))
+        assert first.__class__ is second.__class__
+        assert first.steps[0][1] is not second.steps[0][1]
+        cloned = clone(first)
+        assert cloned.__class__ is first.__class__
+        assert cloned.get_params(deep=False).keys() == \
+            first.get_params(deep=False).keys()
+        cloned.fit(texts, labels)
+        assert len(cloned.predict(texts)) == len(texts)
+
+
+library = """
+features:
+  label: count
+  estimator: CountVectorizer
+  estimator_pkg: sklearn.feature_extraction.text
+svm_def:
+  label: svm
+  estimator: LinearSVC
+  estimator_pkg: sklearn.svm
+  estimator_params:
+    C: 1
+"""
+
+composed = """
+include: lib/library.yaml
+svm_def:
+  estimator_params:
+    C: 10
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - %s
+      - svm
+"""
+
+count = """
+        label: count
+        estimator: %s
+        estimator_pkg: sklearn.feature_extraction.text"""
+
+
+class TestIncludes(object):
+
+    """test recipes include fragments and labels are defined once"""
+
+    def write(self, tmpdir, step='count'):
+        tmpdir.mkdir('lib').join('library.yaml').write(library)
+        path = tmpdir.join('recipe.yaml')
+        path.write(composed % step)
+        return str(path)
+
+    @pytest.mark.parametrize('lazy', [False, True])
+    def test_override(self, tmpdir, lazy):
+        tictac = from_recipe(self.write(tmpdir), lazy=lazy)
+        assert tictac.get_params()['svm__C'] == 10
+        assert 'include' not in tictac.get_params(deep=False)
+        tictac.fit(texts, labels)
+        assert len(tictac.predict(texts)) == len(texts)
+
+    @pytest.mark.parametrize('lazy', [False, True])
+    def test_same_definition(self, tmpdir, lazy):
+        path = self.write(tmpdir, count % 'CountVectorizer')
+        tictac = from_recipe(path, lazy=lazy)
+        assert tictac.steps[0][0] == 'count'
+        tictac.fit(texts, labels)
+
+    @pytest.mark.parametrize('lazy', [False, True])
+    def test_redefinition(self, tmpdir, lazy):
+        from tictacs.parse import RedefinitionError
+        path = self.write(tmpdir, count % 'TfidfVectorizer')
+        with pytest.raises(RedefinitionError):
+            # lazy tictacs are built when they are first used
+            from_recipe(path, lazy=lazy).get_params()
+
+
+class TestCreateTac(object):
+
+    """test classes with other constructors are not shared"""
+
+    def test_init_in_key(self):
+        from sklearn.pipeline import Pipeline
+        from tictacs.parse import create_tac
+
+        def init(self, steps):
+            self.steps = steps
+        params = {'steps': None}
+        generated = create_tac(Pipeline, params)
+        compiled = create_tac(Pipeline, params, init=init)
+        assert generated is not compiled
+        assert compiled.__init__ is init
+        assert create_tac(Pipeline, params) is generated
+        assert create_tac(Pipeline, params, init=init) is compiled
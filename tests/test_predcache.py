@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import sys
+import subprocess
+import pytest
+from tictacs import from_recipe
+from tictacs.predcache import PredictionCache, get_cache
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+recipe = """
+predict_cache:
+  max_entries: 100
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: words
+        estimator: CountVectorizer
+        estimator_pkg: sklearn.feature_extraction.text
+      - label: classifier
+        estimator: LogisticRegression
+        estimator_pkg: sklearn.linear_model
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr']
+labels = [0, 1, 0, 1]
+
+
+def counted(tictac):
+    """ Count the samples the classifier of a tictac is asked about """
+    classifier = tictac.named_steps['classifier']
+    calls = []
+    predict = classifier.predict_proba
+    classifier.predict_proba = lambda X: calls.append(X.shape[0]) or \
+        predict(X)
+    return calls
+
+
+class TestPredictionCache(object):
+
+    def test_lru(self):
+        cache = PredictionCache(max_entries=2)
+        cache.put([b'a', b'b'], [1, 2])
+        assert cache.get([b'a']) == [1]
+        cache.put([b'c'], [3])
+        assert len(cache) == 2 and cache.evictions == 1
+        assert cache.get([b'a', b'c']) == [1, 3]
+        assert cache.stats()['hits'] == 3
+
+    def test_bytes(self):
+        cache = PredictionCache(max_bytes=1000)
+        cache.put([b'a', b'b'], [np.zeros(50), np.zeros(50)])
+        assert len(cache) == 1 and cache.nbytes <= 1000
+
+    def test_same_type(self):
+        """test results are arrays whether they were cached or not"""
+        cache = PredictionCache()
+
+        def method(X):
+            return [len(x) for x in X]
+        missed = cache.call(method, 'predict', 'model', ['a', 'bb'])
+        partial = cache.call(method, 'predict', 'model', ['a', 'ccc'])
+        hit = cache.call(method, 'predict', 'model', ['a', 'bb'])
+        for result in (missed, partial, hit):
+            assert isinstance(result, np.ndarray)
+        assert list(partial) == [1, 3] and list(hit) == [1, 2]
+
+    def test_no_numpy_import(self):
+        """test importing tictacs doesn't need numpy"""
+        code = 'import sys, tictacs; print("numpy" in sys.modules)'
+        output = subprocess.check_output([sys.executable, '-c', code])
+        assert output.strip() == b'False'
+
+    def test_keys_by_type(self):
+        """test rows of different types don't share keys"""
+        from tictacs.predcache import row_key
+        rows = ['bX', b'X', b'bytes\0X', 'pickle\0', (1,),
+                np.array([1.]), np.array([1], dtype=np.int64)]
+        keys = [row_key(row) for row in rows]
+        assert len(set(keys)) == len(keys)
+        assert row_key('bX') == row_key('bX')
+
+    def test_ttl(self):
+        cache = PredictionCache(ttl=-1)
+        cache.put([b'a'], [1])
+        assert cache.get([b'a']) != [1] and len(cache) == 0
+
+
+class TestTictacCache(object):
+
+    def test_only_misses(self, write_recipe):
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path)).fit(texts, labels)
+        calls = counted(tictac)
+        expected = tictac.predict_proba(texts)
+        batch = [texts[2], 'a new dog', texts[0], 'a new dog']
+        result = tictac.predict_proba(batch)
+        assert calls == [4, 1]
+        assert np.allclose(result[0], expected[2])
+        assert np.allclose(result[1], result[3])
+        assert np.allclose(result[2], expected[0])
+        stats = get_cache(tictac).stats()
+        assert stats['hits'] == 2 and stats['misses'] == 6
+
+    def test_generator(self, write_recipe):
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path)).fit(texts, labels)
+        expected = tictac.predict(texts)
+        result = tictac.predict(text for text in texts)
+        assert list(result) == list(expected)
+
+    def test_refit(self, write_recipe):
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path)).fit(texts, labels)
+        before = tictac.predict(texts)
+        tictac.fit(texts, [1 - label for label in labels])
+        assert list(tictac.predict(texts)) == list(1 - before)
+
+    def test_nested_change(self, write_recipe):
+        from tictacs.predcache import invalidate
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path)).fit(texts, labels)
+        before = tictac.predict(texts)
+        tictac.named_steps['classifier'].fit(
+            tictac.named_steps['words'].transform(texts),
+            [1 - label for label in labels])
+        # the cache can't tell the step changed until it is told
+        assert list(tictac.predict(texts)) == list(before)
+        invalidate(tictac)
+        assert list(tictac.predict(texts)) == list(1 - before)
+
+    def test_disabled(self, write_recipe):
+        path = write_recipe(recipe.replace('predict_cache', 'unused'))
+        tictac = from_recipe(str(path)).fit(texts, labels)
+        assert get_cache(tictac) is None
+        assert len(tictac.predict(texts)) == len(texts)
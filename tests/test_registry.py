@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+import time
+import pytest
+import threading
+
+pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from tictacs import from_recipe  # noqa: E402
+from tictacs.registry import Registry, share_nodes  # noqa: E402
+
+recipe = """
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: count
+        estimator: CountVectorizer
+        estimator_pkg: sklearn.feature_extraction.text
+      - label: svm
+        estimator: LinearSVC
+        estimator_pkg: sklearn.svm
+        estimator_params:
+          C: %s
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr']
+labels = [0, 1, 0, 1]
+
+
+@pytest.fixture
+def save(tmpdir, write_recipe):
+    """ Save a tictac fitted from the recipe with the C given """
+    def save(name, C):
+        path = write_recipe(recipe % C, '%s.yaml' % name)
+        directory = str(tmpdir.join(name))
+        from_recipe(str(path)).fit(texts, labels).save(directory)
+        return directory
+    return save
+
+
+class TestRegistry(object):
+
+    def test_share(self, save):
+        registry = Registry()
+        registry.register('a', save('a', 1))
+        registry.register('b', save('b', 10))
+        a, b = registry.get('a'), registry.get('b')
+        assert a.steps[0][1] is b.steps[0][1]
+        assert a.steps[1][1] is not b.steps[1][1]
+        assert list(b.predict(texts)) == labels
+        assert registry.get('a') is a
+        assert registry.stats()['hits'] == 1
+
+    def test_unfitted_not_shared(self, write_recipe):
+        path = write_recipe(recipe % 1)
+        a, b = from_recipe(str(path)), from_recipe(str(path))
+        assert share_nodes(a) == [] and share_nodes(b) == []
+        assert a.steps[0][1] is not b.steps[0][1]
+
+    def test_evict(self, save):
+        registry = Registry(max_bytes=1)
+        for name in ('a', 'b', 'c'):
+            registry.register(name, save(name, 1))
+        registry.get('a')
+        registry.get('b')
+        assert registry.loaded() == ['b']
+        registry.get('c')
+        assert registry.loaded() == ['c']
+        assert registry.stats()['evictions'] == 2
+
+    def test_single_load(self, tmpdir, save):
+        loads = []
+        directory = save('a', 1)
+
+        def loader(source):
+            loads.append(source)
+            time.sleep(.1)
+            return from_recipe(str(tmpdir.join('a.yaml')))
+        registry = Registry(loader=loader)
+        registry.register('a', directory)
+        models = []
+        threads = [threading.Thread(target=lambda: models.append(
+            registry.get('a'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(loads) == 1
+        assert len(models) == 8 and all(m is models[0] for m in models)
+
+    def test_failed_load(self, tmpdir):
+        registry = Registry()
+        registry.register('missing', str(tmpdir.join('missing')))
+        with pytest.raises(ValueError):
+            registry.get('missing')
+        assert registry.loaded() == []
+
+    def test_unregistered(self, save):
+        """test names that were never registered are not loaded"""
+        registry = Registry()
+        with pytest.raises(KeyError):
+            registry.get(save('a', 1))
+        registry.register('a', save('a', 1))
+        registry.unregister('a')
+        with pytest.raises(KeyError):
+            registry.get('a')
+        assert registry.stats()['loads'] == 0
+
+    def test_shared_counted_once(self, save):
+        """test shared nodes count while any model that uses them is
+           loaded, whichever model loaded them first"""
+        alone = Registry()
+        alone.register('b', save('b', 10))
+        alone.get('b')
+        registry = Registry()
+        registry.register('a', save('a', 1))
+        registry.register('b', save('b', 10))
+        registry.get('a')
+        registry.get('b')
+        # the vectorizer they share and their classifiers
+        assert registry.stats()['shared_nodes'] == 3
+        registry.unregister('a')
+        assert registry.nbytes == alone.nbytes
+        assert registry.stats()['shared_nodes'] == 2
+        registry.unregister('b')
+        assert registry.nbytes == 0
+
+    def test_recipe(self, tmpdir, write_recipe):
+        tmpdir.join('texts.txt').write('\n'.join(texts) + '\n')
+        tmpdir.join('labels.txt').write('\n'.join(map(str, labels)) + '\n')
+        fitted = write_recipe('data: {X: %s, y: %s}\n'
+                              % (tmpdir.join('texts.txt'),
+                                 tmpdir.join('labels.txt'))
+                              + recipe % 1, 'fitted.yaml')
+        unfitted = write_recipe(recipe % 1, 'unfitted.yaml')
+        registry = Registry()
+        registry.register('fitted', str(fitted))
+        registry.register('unfitted', str(unfitted))
+        assert len(registry.get('fitted').predict(texts)) == len(texts)
+        with pytest.raises(ValueError):
+            registry.get('unfitted')
+
+
+class TestDigest(object):
+
+    def test_mapped(self, tmpdir):
+        """test saved arrays are compared by content without reading them"""
+        np = pytest.importorskip('numpy')
+        from tictacs.store import save, load
+        from tictacs.registry import node_digest, _mapped
+        coef = np.arange(100000.)
+        for name in ('a', 'b'):
+            save({'coef_': coef}, str(tmpdir.join(name)))
+        first = load(str(tmpdir.join('a')))['coef_']
+        second = load(str(tmpdir.join('b')))['coef_']
+        assert first.filename != second.filename
+        assert _mapped(first) == _mapped(second)
+        assert _mapped(first[10:])[2] == _mapped(first)[2] + 80
+        assert _mapped(np.arange(3)) is None
+        # the same content in different files
+        assert node_digest({'coef_': first}) == node_digest({'coef_': second})
+        assert node_digest({'coef_': first}) != \
+            node_digest({'coef_': first[1:]})
+        save({'coef_': coef + 1}, str(tmpdir.join('c')))
+        other = load(str(tmpdir.join('c')))['coef_']
+        assert node_digest({'coef_': first}) != node_digest({'coef_': other})
+        # arrays mapped without a stored digest are read
+        path = str(tmpdir.join('plain.npy'))
+        np.save(path, coef)
+        plain = np.load(path, mmap_mode='r')
+        assert _mapped(plain) is None
+        assert node_digest({'coef_': plain}) == \
+            node_digest({'coef_': np.load(path, mmap_mode='r')})
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import pytest
+from tictacs import from_recipe
+from tictacs.reload import Watcher
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+recipe = """
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: union
+        estimator: FeatureUnion
+        estimator_pkg: sklearn.pipeline
+        estimator_params:
+          transformer_list:
+            - label: words
+              estimator: CountVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+            - label: chars
+              estimator: CountVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+              estimator_params:
+                analyzer: char
+                binary: %s
+      - label: tfidf
+        estimator: TfidfTransformer
+        estimator_pkg: sklearn.feature_extraction.text
+      - label: svm
+        estimator: LinearSVC
+        estimator_pkg: sklearn.svm
+        estimator_params:
+          C: %s
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr']
+labels = [0, 1, 0, 1]
+
+
+def steps(tictac):
+    return dict(tictac.steps)
+
+
+class TestReload(object):
+
+    """test reloading keeps the nodes that didn't change fitted"""
+
+    def test_downstream_change(self, write_recipe):
+        """test changing the last step keeps the ones before it"""
+        path = write_recipe(recipe % ('false', 1))
+        tictac = from_recipe(str(path))
+        tictac.fit(texts, labels)
+        before = steps(tictac)
+        path.write(recipe % ('false', 10))
+        report = tictac.reload(X=texts, y=labels)
+        assert report['rebuilt'] == [('svm',)]
+        after = steps(tictac)
+        assert after['union'] is before['union']
+        assert after['tfidf'] is before['tfidf']
+        assert after['svm'] is not before['svm']
+        assert after['svm'].C == 10
+        assert len(tictac.predict(texts)) == len(texts)
+
+    def test_branch_change(self, write_recipe):
+        """test changing a branch keeps the other branch and rebuilds the
+           steps after the union"""
+        path = write_recipe(recipe % ('false', 1))
+        tictac = from_recipe(str(path))
+        tictac.fit(texts, labels)
+        words = dict(steps(tictac)['union'].transformer_list)['words']
+        path.write(recipe % ('true', 1))
+        report = tictac.reload(X=texts, y=labels)
+        assert ('union', 'words') in report['kept']
+        assert set(report['rebuilt']) == set([('union', 'chars'),
+                                              ('tfidf',), ('svm',)])
+        union = dict(steps(tictac)['union'].transformer_list)
+        assert union['words'] is words
+        assert union['chars'].binary is True
+        expected = from_recipe(str(path)).fit(texts, labels)
+        assert np.allclose(tictac.decision_function(texts),
+                           expected.decision_function(texts), atol=1e-4)
+
+    def test_watcher(self, write_recipe):
+        path = write_recipe(recipe % ('false', 1))
+        tictac = from_recipe(str(path))
+        tictac.fit(texts, labels)
+        watcher = Watcher(tictac, X=texts, y=labels)
+        assert watcher.check() is None
+        path.write(recipe % ('false', 100) + '\n')
+        assert watcher.check()['rebuilt'] == [('svm',)]
+        assert steps(tictac)['svm'].C == 100
+
+    def test_unfitted_change(self, write_recipe):
+        """test changed nodes of a fitted tictac are only reloaded with data
+           to fit them on"""
+        path = write_recipe(recipe % ('false', 1))
+        tictac = from_recipe(str(path))
+        path.write(recipe % ('false', 10))
+        assert tictac.reload()['rebuilt'] == [('svm',)]
+        tictac.fit(texts, labels)
+        svm = steps(tictac)['svm']
+        path.write(recipe % ('false', 100))
+        with pytest.raises(ValueError, match='svm'):
+            tictac.reload()
+        assert steps(tictac)['svm'] is svm
+        assert len(tictac.predict(texts)) == len(texts)
+
+    def test_swap(self, write_recipe):
+        """test the tictac keeps its class and gets its attributes at once"""
+        path = write_recipe(recipe % ('false', 1))
+        tictac = from_recipe(str(path))
+        tictac.fit(texts, labels)
+        cls, attributes = type(tictac), tictac.__dict__
+        path.write(recipe % ('false', 10))
+        tictac.reload(X=texts, y=labels)
+        assert type(tictac) is cls
+        assert tictac.__dict__ is not attributes
+        # a new root estimator
+        path.write('pipeline:\n  label: example\n  estimator: LinearSVC\n'
+                   '  estimator_pkg: sklearn.svm\n')
+        with pytest.raises(ValueError, match='from_recipe'):
+            tictac.reload(X=texts, y=labels)
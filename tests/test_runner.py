@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+np = pytest.importorskip('numpy')
+
+recipe = """
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: count
+        estimator: CountVectorizer
+        estimator_pkg: sklearn.feature_extraction.text
+      - label: classifier
+        estimator: %s
+        estimator_pkg: %s
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr',
+         'a blue dog', 'green cats', 'dogs bark', 'the cat purrs']
+labels = [0, 1, 0, 1, 0, 1, 0, 1]
+
+
+def slow_evaluate(recipe):
+    """ Stand in for runner.evaluate that takes a while """
+    import time
+    time.sleep(.5)
+    return {'recipe': recipe, 'error': None}
+
+
+class TestSharedData(object):
+
+    """test data survives being written and mapped back"""
+
+    def test_roundtrip(self):
+        from tictacs.runner import SharedData
+        shared = SharedData(X=['ünïcode', '', 'text'], y=np.arange(3))
+        try:
+            X = shared.load('X')
+            assert list(X) == ['ünïcode', '', 'text']
+            # text is decoded on access instead of copied into each worker
+            assert isinstance(X.text, np.memmap)
+            assert X[-1] == 'text' and X[1:] == ['', 'text']
+            assert X[np.array([2, 0])] == ['text', 'ünïcode']
+            assert list(shared.load('y')) == [0, 1, 2]
+            assert shared.load('missing') is None
+        finally:
+            shared.cleanup()
+
+    @pytest.mark.parametrize('fmt', ['coo', 'dok', 'lil', 'csc'])
+    def test_sparse(self, fmt):
+        sp = pytest.importorskip('scipy.sparse')
+        from tictacs.runner import SharedData
+        X = sp.random(5, 4, density=.5, format=fmt, random_state=0)
+        shared = SharedData(X=X)
+        try:
+            assert (shared.load('X') != X).nnz == 0
+        finally:
+            shared.cleanup()
+
+
+class TestRun(object):
+
+    """test recipes are evaluated and failures are reported"""
+
+    @pytest.mark.parametrize('n_jobs', [2, -1, None])
+    def test_run(self, tmpdir, n_jobs):
+        pytest.importorskip('sklearn')
+        from tictacs.runner import run
+        tmpdir.join('svm.yaml').write(recipe % ('LinearSVC', 'sklearn.svm'))
+        tmpdir.join('broken.yaml').write(recipe % ('Missing', 'sklearn.svm'))
+        results = list(run(str(tmpdir), texts, labels, texts, labels,
+                           n_jobs=n_jobs))
+        results = dict((r['recipe'].split('/')[-1], r) for r in results)
+        assert results['svm.yaml']['score'] == 1.0
+        assert results['svm.yaml']['peak_rss'] > 0
+        assert results['broken.yaml']['error'] is not None
+
+    def test_stop_early(self, monkeypatch):
+        """test recipes that haven't started are cancelled on a break"""
+        import time
+        from tictacs import runner
+        monkeypatch.setattr(runner, 'evaluate', slow_evaluate)
+        start = time.time()
+        for result in runner.run(['%d.yaml' % i for i in range(20)], texts,
+                                 labels, texts, labels, n_jobs=1):
+            break
+        assert time.time() - start < 5.
+
+    def test_cli(self, tmpdir, capsys):
+        pytest.importorskip('sklearn')
+        from tictacs.__main__ import main
+        tmpdir.join('svm.yaml').write(recipe % ('LinearSVC', 'sklearn.svm'))
+        tmpdir.join('texts.txt').write('\n'.join(texts) + '\n')
+        tmpdir.join('labels.txt').write('\n'.join(map(str, labels)) + '\n')
+        assert main(['run', str(tmpdir), '-d', str(tmpdir.join('texts.txt')),
+                     '-l', str(tmpdir.join('labels.txt')), '-j', '1']) == 0
+        assert 'svm.yaml' in capsys.readouterr().out
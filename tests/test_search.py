@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import time
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from sklearn.dummy import DummyClassifier  # noqa: E402
+from tictacs import from_recipe  # noqa: E402
+from tictacs.search import expand_grid, label_paths  # noqa: E402
+from tictacs.search import to_sklearn, search  # noqa: E402
+
+recipe = """
+param_grid:
+  count.binary: [true, false]
+  svm.C: [0.01, 1, 100]
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: union
+        estimator: FeatureUnion
+        estimator_pkg: sklearn.pipeline
+        estimator_params:
+          transformer_list:
+            - label: count
+              estimator: CountVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+      - label: svm
+        estimator: LinearSVC
+        estimator_pkg: sklearn.svm
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr',
+         'a dog runs', 'the cat sleeps', 'dogs bark loud', 'cats like milk',
+         'dog food', 'cat food', 'the big dog', 'a small cat']
+labels = [0, 1] * 6
+
+
+class Slow(DummyClassifier):
+
+    """classifier that takes delay seconds to fit"""
+
+    def __init__(self, delay=0., strategy='prior'):
+        super(Slow, self).__init__(strategy=strategy)
+        self.delay = delay
+
+    def fit(self, X, y):
+        time.sleep(self.delay)
+        return super(Slow, self).fit(X, y)
+
+
+class TestSearch(object):
+
+    """test searching the param_grid of a recipe"""
+
+    def test_labels(self, write_recipe):
+        """test label addressed parameters map to sklearn paths"""
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path))
+        grid = expand_grid(tictac.param_grid)
+        assert len(grid) == 6
+        paths = label_paths(tictac)
+        assert to_sklearn(grid[0], paths) == {'union__count__binary': True,
+                                              'svm__C': 0.01}
+        with pytest.raises(ValueError):
+            to_sklearn({'missing.C': 1}, paths)
+
+    @pytest.mark.parametrize('strategy,n_jobs', [('grid', 1),
+                                                 ('grid', 2),
+                                                 ('grid', -1),
+                                                 ('grid', None),
+                                                 ('halving', 1)])
+    def test_search(self, write_recipe, strategy, n_jobs):
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path))
+        result = tictac.search(texts, labels, cv=2, n_jobs=n_jobs,
+                               strategy=strategy, factor=2)
+        assert result['best_params'] in expand_grid(tictac.param_grid)
+        assert all(r['error'] is None for r in result['results'])
+        assert len(result['best_estimator'].predict(texts)) == len(texts)
+        if strategy == 'grid':
+            assert len(result['results']) == 6
+        else:
+            resources = [r['resources'] for r in result['results']]
+            assert resources == sorted(resources)
+            assert resources[-1] == len(texts)
+
+    def test_prefix_reuse(self, write_recipe):
+        """test candidates that only differ in the final step refit it"""
+        from tictacs.memo import StepCache
+        path = write_recipe(recipe)
+        cache = StepCache()
+        search(str(path), texts, labels, cv=2, memory=cache, refit=False,
+               param_grid={'svm.C': [0.01, 1, 100]})
+        # the vectorizer is fitted on each fold once, the svm three times
+        assert cache.misses < 3 * 2 * 3
+
+    def test_timeout(self):
+        """test the search stops between folds at the timeout"""
+        start = time.time()
+        result = search(Slow(), texts, labels, cv=3,
+                        param_grid={'delay': [0.3] * 4}, timeout=1.,
+                        refit=False)
+        # 12 fits of 0.3 seconds
+        assert time.time() - start < 2.
+        assert any(len(r['scores']) < 3 for r in result['results'])
+
+    def test_timeout_workers(self):
+        """test the workers are stopped in the middle of a fit"""
+        start = time.time()
+        result = search(Slow(), texts, labels, cv=3, n_jobs=2,
+                        param_grid={'delay': [0., 60., 60.]}, timeout=2.,
+                        refit=False)
+        assert time.time() - start < 10.
+        assert result['best_params'] == {'delay': 0.}
+        assert [r['candidate'] for r in result['results']] == [0]
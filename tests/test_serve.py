@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import json
+import asyncio
+import pytest
+from tictacs.serve import Server
+
+
+class Doubler(object):
+
+    """model that remembers the size of the batches it was called with"""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, X):
+        self.batches.append(len(X))
+        return [2 * x for x in X]
+
+
+async def request(port, method, target, payload=None):
+    """minimal local http client"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode('utf-8') if payload is not None \
+        else b''
+    writer.write(('%s %s HTTP/1.1\r\nHost: localhost\r\n'
+                  'Content-Length: %d\r\nConnection: close\r\n\r\n'
+                  % (method, target, len(body))).encode('ascii') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, data = response.partition(b'\r\n\r\n')
+    return head.split(b' ')[1].decode('ascii'), json.loads(data)
+
+
+class TestServe(object):
+
+    """test concurrent requests are batched and answered in order"""
+
+    def test_batching(self):
+        model = Doubler()
+
+        async def run():
+            server = await Server(model, max_batch_size=8,
+                                  max_wait=0.2).start(port=0)
+            try:
+                responses = await asyncio.gather(*[
+                    request(server.port, 'POST', '/predict',
+                            {'instances': [i, i + 100]})
+                    for i in range(6)])
+                metrics = await request(server.port, 'GET', '/metrics')
+            finally:
+                await server.close()
+            return responses, metrics
+        responses, (status, metrics) = asyncio.run(run())
+        for i, (status, payload) in enumerate(responses):
+            assert status == '200'
+            assert payload['predictions'] == [2 * i, 2 * (i + 100)]
+        # 12 samples in batches of at most 8
+        assert sum(model.batches) == 12
+        assert max(model.batches) <= 8
+        assert len(model.batches) < 6
+        assert status == '200'
+        assert metrics['latency_ms']['count'] == 6
+        assert metrics['queue_depth'] == 0
+
+    def test_bad_request(self):
+        async def run():
+            server = await Server(Doubler()).start(port=0)
+            try:
+                return await asyncio.gather(
+                    request(server.port, 'POST', '/predict', {'x': 1}),
+                    request(server.port, 'GET', '/nowhere'))
+            finally:
+                await server.close()
+        (bad, _), (missing, _) = asyncio.run(run())
+        assert bad == '400'
+        assert missing == '404'
+
+    def test_malformed(self):
+        """test requests that can't be parsed get a 400"""
+        async def send(port, raw):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(raw)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            return response.split(b' ')[1].decode('ascii')
+
+        async def run():
+            server = await Server(Doubler()).start(port=0)
+            try:
+                return await asyncio.gather(
+                    send(server.port, b'GARBAGE\r\n\r\n'),
+                    send(server.port, b'POST /predict HTTP/1.1\r\n'
+                                      b'Content-Length: lots\r\n\r\n'))
+            finally:
+                await server.close()
+        assert asyncio.run(run()) == ['400', '400']
+
+    def test_too_large(self):
+        """test bodies over the limit get a 413 without being read"""
+        server = Server(Doubler(), max_body_bytes=50)
+
+        async def run():
+            await server.start(port=0)
+            try:
+                return await asyncio.gather(
+                    request(server.port, 'POST', '/predict',
+                            {'instances': list(range(100))}),
+                    request(server.port, 'POST', '/predict',
+                            {'instances': [1]}))
+            finally:
+                await server.close()
+        (large, _), (small, payload) = asyncio.run(run())
+        assert large == '413'
+        assert small == '200' and payload == {'predictions': [2]}
+        # the thread the batcher predicted in is shut down
+        assert server.batcher.executor is None
+
+    def test_instances_checked(self):
+        """test instances have to be a list and an empty one is answered"""
+        model = Doubler()
+
+        async def run():
+            server = await Server(model).start(port=0)
+            try:
+                return await asyncio.gather(*[
+                    request(server.port, 'POST', '/predict',
+                            {'instances': instances})
+                    for instances in ('abc', 3, [])])
+            finally:
+                await server.close()
+        (string, _), (scalar, _), (empty, payload) = asyncio.run(run())
+        assert string == '400' and scalar == '400'
+        assert empty == '200' and payload == {'predictions': []}
+        assert model.batches == []
+
+    def test_failure_isolated(self):
+        """test a request that fails doesn't fail the others in its batch"""
+        class Strict(Doubler):
+            def predict(self, X):
+                if not all(isinstance(x, int) for x in X):
+                    raise ValueError('Expected numbers')
+                return super(Strict, self).predict(X)
+
+        async def run():
+            server = await Server(Strict(), max_batch_size=8,
+                                  max_wait=0.2).start(port=0)
+            try:
+                return await asyncio.gather(*[
+                    request(server.port, 'POST', '/predict',
+                            {'instances': instances})
+                    for instances in ([1, 2], ['bad'], [3])])
+            finally:
+                await server.close()
+        good, bad, other = asyncio.run(run())
+        assert good == ('200', {'predictions': [2, 4]})
+        assert bad[0] == '500'
+        assert other == ('200', {'predictions': [6]})
+
+
+class TestLoadModel(object):
+
+    """test recipes are fitted on their data section without -d"""
+
+    def test_data_section(self, tmpdir, write_recipe):
+        pytest.importorskip('sklearn')
+        from tictacs.serve import load_model
+        texts = ['my dog is blue', 'my cat is green', 'the dog barks']
+        tmpdir.join('texts.txt').write('\n'.join(texts) + '\n')
+        tmpdir.join('labels.txt').write('0\n1\n0\n')
+        pipeline = ('pipeline:\n'
+                    '  label: example\n'
+                    '  estimator: Pipeline\n'
+                    '  estimator_pkg: sklearn.pipeline\n'
+                    '  estimator_params:\n'
+                    '    steps:\n'
+                    '      - label: count\n'
+                    '        estimator: CountVectorizer\n'
+                    '        estimator_pkg: sklearn.feature_extraction.text\n'
+                    '      - label: svm\n'
+                    '        estimator: LinearSVC\n'
+                    '        estimator_pkg: sklearn.svm\n')
+        path = write_recipe('data: {X: %s, y: %s}\n'
+                            % (tmpdir.join('texts.txt'),
+                               tmpdir.join('labels.txt')) + pipeline)
+        assert len(load_model(recipe=str(path)).predict(texts)) == 3
+        with pytest.raises(ValueError):
+            load_model(recipe=str(write_recipe(pipeline, 'other.yaml')))
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import pytest
+import pickle
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from tictacs import from_recipe  # noqa: E402
+from tictacs.slim import CompactVocabulary, footprint  # noqa: E402
+
+recipe = """
+data:
+  X: texts.txt
+%s
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: union
+        estimator: FeatureUnion
+        estimator_pkg: sklearn.pipeline
+        estimator_params:
+          transformer_list:
+            - label: words
+              estimator: TfidfVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+            - label: same words
+              estimator: TfidfVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+              estimator_params:
+                lowercase: true
+      - label: svm
+        estimator: LinearSVC
+        estimator_pkg: sklearn.svm
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr',
+         u'καλημέρα κόσμε'] * 20
+labels = [0, 1, 0, 1, 1] * 20
+
+
+class TestCompactVocabulary(object):
+
+    def test_mapping(self):
+        vocabulary = dict(('term%d' % i, i) for i in range(1000))
+        vocabulary[u'λέξη'] = 1000
+        compact = CompactVocabulary(vocabulary)
+        assert len(compact) == len(vocabulary)
+        assert dict(compact.items()) == vocabulary
+        assert all(compact[term] == index
+                   for term, index in vocabulary.items())
+        assert 'missing' not in compact and 1 not in compact
+        copy = pickle.loads(pickle.dumps(compact))
+        assert copy[u'λέξη'] == 1000
+
+    def test_holes(self):
+        with pytest.raises(ValueError):
+            CompactVocabulary({'a': 0, 'b': 2})
+
+
+class TestSlim(object):
+
+    def test_slim(self, write_recipe):
+        path = write_recipe(recipe % 'slim_options: {vocabulary: true, '
+                                     'downcast: true}')
+        tictac = from_recipe(str(path)).fit(texts, labels)
+        expected = tictac.decision_function(texts)
+        features = tictac.steps[0][1].get_feature_names_out()
+        report = tictac.slim()
+        assert report['after'] < report['before']
+        assert ((), 'data') in report['dropped'] and tictac.data is None
+        assert (('union', 'words'), 'vocabulary_') in report['compacted']
+        assert (('svm',), 'coef_') in report['downcast']
+        union = dict(tictac.steps[0][1].transformer_list)
+        assert union['same words'].vocabulary_ is union['words'].vocabulary_
+        assert isinstance(union['words'].vocabulary_, CompactVocabulary)
+        assert np.allclose(tictac.decision_function(texts), expected,
+                           atol=1e-5)
+        assert list(tictac.steps[0][1].get_feature_names_out()) == \
+            list(features)
+        copy = pickle.loads(pickle.dumps(tictac))
+        assert np.allclose(copy.decision_function(texts), expected,
+                           atol=1e-5)
+
+    def test_opt_in(self, write_recipe):
+        """test vocabularies are only compacted and coefficients downcast
+        if the recipe asks"""
+        path = write_recipe(recipe % '')
+        tictac = from_recipe(str(path)).fit(texts, labels)
+        expected = tictac.decision_function(texts)
+        report = tictac.slim()
+        assert report['compacted'] == [] and report['downcast'] == []
+        assert tictac.steps[1][1].coef_.dtype == np.float64
+        assert np.array_equal(tictac.decision_function(texts), expected)
+        assert type(tictac.steps[0][1].transformer_list[0][1]
+                    .vocabulary_) is dict
+        assert tictac.slim(vocabulary=True)['compacted']
+        path.write(recipe % 'slim_options: {vocabulary: true, compress: true}')
+        with pytest.raises(ValueError, match='compress'):
+            from_recipe(str(path)).fit(texts, labels).slim()
+
+    def test_footprint(self):
+        arr = np.zeros(1000)
+        assert footprint([arr, arr[10:]]) < footprint([arr, arr.copy()])
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from tictacs import from_recipe, load
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+recipe = """
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: tfidf
+        estimator: TfidfVectorizer
+        estimator_pkg: sklearn.feature_extraction.text
+      - label: svm
+        estimator: LinearSVC
+        estimator_pkg: sklearn.svm
+"""
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr']
+labels = [0, 1, 0, 1]
+
+
+class TestStore(object):
+
+    """test saved tictacs load with their arrays memory mapped"""
+
+    def test_roundtrip(self, tmpdir, write_recipe):
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path))
+        tictac.fit(texts, labels)
+        model = str(tmpdir.join('model'))
+        tictac.save(model, min_bytes=0)
+        assert len(os.listdir(os.path.join(model, 'arrays'))) > 0
+        loaded = load(model)
+        coef = loaded.named_steps['svm'].coef_
+        assert isinstance(coef, np.memmap)
+        assert not coef.flags.writeable
+        assert list(loaded.predict(texts)) == list(tictac.predict(texts))
+
+    def test_no_mmap(self, tmpdir, write_recipe):
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path))
+        tictac.fit(texts, labels)
+        model = str(tmpdir.join('model'))
+        tictac.save(model, min_bytes=0)
+        coef = load(model, mmap=False).named_steps['svm'].coef_
+        assert not isinstance(coef, np.memmap)
+
+    def test_tictac(self, tmpdir, write_recipe):
+        """test the loaded tictac has its methods and no version warning"""
+        import warnings
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path)).fit(texts, labels)
+        model = str(tmpdir.join('model'))
+        tictac.save(model)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            loaded = load(model)
+        assert not [w for w in caught if 'version' in str(w.message)]
+        assert loaded.__class__ is tictac.__class__
+        assert loaded.recipe == str(path)
+        # saving again replaces the saved tictac
+        loaded.save(model)
+        assert list(load(model).predict(texts)) == list(tictac.predict(texts))
+        # no temporary directories are left behind
+        assert sorted(os.listdir(str(tmpdir))) == ['model', 'recipe.yaml']
+
+    def test_refuse_overwrite(self, tmpdir, write_recipe):
+        """test directories that don't hold a saved tictac are kept"""
+        path = write_recipe(recipe)
+        tictac = from_recipe(str(path)).fit(texts, labels)
+        data = tmpdir.mkdir('data')
+        data.join('important.txt').write('keep me')
+        with pytest.raises(ValueError):
+            tictac.save(str(data))
+        with pytest.raises(ValueError):
+            tictac.save(str(path))
+        assert data.join('important.txt').read() == 'keep me'
+        # empty directories are fine
+        tictac.save(str(tmpdir.mkdir('empty')))
+        assert os.path.isfile(str(tmpdir.join('empty', 'model.pkl')))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from tictacs.stream import chunked, effective_n_jobs, map_ordered
+
+
+class Counter(object):
+
+    """target that counts the elements of chunks"""
+
+    def count(self, chunk):
+        return len(chunk)
+
+
+class TestStream(object):
+
+    """test chunks are mapped in order with any number of workers"""
+
+    @pytest.mark.parametrize('n_jobs,expected', [
+        (None, 1), (1, 1), (3, 3), (0, 1),
+        (-1, os.cpu_count() or 1),
+        (-1000, 1)])
+    def test_effective_n_jobs(self, n_jobs, expected):
+        assert effective_n_jobs(n_jobs) == expected
+
+    @pytest.mark.parametrize('n_jobs,backend', [(None, 'thread'),
+                                                (-1, 'thread'),
+                                                (2, 'process'),
+                                                (-1, 'process')])
+    def test_map_ordered(self, n_jobs, backend):
+        chunks = chunked(list(range(10)), 3)
+        assert list(map_ordered(Counter(), 'count', chunks, n_jobs=n_jobs,
+                                backend=backend)) == [3, 3, 3, 1]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import pickle
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from sklearn.base import clone  # noqa: E402
+from sklearn.pipeline import FeatureUnion  # noqa: E402
+from sklearn.preprocessing import FunctionTransformer  # noqa: E402
+from sklearn.feature_extraction.text import CountVectorizer  # noqa: E402
+from sklearn.feature_extraction.text import TfidfVectorizer  # noqa: E402
+from tictacs import from_recipe  # noqa: E402
+from tictacs.union import ThreadedUnion, hstack_csr  # noqa: E402
+
+texts = ['my dog is blue', 'my cat is green', 'the dog barks', 'cats purr',
+         'The Dog and the cat']
+labels = [0, 1, 0, 1, 0]
+
+
+def branches():
+    return [('words', CountVectorizer()),
+            ('tfidf', TfidfVectorizer(min_df=2)),
+            ('bigrams', CountVectorizer(ngram_range=(1, 2))),
+            ('chars', CountVectorizer(analyzer='char', binary=True))]
+
+
+class TestThreadedUnion(object):
+
+    """test the threaded union gives the same output as FeatureUnion"""
+
+    @pytest.mark.parametrize('share_analysis', [True, False])
+    def test_same_as_feature_union(self, share_analysis):
+        weights = {'tfidf': 2., 'chars': .5}
+        expected = FeatureUnion(branches(), transformer_weights=weights)
+        union = ThreadedUnion(branches(), transformer_weights=weights,
+                              share_analysis=share_analysis)
+        X = union.fit_transform(texts)
+        assert X.format == 'csr'
+        assert np.allclose(X.toarray(),
+                           expected.fit_transform(texts).toarray())
+        assert np.allclose(union.transform(texts[::-1]).toarray(),
+                           expected.transform(texts[::-1]).toarray())
+        # vectorizers are left with their own analyzer
+        assert union.transformer_list[0][1].analyzer == 'word'
+        assert np.allclose(union.transformer_list[0][1].transform(
+            texts).toarray(), expected.transformer_list[0][1].transform(
+            texts).toarray())
+        assert list(union.get_feature_names_out()) == \
+            list(expected.get_feature_names_out())
+
+    @pytest.mark.parametrize('n_jobs', [2, -1, None])
+    def test_fit_clone_pickle(self, n_jobs):
+        union = ThreadedUnion(branches(), n_jobs=n_jobs)
+        union.fit(texts)
+        X = union.transform(texts)
+        loaded = pickle.loads(pickle.dumps(union))
+        assert np.allclose(loaded.transform(texts).toarray(), X.toarray())
+        assert clone(union).get_params()['share_analysis'] is True
+
+    def test_branches_cloned(self):
+        """test fitting leaves the given branches as they were"""
+        given = branches()
+        union = ThreadedUnion(given, n_jobs=2).fit(texts)
+        for (_, before), (_, after) in zip(given, union.transformer_list):
+            assert after is not before
+            assert not hasattr(before, 'vocabulary_')
+            assert hasattr(after, 'vocabulary_')
+
+    def test_set_output(self):
+        union = ThreadedUnion([('a', FunctionTransformer())])
+        assert union.set_output(transform='default') is union
+        with pytest.raises(ValueError):
+            union.set_output(transform='pandas')
+
+    def test_dense(self):
+        union = ThreadedUnion([('a', FunctionTransformer()),
+                               ('b', FunctionTransformer())],
+                              transformer_weights={'b': 3})
+        X = np.arange(6.).reshape(3, 2)
+        assert np.allclose(union.fit_transform(X),
+                           np.hstack([X, 3 * X]))
+
+    def test_hstack_csr(self):
+        import scipy.sparse as sp
+        rnd = np.random.RandomState(0)
+        blocks = [sp.random(20, n, density=.3, format='csr',
+                            random_state=rnd) for n in (5, 1, 7)]
+        blocks.append(sp.csr_matrix((20, 3)))
+        stacked = hstack_csr(blocks, [None, 2., None, None])
+        expected = sp.hstack([blocks[0], blocks[1] * 2., blocks[2],
+                              blocks[3]])
+        assert np.allclose(stacked.toarray(), expected.toarray())
+        assert stacked.has_canonical_format
+
+    def test_recipe(self, write_recipe):
+        path = write_recipe("""
+pipeline:
+  label: example
+  estimator: Pipeline
+  estimator_pkg: sklearn.pipeline
+  estimator_params:
+    steps:
+      - label: union
+        estimator: ThreadedUnion
+        estimator_pkg: tictacs.union
+        estimator_params:
+          transformer_list:
+            - label: words
+              estimator: CountVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+            - label: tfidf
+              estimator: TfidfVectorizer
+              estimator_pkg: sklearn.feature_extraction.text
+      - label: svm
+        estimator: LinearSVC
+        estimator_pkg: sklearn.svm
+""")
+        tictac = from_recipe(str(path))
+        tictac.fit(texts, labels)
+        assert len(tictac.predict(texts)) == len(texts)
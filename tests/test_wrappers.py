@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
+import os
 import sys
+import time
+import json
 import pytest
 import logging
 # from tictacs import from_recipe
-from tictacs.wrappers import FunctionWrapper
+from tictacs.wrappers import FunctionWrapper, ProfilingSentinel
 
 recipe = 'recipe.yaml'
 log = logging.getLogger()
@@ -17,6 +20,11 @@ def add_five(X):
     return X+5
 
 
+def lower(X):
+    """ lowercase a list of strings """
+    return [x.lower() for x in X]
+
+
 # class TestSentinel(object):
 
 #     """no fancy checking yet, just assert we got no exceptions"""
@@ -75,3 +83,129 @@ class TestFunctionWrapper(object):
         """i am unpiclable as a member function
         - not because i am intricate and involved"""
         return X+5
+
+
+class TestFunctionWrapperExecution(object):
+
+    """test the different ways of applying the function give the same
+    output in the same order"""
+
+    texts = ['My', 'Dog', 'IS', 'blue'] * 5
+
+    @pytest.mark.parametrize('mode,n_jobs,backend', [
+        ('batch', 2, 'thread'),
+        ('batch', -1, 'thread'),
+        ('batch', None, 'thread'),
+        ('chunk', 1, 'thread'),
+        ('chunk', -1, 'thread'),
+        ('chunk', 3, 'thread'),
+        ('chunk', 2, 'process'),
+    ])
+    def test_list(self, mode, n_jobs, backend):
+        """test list outputs are joined in order"""
+        fw = FunctionWrapper(lower).set_execution(mode=mode, chunk_size=3,
+                                                  n_jobs=n_jobs,
+                                                  backend=backend)
+        assert fw.transform(self.texts) == lower(self.texts)
+
+    def test_element(self):
+        """test the function is called once per element"""
+        fw = FunctionWrapper(len).set_execution(mode='element', n_jobs=2,
+                                                chunk_size=7)
+        assert fw.transform(self.texts) == [len(x) for x in self.texts]
+
+    def test_array(self):
+        """test array outputs are concatenated"""
+        np = pytest.importorskip('numpy')
+        X = np.arange(20).reshape(10, 2)
+        fw = FunctionWrapper(add_five).set_execution(mode='chunk',
+                                                     chunk_size=3, n_jobs=2)
+        out = fw.transform(X)
+        assert isinstance(out, np.ndarray)
+        assert (out == X + 5).all()
+
+    def test_clone(self):
+        """test clone keeps the arguments and the execution"""
+        clone = pytest.importorskip('sklearn.base').clone
+        fw = FunctionWrapper(add_five, 1, a=2).set_execution(
+            mode='element', n_jobs=4, chunk_size=7, output='list')
+        cloned = clone(fw)
+        assert cloned is not fw
+        assert (cloned.args, cloned.kwargs) == ((1,), {'a': 2})
+        assert [getattr(cloned, name) for name in FunctionWrapper.EXECUTION] \
+            == ['element', 7, 4, 'thread', 'list']
+
+    def test_invalid_mode(self):
+        with pytest.raises(ValueError):
+            FunctionWrapper(len).set_execution(mode='magic')
+
+
+class TestProfilingSentinel(object):
+
+    """test metrics are recorded and data passes through untouched"""
+
+    def test_ring(self):
+        """test records of a list go to the ring buffer"""
+        sentinel = ProfilingSentinel(name='entry', capacity=2)
+        sentinel.get_sink().clear()
+        data = ['my', 'dog', 'is', 'blue']
+        assert sentinel.transform(data) is data
+        sentinel.transform(data)
+        sentinel.transform(data)
+        records = list(sentinel.get_sink().records)
+        assert len(records) == 2
+        assert records[-1]['rows'] == 4
+        assert records[-1]['sentinel'] == 'entry'
+        assert records[-1]['elapsed'] >= 0
+
+    def test_clock(self):
+        """test elapsed is the time since the previous sentinel on the
+        same clock, whatever other sentinels do in between"""
+        first = ProfilingSentinel(name='first', clock='a')
+        second = ProfilingSentinel(name='second', clock='a')
+        other = ProfilingSentinel(name='other', clock='b')
+        sink = first.get_sink()
+        first.transform([])
+        time.sleep(.05)
+        other.transform([])
+        other.transform([])
+        second.transform([])
+        assert sink.records[-1]['sentinel'] == 'second'
+        assert sink.records[-1]['elapsed'] >= .05
+        assert sink.records[-2]['elapsed'] < .05
+        assert first.get_sink() is sink
+
+    def test_profiling_recipe(self, tmpdir, monkeypatch):
+        """test the example profiling recipe runs and records both
+        sentinels"""
+        pytest.importorskip('sklearn')
+        from tictacs import from_recipe
+        recipe = os.path.join(os.path.dirname(__file__), os.pardir,
+                              'recipes', 'profiling.yaml')
+        monkeypatch.chdir(tmpdir)
+        tictac = from_recipe(recipe)
+        union = dict(tictac.steps)['union']
+        assert dict(union.transformer_list)['count 3grams tfidf'].analyzer \
+            == 'char'
+        texts = ['my dog is blue', 'my cat is green', 'the dog barks',
+                 'cats purr']
+        tictac.fit(texts, [0, 1, 0, 1])
+        assert len(tictac.predict(texts)) == len(texts)
+        dict(tictac.steps)['profile-classifier-input'].get_sink().close()
+        with open(str(tmpdir.join('profile.jsonl'))) as f:
+            records = [json.loads(line) for line in f]
+        assert [r['sentinel'] for r in records] == ['classifier-input'] * 2
+        assert all(r['elapsed'] >= 0 for r in records)
+
+    def test_sparse(self, tmpdir):
+        """test sparse metrics go to a jsonl file"""
+        sp = pytest.importorskip('scipy.sparse')
+        path = str(tmpdir.join('metrics.jsonl'))
+        sentinel = ProfilingSentinel(sink='jsonl', path=path)
+        sentinel.transform(sp.eye(10, format='csr'))
+        sentinel.get_sink().close()
+        with open(path) as f:
+            record = json.loads(f.readline())
+        assert record['nnz'] == 10
+        assert record['density'] == 0.1
+        assert record['shape'] == [10, 10]
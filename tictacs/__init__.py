@@ -8,4 +8,5 @@ class NullHandler(logging.Handler):
 log = logging.getLogger(__name__)
 log.addHandler(NullHandler())
 
-from .parse import from_recipe
+from .parse import from_recipe, from_recipes
+from .store import load
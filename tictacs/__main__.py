@@ -0,0 +1,47 @@
+""" command line interface of tictacs
+
+    tictacs compile recipe.yaml -o recipe_plan.py
+    tictacs run recipes/ -d texts.txt -l labels.txt -j 4
+"""
+import sys
+from argparse import ArgumentParser
+from .compile import compile_recipe
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog='tictacs',
+                            description='Tools for tictacs recipes')
+    commands = parser.add_subparsers(dest='command')
+    compile_parser = commands.add_parser(
+        'compile', help='Compile a recipe to a python module that builds '
+                        'the tictac without parsing the recipe')
+    compile_parser.add_argument('recipe', help='Path to the recipe')
+    compile_parser.add_argument('--output', '-o',
+                                help='Path of the compiled plan, next to '
+                                     'the recipe by default so that '
+                                     'from_recipe uses it')
+    run_parser = commands.add_parser(
+        'run', help='Fit and score recipes on the same data in parallel')
+    if argv is None:
+        argv = sys.argv[1:]
+    # the runner needs numpy - only import it when it is used
+    if argv[:1] == ['run']:
+        from . import runner
+        runner.add_arguments(run_parser)
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return runner.main(args)
+    if args.command != 'compile':
+        parser.print_help()
+        return 2
+    try:
+        output = compile_recipe(args.recipe, args.output)
+    except (ValueError, TypeError, AttributeError, ImportError) as e:
+        sys.stderr.write('Could not compile %s: %s\n' % (args.recipe, e))
+        return 1
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
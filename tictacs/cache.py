@@ -0,0 +1,482 @@
+""" caching of parsed recipes so that we don't need to read yaml each time
+
+    Recipes can include fragments - other yaml files of entries, eg: a
+    library of the components many recipes share:
+
+    include: [components/text.yaml]
+    pipeline:
+      ...
+
+    Included paths are relative to the including file. Entries of the
+    fragments are merged in the order they are listed and the entries of
+    the recipe override them. Dictionaries are merged key by key, so a
+    recipe can change one parameter of an included estimator, while other
+    values, including lists, are replaced. Fragments are parsed once and
+    cached like recipes, keyed by their content.
+"""
+import os
+import json
+import stat
+import yaml
+import pickle
+import hashlib
+import logging
+import tempfile
+
+# use the libyaml bindings if pyyaml was built with them - they are
+# an order of magnitude faster than the pure python loader
+try:
+    _BaseLoader = yaml.CSafeLoader
+except AttributeError:
+    _BaseLoader = yaml.SafeLoader
+
+
+class YamlLoader(_BaseLoader):
+
+    """ Safe yaml loader that also understands !tuple [a, b] for estimator
+        params that must be tuples, eg: ngram_range """
+
+
+YamlLoader.add_constructor(
+    '!tuple', lambda loader, node: tuple(loader.construct_sequence(node)))
+# prefix of the tags that unsafe loaders construct python objects from
+PYTHON_TAG = 'tag:yaml.org,2002:python/'
+
+# bump this if the structure of the stored plans changes
+PLAN_VERSION = 3
+# key of the list of fragments a recipe includes
+INCLUDE = 'include'
+
+
+def load_yaml(stream):
+    """ Parse yaml from a string or file object
+
+    :stream: str or file object containing yaml
+    :returns: the python object the yaml represents
+    :raises: ValueError if the yaml uses python tags, eg: !!python/tuple
+
+    """
+    try:
+        return yaml.load(stream, Loader=YamlLoader)
+    except yaml.constructor.ConstructorError as e:
+        if PYTHON_TAG not in str(e.problem):
+            raise
+        raise ValueError('Recipes are loaded with a safe yaml loader that '
+                         'does not construct python tags - use !tuple [a, b] '
+                         'for tuples and estimator entries for objects: %s'
+                         % e)
+
+
+def content_digest(content):
+    """ Get a hex digest of some bytes
+
+    :content: bytes - the content to hash
+    :returns: str - hex digest
+
+    """
+    return hashlib.sha1(content).hexdigest()
+
+
+def file_digest(filename):
+    """ Get a hex digest of the content of a file
+
+    :filename: str - path to the file
+    :returns: str - hex digest
+
+    """
+    with open(filename, 'rb') as f:
+        return content_digest(f.read())
+
+
+def _to_json(value):
+    """ Convert tuples to {'!tuple': [...]} so they survive json """
+    if type(value) is tuple:
+        return {'!tuple': [_to_json(item) for item in value]}
+    if type(value) is list:
+        return [_to_json(item) for item in value]
+    if type(value) is dict:
+        return dict((key, _to_json(item)) for key, item in value.items())
+    return value
+
+
+def _from_json(obj):
+    if len(obj) == 1 and '!tuple' in obj:
+        return tuple(obj['!tuple'])
+    return obj
+
+
+def dump_plan(plan):
+    """ Serialize a plan to json - plans on disk are never unpickled, but
+        they are still trusted like the recipes themselves: a plan names the
+        estimator packages that get imported and called
+
+    :plan: dictionary - the plan
+    :returns: bytes
+    :raises ValueError: if json can't represent the plan, eg: a recipe with
+                        keys that are not strings
+
+    """
+    data = json.dumps(_to_json(plan), sort_keys=True).encode('utf-8')
+    if load_plan(data) != plan:
+        raise ValueError('Plan of %s can not be stored as json'
+                         % plan.get('recipe'))
+    return data
+
+
+def load_plan(data):
+    """ Deserialize a plan stored with dump_plan
+
+    :data: bytes
+    :returns: dictionary - the plan
+
+    """
+    return json.loads(data.decode('utf-8'), object_hook=_from_json)
+
+
+def merge(base, override):
+    """ Merge the entries of override into those of base. Dictionaries are
+        merged recursively, any other value of override replaces the value
+        of base.
+
+    :base: dictionary
+    :override: dictionary
+    :returns: dictionary - a new one, base and override are not modified
+
+    """
+    merged = dict(base)
+    for key, value in override.items():
+        if type(value) is dict and type(merged.get(key)) is dict:
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def included(recipe, entries):
+    """ Get the paths of the fragments a recipe includes
+
+    :recipe: str - path to the recipe
+    :entries: dictionary - root entries of the recipe
+    :returns: list of str - absolute paths
+
+    """
+    includes = entries.get(INCLUDE) or []
+    if type(includes) is str:
+        includes = [includes]
+    if type(includes) is not list or \
+            any(type(path) is not str for path in includes):
+        raise ValueError('Expected %s in %s to be a path or a list of paths'
+                         % (INCLUDE, recipe))
+    directory = os.path.dirname(os.path.abspath(recipe))
+    return [os.path.normpath(os.path.join(directory, path))
+            for path in includes]
+
+
+class RecipeCache(object):
+
+    """ Cache of parsed recipes. Plans are kept in memory for the lifetime
+        of the process and stored as json in a directory on disk so that
+        other processes using the same recipe don't need to parse the yaml
+        again. Plans are keyed by the content of the recipe so if the file
+        changes the stale plan is simply never looked up again.
+
+        Whoever can write to the directory can change the estimators a plan
+        imports and runs, so the directory must be trusted: it is created
+        readable only by the user and plans are neither read from nor
+        written to a directory that is owned by someone else or that others
+        can write to. """
+
+    # environment variable that can be used to change the default location
+    ENV_LOCATION = 'TICTACS_CACHE_DIR'
+
+    def __init__(self, location=None):
+        """ Create a cache of recipe plans
+
+        :location: str - directory to store plans in, defaults to the value
+                   of TICTACS_CACHE_DIR or ~/.cache/tictacs
+
+        """
+        if location is None:
+            location = os.environ.get(RecipeCache.ENV_LOCATION,
+                                      os.path.join(os.path.expanduser('~'),
+                                                   '.cache', 'tictacs'))
+        self.location = location
+        # (version, deps, pickled plan) tuples seen by this process - plans
+        # are only pickled in memory, on disk they are json
+        self.memory = dict()
+        # key of the content each recipe was last read with, so that the
+        # plans of older contents are dropped and memory stays bounded by
+        # the number of recipes rather than the number of edits to them
+        self.keys = dict()
+        self.logger = logging.getLogger(__name__)
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'RecipeCache at: %s' % self.location
+
+    def load(self, recipe):
+        """ Get the root entries of a recipe, parsing it only if we haven't
+            got an up to date plan for it.
+
+        :recipe: str - path to the yaml file containing the recipe
+        :returns: dictionary - the root entries of the recipe
+
+        """
+        # return a fresh copy each time - the parser is free to modify it
+        return pickle.loads(self._entry(recipe)[2])['entries']
+
+    def _entry(self, recipe, including=()):
+        """ Get the (version, deps, pickled plan) of a recipe
+
+        :recipe: str - path to the recipe
+        :including: tuple of str - absolute paths of the recipes that
+                    include it, to detect cycles
+        :returns: tuple
+
+        """
+        with open(recipe, 'rb') as f:
+            content = f.read()
+        key = self.key(recipe, content)
+        path = os.path.abspath(recipe)
+        previous = self.keys.get(path)
+        if previous is not None and previous != key:
+            self.memory.pop(previous, None)
+        self.keys[path] = key
+        entry = self.memory.get(key)
+        if entry is None:
+            entry = self._read(key)
+        if entry is not None and not self._is_stale(entry[0], entry[1]):
+            self.logger.info('Using cached plan for recipe %s..' % recipe)
+        else:
+            plan = self.compile(recipe, content, including)
+            entry = (plan['version'], plan['deps'],
+                     pickle.dumps(plan, pickle.HIGHEST_PROTOCOL))
+            self._write(key, plan)
+        self.memory[key] = entry
+        return entry
+
+    def compile(self, recipe, content, including=()):
+        """ Parse the recipe content into a plan that can be stored,
+            merging in the fragments it includes
+
+        :recipe: str - path to the recipe
+        :content: bytes - content of the recipe
+        :including: tuple of str - absolute paths of the recipes that
+                    include it
+        :returns: dictionary - the plan
+
+        """
+        self.logger.info('Parsing recipe %s..' % recipe)
+        entries = load_yaml(content)
+        # files other than the recipe the plan was built from
+        deps = []
+        if type(entries) is dict and INCLUDE in entries:
+            chain = including + (os.path.abspath(recipe),)
+            fragments = dict()
+            for path in included(recipe, entries):
+                if path in chain:
+                    raise ValueError('%s includes itself through %s'
+                                     % (path, ' -> '.join(chain)))
+                try:
+                    version, fragment_deps, data = self._entry(path, chain)
+                except (IOError, OSError):
+                    raise ValueError('Could not read fragment %s included by '
+                                     '%s' % (path, recipe))
+                fragment = pickle.loads(data)['entries']
+                if type(fragment) is not dict:
+                    raise ValueError('Expected fragment %s included by %s to '
+                                     'be a dictionary of entries'
+                                     % (path, recipe))
+                fragments = merge(fragments, fragment)
+                deps.append((path, file_digest(path)))
+                deps.extend(fragment_deps)
+            del entries[INCLUDE]
+            entries = merge(fragments, entries)
+        return {'version': PLAN_VERSION,
+                'recipe': recipe,
+                'deps': deps,
+                'entries': entries}
+
+    def clear(self):
+        """ Remove all plans from memory and disk """
+        self.memory.clear()
+        self.keys.clear()
+        if os.path.isdir(self.location):
+            for name in os.listdir(self.location):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.location, name))
+
+    @staticmethod
+    def key(recipe, content):
+        """ Get the key a plan is stored under
+
+        :recipe: str - path to the recipe
+        :content: bytes - content of the recipe
+        :returns: str - key
+
+        """
+        path = os.path.abspath(recipe).encode('utf-8')
+        return content_digest(b'\0'.join([str(PLAN_VERSION).encode('ascii'),
+                                          path, content]))
+
+    def _is_stale(self, version, deps):
+        """ Check whether any of the files a plan depends on changed
+
+        :version: int - version of the plan
+        :deps: list of (path, digest) tuples the plan was built from
+        :returns: bool - True if the plan needs to be rebuilt
+
+        """
+        if version != PLAN_VERSION:
+            return True
+        for path, digest in deps:
+            try:
+                if file_digest(path) != digest:
+                    return True
+            except (IOError, OSError):
+                return True
+        return False
+
+    def _path(self, key):
+        return os.path.join(self.location, '%s.json' % key)
+
+    def _is_trusted(self):
+        """ Check that only the user can write to the directory of plans
+
+        :returns: bool
+
+        """
+        try:
+            info = os.stat(self.location)
+        except (IOError, OSError):
+            return False
+        if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+            return False
+        return not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+    def _read(self, key):
+        if not self._is_trusted():
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                plan = load_plan(f.read())
+            return plan['version'], plan['deps'], \
+                pickle.dumps(plan, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # missing or corrupt plans are simply rebuilt
+            return None
+
+    def _write(self, key, plan):
+        try:
+            data = dump_plan(plan)
+        except (TypeError, ValueError) as e:
+            # it is still kept in memory
+            self.logger.info('Not storing plan on disk: %s' % e)
+            return
+        try:
+            if not os.path.isdir(self.location):
+                os.makedirs(self.location, mode=0o700)
+            if not self._is_trusted():
+                self.logger.warning('Not storing plan in %s: it is owned by '
+                                    'another user or writable by others'
+                                    % self.location)
+                return
+            # write to a temporary file and move it in place so that
+            # processes reading concurrently never see half a plan
+            fd, tmp = tempfile.mkstemp(dir=self.location, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except (IOError, OSError) as e:
+            # not being able to cache is not fatal
+            self.logger.warning('Could not store plan in %s: %s'
+                                % (self.location, e))
+
+
+class FragmentCache(RecipeCache):
+
+    """ RecipeCache that only keeps plans in the memory of this process.
+        Recipes that are not cached use it for the fragments they include
+        so that each fragment is parsed once. Only the plan of the latest
+        content of each fragment is kept. """
+
+    def __init__(self):
+        super(FragmentCache, self).__init__()
+        self.location = None
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'FragmentCache of %d plans' % len(self.memory)
+
+    def clear(self):
+        """ Remove all plans from memory """
+        self.memory.clear()
+        self.keys.clear()
+
+    def _read(self, key):
+        return None
+
+    def _write(self, key, plan):
+        pass
+
+
+_fragments = FragmentCache()
+
+
+def read_recipe(recipe, cache=None):
+    """ Read the root entries of a recipe with the fragments it includes
+        merged in
+
+    :recipe: str - path to the recipe
+    :cache: RecipeCache to get the recipe and its fragments from, or None
+            to parse the recipe and keep only its fragments in memory
+    :returns: (dictionary of root entries, list of (path, digest) of the
+              fragments it was built from)
+
+    """
+    if cache is None:
+        with open(recipe, 'rb') as f:
+            content = f.read()
+        plan = _fragments.compile(recipe, content)
+    else:
+        version, deps, data = cache._entry(recipe)
+        plan = pickle.loads(data)
+    return plan['entries'], plan['deps']
+
+
+def get_cache(cache):
+    """ Convert the cache argument accepted by from_recipe to a RecipeCache
+
+    :cache: None or False for no cache, True for the default location,
+            a str path to a directory or a RecipeCache instance
+    :returns: RecipeCache or None
+
+    """
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return default_cache()
+    if isinstance(cache, RecipeCache):
+        return cache
+    return RecipeCache(cache)
+
+
+_default_cache = None
+
+
+def default_cache():
+    """ Get the RecipeCache shared by this process
+
+    :returns: RecipeCache at the default location
+
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = RecipeCache()
+    return _default_cache
@@ -0,0 +1,384 @@
+""" compilation of recipes to python modules that build the same tictac
+
+    tictacs compile recipe.yaml writes recipe_plan.py next to the recipe.
+    The plan imports the estimators directly and calls their constructors,
+    so once python has cached its bytecode building the tictac involves no
+    yaml parsing, dynamic imports or generated code. from_recipe uses the
+    plan of a recipe instead of parsing it while the plan is up to date.
+
+    Plans are python code and are trusted like any other module: the
+    digests in their header only tell whether a plan is stale, they don't
+    protect against a plan that was edited or written by someone else.
+"""
+import os
+import ast
+import inspect
+import keyword
+import logging
+import importlib.util
+from .parse import Conjurer, resolve
+from .cache import read_recipe, content_digest, file_digest
+from .memo import MemoizedStep, signature
+from .instrument import InstrumentedStep
+
+# bump when the code we generate changes
+COMPILED_VERSION = 2
+PLAN_SUFFIX = '_plan.py'
+
+# names plans assign literals to that are checked before they are run
+HEADER = ('COMPILED_VERSION', 'RECIPE_DIGEST', 'DEPS')
+
+log = logging.getLogger(__name__)
+
+# plan modules we have imported keyed by path - (mtime, module)
+_plans = dict()
+
+
+def plan_path(recipe):
+    """ Get the path from_recipe looks for the compiled plan of a recipe at
+
+    :recipe: str - path to the recipe
+    :returns: str
+
+    """
+    return os.path.splitext(recipe)[0] + PLAN_SUFFIX
+
+
+def wrap_step(estimator, signature, path, memory, profile):
+    """ Wrap a nested estimator like Conjurer.parse_pipe does
+
+    :estimator: the estimator instance
+    :signature: str - signature of its definition
+    :path: tuple of str - labels from the root to the estimator
+    :memory: StepCache or None
+    :profile: Profile or None
+    :returns: the estimator, possibly wrapped
+
+    """
+    if memory is not None:
+        estimator = MemoizedStep(estimator, signature, memory)
+    if profile is not None:
+        estimator = InstrumentedStep(estimator, path, profile)
+    return estimator
+
+
+def _literal(value, where):
+    """ Python source for a value from the recipe """
+    source = repr(value)
+    try:
+        same = ast.literal_eval(source) == value
+    except (ValueError, SyntaxError):
+        same = False
+    if not same:
+        raise ValueError('Can not compile value %s of %s' % (source, where))
+    return source
+
+
+def _argument(key, source):
+    if key.isidentifier() and not keyword.iskeyword(key):
+        return '%s=%s' % (key, source)
+    return '**{%r: %s}' % (key, source)
+
+
+class _Generator(object):
+
+    """ Writes the code that constructs the estimators of a recipe """
+
+    def __init__(self, parser, root_entries):
+        self.parser = parser
+        # labeled estimator definitions outside the pipeline
+        self.definitions = dict()
+        # (package, name) -> name we import it as
+        self.imports = dict()
+        # label -> variable holding its instance
+        self.built = dict()
+        self.lines = []
+        for key, val in root_entries.items():
+            if key == Conjurer.PIPE or key in Conjurer.RAW:
+                continue
+            if type(val) is dict and (Conjurer.LABEL in val or
+                                      Conjurer.ESTIMATOR in val):
+                missing = Conjurer.missing_keys(val)
+                if missing:
+                    raise ValueError('Entry %s is missing the mandatory '
+                                     'keys: %s' % (key, ', '.join(missing)))
+                self._define(val)
+
+    def _define(self, yaml_dict):
+        nodes = [yaml_dict]
+        while nodes:
+            node = nodes.pop()
+            self.definitions[node[Conjurer.LABEL]] = node
+            param_keyvals = Conjurer.parse_params(
+                node.get(Conjurer.ESTIMATOR_PARAMS))
+            if param_keyvals is not None:
+                nodes.extend(entry for entry in param_keyvals[1]
+                             if type(entry) is dict and
+                             not Conjurer.missing_keys(entry))
+
+    def alias(self, package, name):
+        key = (package, name)
+        if key not in self.imports:
+            self.imports[key] = '_e%d' % len(self.imports)
+        return self.imports[key]
+
+    def node(self, entry, path):
+        """ Write the code that constructs an estimator
+
+        :entry: dictionary of its definition or its label
+        :path: tuple of str - labels of the estimators it is nested in
+        :returns: str - variable holding the instance
+
+        """
+        where = '/'.join(path) or 'the recipe'
+        if type(entry) is str:
+            if entry in self.built:
+                return self.built[entry]
+            if entry in self.definitions:
+                return self.node(self.definitions[entry], path)
+            raise ValueError('Label "%s" used in %s does not correspond to '
+                             'the declaration of an estimator'
+                             % (entry, where))
+        if type(entry) is not dict:
+            raise TypeError('Expected estimator entry in %s to be a '
+                            'dictionary or a label, instead it was of '
+                            'type %s' % (where, type(entry)))
+        missing = Conjurer.missing_keys(entry)
+        if missing:
+            raise ValueError('Estimator in %s is missing the mandatory keys: '
+                             '%s' % (where, ', '.join(missing)))
+        label = entry[Conjurer.LABEL]
+        if label in self.built:
+            # the parser checked it is defined the same way each time
+            return self.built[label]
+        params = entry.get(Conjurer.ESTIMATOR_PARAMS) or dict()
+        param_keyvals = Conjurer.parse_params(params)
+        arguments = []
+        for key, value in params.items():
+            if param_keyvals is not None and key == param_keyvals[0]:
+                children = []
+                for child in value:
+                    child_label = child if type(child) is str \
+                        else child[Conjurer.LABEL]
+                    var = self.node(child, path + (label,))
+                    self.built[child_label] = var
+                    children.append('(%r, wrap(%s, %r, %r))'
+                                    % (child_label, var,
+                                       self.parser.signatures[child_label],
+                                       path + (label, child_label)))
+                source = '[\n        %s]' % ',\n        '.join(children)
+            else:
+                source = _literal(value, '%s/%s' % (where, label))
+            arguments.append(_argument(key, source))
+        package = entry[Conjurer.ESTIMATOR_PKG]
+        name = entry[Conjurer.ESTIMATOR]
+        alias = self.alias(package, name)
+        var = 'n%d' % len(self.lines)
+        if inspect.isclass(resolve(package, name)):
+            self.lines.append('%s = %s(%s)' % (var, alias,
+                                               ', '.join(arguments)))
+        else:
+            self.lines.append('%s = FunctionWrapper(%s)'
+                              % (var, ', '.join([alias] + arguments)))
+            wrapper_params = entry.get(Conjurer.WRAPPER_PARAMS)
+            if wrapper_params:
+                self.lines.append('%s.set_execution(%s)' % (var, ', '.join(
+                    _argument(key, _literal(value, where))
+                    for key, value in wrapper_params.items())))
+        self.built[label] = var
+        return var
+
+
+def generate(recipe):
+    """ Validate a recipe and generate the source of its plan
+
+    :recipe: str - path to the recipe
+    :returns: str - python source
+
+    """
+    with open(recipe, 'rb') as f:
+        content = f.read()
+    root_entries, deps = read_recipe(recipe)
+    if type(root_entries) is not dict or Conjurer.PIPE not in root_entries:
+        raise ValueError('%s has no %s entry' % (recipe, Conjurer.PIPE))
+    # the parser checks everything can be imported and constructed
+    parser = Conjurer(recipe)
+    parsed = parser.parse()
+    generator = _Generator(parser, root_entries)
+    root = generator.node(root_entries[Conjurer.PIPE], ())
+    base = parser.class_type
+    base_alias = generator.alias(base.__module__, base.__name__)
+    instrument = root_entries.get(Conjurer.INSTRUMENT) is True
+    names = list(parsed)
+    data = [key for key in names
+            if key in root_entries and key != Conjurer.PIPE]
+
+    out = ['""" Plan compiled from %s by tictacs compile - do not edit.'
+           % os.path.basename(recipe),
+           '    Compile the recipe again after changing it. """',
+           'from tictacs.parse import create_tac',
+           'from tictacs.wrappers import FunctionWrapper',
+           'from tictacs.compile import wrap_step',
+           'from tictacs.instrument import get_profile']
+    for (package, name), alias in sorted(generator.imports.items(),
+                                         key=lambda item: item[1]):
+        out.append('from %s import %s as %s' % (package, name, alias))
+    out += ['',
+            'COMPILED_VERSION = %d' % COMPILED_VERSION,
+            'RECIPE_DIGEST = %r' % content_digest(content),
+            '# fragments the recipe includes and their digests',
+            'DEPS = %r' % (deps,),
+            'INSTRUMENT = %r' % instrument,
+            '']
+    if hasattr(base, '_get_param_names'):
+        # they become the arguments of the constructor of the plan
+        for name in names:
+            if not name.isidentifier() or keyword.iskeyword(name):
+                raise ValueError('Can not compile %s: the top level entry '
+                                 '%r is not a valid python identifier'
+                                 % (recipe, name))
+        base_params = set(base._get_param_names())
+        out += ['', 'def _init(self, %s):' % ', '.join(names)]
+        out += ['    self.%s = %s' % (name, name) for name in names]
+        super_params = [name for name in names if name in base_params]
+        if super_params:
+            out.append('    %s.__init__(self, %s)' % (
+                base_alias, ', '.join('%s=%s' % (name, name)
+                                      for name in super_params)))
+        init = '_init'
+    else:
+        init = 'None'
+    out += ['', '',
+            'def build(recipe=%r, memory=None):' % recipe,
+            '    """ Build the tictac',
+            '',
+            '    :recipe: str - path to the recipe',
+            '    :memory: StepCache to memoize the nested estimators with',
+            '    :returns: the Tictac instance',
+            '',
+            '    """',
+            '    profile = get_profile(True) if INSTRUMENT else None',
+            '',
+            '    def wrap(estimator, signature, path):',
+            '        return wrap_step(estimator, signature, path, memory, '
+            'profile)',
+            '']
+    out += ['    ' + line for lines in generator.lines
+            for line in lines.split('\n')]
+    out += ['    entries = dict()']
+    for name in names:
+        if name == Conjurer.RECIPE_LABEL:
+            out.append('    entries[%r] = recipe' % name)
+        elif name == Conjurer.PROFILE_LABEL:
+            out.append('    entries[%r] = profile' % name)
+        elif name in data:
+            out.append('    entries[%r] = %s'
+                       % (name, _literal(parsed[name], name)))
+    out += ['    entries.update(%s.get_params(deep=False))' % root,
+            '    return create_tac(%s, entries, init=%s)(**entries)'
+            % (base_alias, init),
+            '']
+    return '\n'.join(out)
+
+
+def compile_recipe(recipe, output=None):
+    """ Compile a recipe to a plan
+
+    :recipe: str - path to the recipe
+    :output: str - path to write the plan to, next to the recipe by
+             default so that from_recipe finds it
+    :returns: str - path of the plan
+
+    """
+    source = generate(recipe)
+    output = output or plan_path(recipe)
+    with open(output, 'w') as f:
+        f.write(source)
+    return output
+
+
+def _header(path):
+    """ Read the version, recipe digest and dependencies of a plan without
+        executing it
+
+    :path: str - path to the plan
+    :returns: dictionary of the names in HEADER assigned literals
+
+    """
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), path)
+    values = dict()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and \
+                isinstance(node.targets[0], ast.Name) and \
+                node.targets[0].id in HEADER:
+            try:
+                values[node.targets[0].id] = ast.literal_eval(node.value)
+            except ValueError:
+                pass
+    return values
+
+
+def _is_current(header, digest):
+    """ Check whether a plan was compiled from the current recipe
+
+    :header: dictionary of the names in HEADER
+    :digest: str - digest of the content of the recipe
+    :returns: bool
+
+    """
+    if header.get('COMPILED_VERSION') != COMPILED_VERSION or \
+            header.get('RECIPE_DIGEST') != digest:
+        return False
+    try:
+        return all(file_digest(dep) == dep_digest
+                   for dep, dep_digest in header.get('DEPS', ()))
+    except (IOError, OSError, TypeError, ValueError):
+        return False
+
+
+def load_plan(recipe):
+    """ Import the compiled plan of a recipe if there is one and it was
+        compiled from the current content of the recipe. The version and
+        digests of the plan are read without executing it, so plans of
+        other versions or recipes are never executed. The digests only
+        detect stale plans: they are not signatures, so they give no
+        integrity or security guarantee against a plan that was tampered
+        with - only keep plans where the recipes themselves are trusted.
+
+    :recipe: str - path to the recipe
+    :returns: the plan module or None
+
+    """
+    path = plan_path(recipe)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        with open(recipe, 'rb') as f:
+            digest = content_digest(f.read())
+    except (IOError, OSError):
+        return None
+    entry = _plans.get(path)
+    if entry is not None and entry[0] == mtime:
+        module = entry[1]
+        header = dict((name, getattr(module, name, None)) for name in HEADER)
+        return module if _is_current(header, digest) else None
+    try:
+        header = _header(path)
+    except (IOError, OSError, SyntaxError, ValueError) as e:
+        log.warning('Ignoring plan %s that could not be read: %s'
+                    % (path, e))
+        return None
+    if not _is_current(header, digest):
+        log.info('Ignoring plan %s compiled from another version of %s'
+                 % (path, recipe))
+        return None
+    name = '_tictacs_plan_%s' % signature(os.path.abspath(path))[:16]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except Exception as e:
+        log.warning('Ignoring plan %s that failed to import: %s' % (path, e))
+        return None
+    _plans[path] = (mtime, module)
+    return module
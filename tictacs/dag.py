@@ -0,0 +1,232 @@
+""" execution of several tictacs that share identical steps """
+import copy
+import logging
+import weakref
+from collections import OrderedDict
+
+# tictac -> TictacGroup whose step instances it uses
+_members = weakref.WeakKeyDictionary()
+
+
+class Node(object):
+
+    """ A step in the merged pipelines. Its key identifies the step and all
+        the steps upstream of it, so nodes with the same key do the same
+        work and can be shared. """
+
+    def __init__(self, key, label, estimator):
+        """ Create a node
+
+        :key: str - digest of the step and its upstream path
+        :label: str - label of the step in the first recipe that used it
+        :estimator: the estimator instance of the step
+
+        """
+        self.key = key
+        self.label = label
+        self.estimator = estimator
+        # nodes that take the output of this one as input
+        self.children = OrderedDict()
+        # names of the tictacs this node is the last step of
+        self.final = []
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'Node %s (%d children, final for %s)' \
+            % (self.label, len(self.children), self.final)
+
+
+class TictacGroup(object):
+
+    """ Several tictacs whose identical steps are merged into one execution
+        DAG. Steps with the same definition and the same upstream steps are
+        the same estimator instance in all tictacs, so fitting the group
+        fits each of them once and passes their output to the steps that
+        follow in each tictac.
+
+        Only the top level steps of the tictacs are merged - identical
+        prefixes nested in a FeatureUnion or a sub pipeline are still
+        fitted once for each tictac.
+
+        Fitting one of the tictacs on its own, or setting its parameters,
+        first gives it copies of its steps - see detach. The group keeps
+        fitting and predicting with the steps it had. """
+
+    def __init__(self):
+        # tictacs by name - usually the path of the recipe
+        self.tictacs = OrderedDict()
+        # nodes the input is passed to
+        self.roots = OrderedDict()
+        self.logger = logging.getLogger(__name__)
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'TictacGroup of %d tictacs with %d distinct steps' \
+            % (len(self.tictacs), len(self.nodes()))
+
+    def __len__(self):
+        return len(self.tictacs)
+
+    def __iter__(self):
+        return iter(self.tictacs)
+
+    def __getitem__(self, name):
+        return self.tictacs[name]
+
+    def items(self):
+        return self.tictacs.items()
+
+    def add(self, name, tictac, chain):
+        """ Add a tictac to the group, replacing its steps with identical
+            ones already in the group.
+
+        :name: str - name to refer to the tictac by
+        :tictac: the tictac instance
+        :chain: list of (key, label, estimator) tuples - the steps of the
+                tictac in order, where key identifies the step and its
+                upstream path
+
+        """
+        if name in self.tictacs:
+            raise ValueError('Tictac named %s is already part of the group'
+                             % name)
+        self.tictacs[name] = tictac
+        children = self.roots
+        node = None
+        shared = []
+        for key, label, estimator in chain:
+            node = children.get(key)
+            if node is None:
+                node = Node(key, label, estimator)
+                children[key] = node
+            else:
+                shared.append(label)
+            children = node.children
+        if node is not None:
+            node.final.append(name)
+        # make the tictac use the shared instances
+        if hasattr(tictac, 'steps'):
+            steps = []
+            node_children = self.roots
+            for (key, label, _), (step_label, _) in zip(chain, tictac.steps):
+                node = node_children[key]
+                steps.append((step_label, node.estimator))
+                node_children = node.children
+            tictac.steps = steps
+            _members[tictac] = self
+        self.logger.info('Added tictac %s sharing steps: %s' % (name, shared))
+
+    def detach(self, name):
+        """ Give a tictac copies of its steps, so that it can be fitted or
+            changed on its own without changing the other tictacs or the
+            steps the group fits and predicts with
+
+        :name: str - name of the tictac
+
+        """
+        tictac = self.tictacs[name]
+        tictac.steps = copy.deepcopy(tictac.steps)
+        _members.pop(tictac, None)
+
+    def nodes(self):
+        """ Get all distinct steps in the group
+
+        :returns: list of Node
+
+        """
+        nodes, stack = [], list(self.roots.values())
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node.children.values())
+        return nodes
+
+    def fit(self, X, y=None):
+        """ Fit all tictacs, fitting each distinct step once
+
+        :X: the input data
+        :y: the targets
+        :returns: self
+
+        """
+        for node in self.roots.values():
+            self._fit(node, X, y)
+        return self
+
+    def _fit(self, node, X, y):
+        estimator = node.estimator
+        if not node.children:
+            estimator.fit(X, y)
+            return
+        if estimator is None or estimator == 'passthrough':
+            Xt = X
+        elif hasattr(estimator, 'fit_transform'):
+            Xt = estimator.fit_transform(X, y)
+        else:
+            Xt = estimator.fit(X, y).transform(X)
+        for child in node.children.values():
+            self._fit(child, Xt, y)
+
+    def predict(self, X):
+        """ Predict with all tictacs, transforming with each distinct
+            step once
+
+        :X: the input data
+        :returns: dictionary of predictions keyed by name of the tictac
+
+        """
+        return self._apply('predict', X)
+
+    def transform(self, X):
+        """ Transform with all tictacs, transforming with each distinct
+            step once
+
+        :X: the input data
+        :returns: dictionary of outputs keyed by name of the tictac
+
+        """
+        return self._apply('transform', X)
+
+    def _apply(self, method, X):
+        results = OrderedDict((name, None) for name in self.tictacs)
+        stack = [(node, X) for node in self.roots.values()]
+        while stack:
+            node, X = stack.pop()
+            estimator = node.estimator
+            if node.final:
+                out = getattr(estimator, method)(X)
+                for name in node.final:
+                    results[name] = out
+            if node.children:
+                if estimator is None or estimator == 'passthrough':
+                    Xt = X
+                else:
+                    Xt = estimator.transform(X)
+                stack.extend((child, Xt) for child in node.children.values())
+        return results
+
+
+def detach(tictac):
+    """ Give a tictac copies of its steps if it is part of a TictacGroup.
+        Called before fitting the tictac or setting its parameters so the
+        other tictacs don't change.
+
+    :tictac: the tictac
+
+    """
+    try:
+        group = _members.get(tictac)
+    except TypeError:
+        return
+    if group is None:
+        return
+    for name, member in group.items():
+        if member is tictac:
+            group.detach(name)
+            return
@@ -0,0 +1,459 @@
+""" data sources that recipes describe and out of core training on them
+
+    The data section of a recipe describes the training data, eg:
+
+    data:
+      X:
+        source: text
+        path: texts.txt
+      y:
+        source: csv
+        path: labels.csv
+        column: label
+        dtype: int
+      chunk_size: 10000
+
+    Sources are read lazily in chunks. Relative paths are relative to the
+    recipe. If every node of the pipeline is stateless or has partial_fit
+    the tictac is trained chunk by chunk, so the data never needs to fit in
+    memory, otherwise the data is read and the tictac fitted as usual.
+"""
+import os
+import abc
+import csv
+import inspect
+import logging
+import zipfile
+import itertools
+import numpy as np
+from .wrappers import FunctionWrapper, EstimatorWrapper, Sentinel, \
+    ProfilingSentinel
+from .memo import MemoizedStep
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000
+# nodes that don't learn anything from the data
+STATELESS = (FunctionWrapper, Sentinel, ProfilingSentinel)
+
+
+class Source(abc.ABC):
+
+    """ Base of data sources - iterating over a source gives its samples,
+        chunks gives them in lists or arrays of at most chunk_size.
+        Subclasses implement _chunks. """
+
+    def __init__(self, path, dtype=None, chunk_size=CHUNK_SIZE):
+        """ Create a source
+
+        :path: str - file to read
+        :dtype: convert the samples of each chunk to an array of dtype
+        :chunk_size: int - default number of samples of each chunk
+
+        """
+        self.path = path
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return '%s of %s' % (self.__class__.__name__, self.path)
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            for sample in chunk:
+                yield sample
+
+    @abc.abstractmethod
+    def _chunks(self, size):
+        """ Read the raw samples
+
+        :size: int - samples per chunk
+        :returns: generator of lists or arrays of samples
+
+        """
+
+    def chunks(self, size=None):
+        """ Read the samples in chunks
+
+        :size: int - samples per chunk, chunk_size of the source if None
+        :returns: generator of lists or arrays of samples
+
+        """
+        for chunk in self._chunks(size or self.chunk_size):
+            if self.dtype is not None:
+                chunk = np.asarray(chunk, dtype=self.dtype)
+            yield chunk
+
+    def read(self):
+        """ Read all samples into memory
+
+        :returns: list or array of samples
+
+        """
+        chunks = list(self.chunks())
+        if chunks and isinstance(chunks[0], np.ndarray):
+            return np.concatenate(chunks)
+        return list(itertools.chain.from_iterable(chunks))
+
+
+class TextSource(Source):
+
+    """ Text file with one sample per line """
+
+    def __init__(self, path, dtype=None, chunk_size=CHUNK_SIZE,
+                 encoding='utf-8'):
+        super(TextSource, self).__init__(path, dtype, chunk_size)
+        self.encoding = encoding
+
+    def _chunks(self, size):
+        with open(self.path, encoding=self.encoding) as f:
+            lines = (line.rstrip('\r\n') for line in f)
+            while True:
+                chunk = list(itertools.islice(lines, size))
+                if not chunk:
+                    break
+                yield chunk
+
+
+class CsvSource(Source):
+
+    """ CSV file - samples are the values of one column or whole rows """
+
+    def __init__(self, path, dtype=None, chunk_size=CHUNK_SIZE,
+                 column=None, header=True, delimiter=',', encoding='utf-8'):
+        """ Create a source
+
+        :column: str name or int index of the column to read, all columns
+                 if None
+        :header: bool - whether the first row has the names of the columns
+
+        """
+        super(CsvSource, self).__init__(path, dtype, chunk_size)
+        self.column = column
+        self.header = header
+        self.delimiter = delimiter
+        self.encoding = encoding
+
+    def _chunks(self, size):
+        with open(self.path, newline='', encoding=self.encoding) as f:
+            rows = csv.reader(f, delimiter=self.delimiter)
+            index = self.column
+            if self.header:
+                names = next(rows, [])
+                if isinstance(self.column, str):
+                    if self.column not in names:
+                        raise ValueError('No column %s in %s, columns are: %s'
+                                         % (self.column, self.path,
+                                            ', '.join(names)))
+                    index = names.index(self.column)
+            while True:
+                chunk = list(itertools.islice(rows, size))
+                if not chunk:
+                    break
+                if index is not None:
+                    chunk = [row[index] for row in chunk]
+                yield chunk
+
+
+class ArraySource(Source):
+
+    """ Array in a .npy file, or in a .npz file under key. The array is
+        memory mapped unless it is compressed in the .npz file. """
+
+    def __init__(self, path, dtype=None, chunk_size=CHUNK_SIZE, key=None):
+        super(ArraySource, self).__init__(path, dtype, chunk_size)
+        self.key = key
+
+    def array(self):
+        """ Map the array
+
+        :returns: array or memmap
+
+        """
+        if not self.path.endswith('.npz'):
+            return np.load(self.path, mmap_mode='r')
+        with zipfile.ZipFile(self.path) as archive:
+            names = [name[:-4] for name in archive.namelist()
+                     if name.endswith('.npy')]
+            key = self.key
+            if key is None:
+                if len(names) != 1:
+                    raise ValueError('%s has several arrays, choose one of '
+                                     '%s with key' % (self.path,
+                                                      ', '.join(names)))
+                key = names[0]
+            info = archive.getinfo(key + '.npy')
+        if info.compress_type != zipfile.ZIP_STORED:
+            return np.load(self.path)[key]
+        with open(self.path, 'rb') as f:
+            # skip the local header of the member to get to the .npy file
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(f.read(4), '<u2')
+            f.seek(info.header_offset + 30 + int(name_length) +
+                   int(extra_length))
+            if np.lib.format.read_magic(f) == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            shape, fortran, dtype = header
+            offset = f.tell()
+        if dtype.hasobject:
+            raise ValueError('Array %s of %s holds python objects, which '
+                             'can not be read out of core'
+                             % (key, self.path))
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offset,
+                         shape=shape, order='F' if fortran else 'C')
+
+    def _chunks(self, size):
+        array = self.array()
+        for start in range(0, array.shape[0], size):
+            yield array[start:start + size]
+
+
+SOURCES = {'text': TextSource, 'csv': CsvSource, 'npy': ArraySource,
+           'npz': ArraySource}
+
+
+def get_source(definition, directory='', chunk_size=CHUNK_SIZE):
+    """ Create a source from its definition in a recipe
+
+    :definition: dictionary with the kind of source and its arguments, or
+                 just the path - the kind is then guessed from the extension
+    :directory: str - relative paths are relative to it
+    :chunk_size: int - chunk size unless the definition has its own
+    :returns: Source
+
+    """
+    if isinstance(definition, str):
+        definition = {'path': definition}
+    definition = dict(definition)
+    path = os.path.join(directory, os.path.expanduser(definition.pop('path')))
+    kind = definition.pop('source', None)
+    if kind is None:
+        extension = os.path.splitext(path)[1][1:]
+        kind = extension if extension in SOURCES else 'text'
+    if kind not in SOURCES:
+        raise ValueError('Unknown data source %s, expected one of: %s'
+                         % (kind, ', '.join(sorted(SOURCES))))
+    definition.setdefault('chunk_size', chunk_size)
+    return SOURCES[kind](path, **definition)
+
+
+class Dataset(object):
+
+    """ Samples and optionally targets read from sources in step """
+
+    def __init__(self, X, y=None, chunk_size=CHUNK_SIZE, classes=None):
+        """ Create a dataset
+
+        :X: Source of the samples
+        :y: Source of the targets or None
+        :chunk_size: int - samples per chunk
+        :classes: all the targets, found with a pass over y if needed
+
+        """
+        self.X = X
+        self.y = y
+        self.chunk_size = chunk_size
+        self.classes = classes
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'Dataset of %s and %s' % (self.X, self.y)
+
+    def chunks(self):
+        """ Read samples and targets in chunks
+
+        :returns: generator of (X chunk, y chunk) - y chunk is None if
+                  there are no targets
+        :raises: ValueError if the sources have different numbers of
+                 samples
+
+        """
+        X_chunks = self.X.chunks(self.chunk_size)
+        if self.y is None:
+            return ((X, None) for X in X_chunks)
+        return self._pairs(X_chunks, self.y.chunks(self.chunk_size))
+
+    def _pairs(self, X_chunks, y_chunks):
+        """ Pair the chunks of samples and targets, checking neither
+            source ends before the other """
+        for X in X_chunks:
+            y = next(y_chunks, None)
+            if y is None or len(y) != len(X):
+                break
+            yield X, y
+        else:
+            if next(y_chunks, None) is None:
+                return
+        raise ValueError('%s and %s have different numbers of samples'
+                         % (self.X, self.y))
+
+    def read(self):
+        """ Read all of the data
+
+        :returns: X, y
+
+        """
+        return self.X.read(), self.y.read() if self.y is not None else None
+
+    def get_classes(self):
+        """ All the distinct targets
+
+        :returns: array
+
+        """
+        if self.classes is None and self.y is not None:
+            seen = set()
+            for chunk in self.y.chunks(self.chunk_size):
+                seen.update(np.unique(np.asarray(chunk)).tolist())
+            self.classes = sorted(seen)
+        return np.asarray(self.classes) if self.classes is not None else None
+
+
+def get_dataset(definition, recipe=None):
+    """ Create a dataset from the data section of a recipe
+
+    :definition: dictionary with the X source and optionally the y source,
+                 chunk_size and classes
+    :recipe: str - path of the recipe, relative paths are relative to it
+    :returns: Dataset
+
+    """
+    if not isinstance(definition, dict) or 'X' not in definition:
+        raise ValueError('Expected the data section to have an X source')
+    directory = os.path.dirname(recipe) if recipe else ''
+    chunk_size = definition.get('chunk_size', CHUNK_SIZE)
+    X = get_source(definition['X'], directory, chunk_size)
+    y = definition.get('y')
+    if y is not None:
+        y = get_source(y, directory, chunk_size)
+    return Dataset(X, y, chunk_size, definition.get('classes'))
+
+
+def _unwrap(node):
+    while isinstance(node, EstimatorWrapper):
+        node = node.wrapped()
+    return node
+
+
+def _detach(node):
+    """ Unwrap a node that is about to be updated, giving memoized steps a
+        private copy of their fitted estimator so the cache doesn't change """
+    while isinstance(node, EstimatorWrapper):
+        if isinstance(node, MemoizedStep):
+            node.detach()
+        node = node.wrapped()
+    return node
+
+
+def _nested(node):
+    for key in ('steps', 'transformer_list'):
+        entries = getattr(node, key, None)
+        if isinstance(entries, list):
+            return key, [entry[1] for entry in entries
+                         if entry[1] not in (None, 'drop', 'passthrough')]
+    return None, None
+
+
+def _stateless(node):
+    if isinstance(node, STATELESS):
+        return True
+    try:
+        from sklearn.utils import get_tags
+        return not get_tags(node).requires_fit
+    except (ImportError, AttributeError, TypeError, ValueError):
+        return False
+
+
+def can_partial_fit(estimator):
+    """ Whether every node of an estimator is stateless or has partial_fit
+
+    :estimator: the estimator, eg: a tictac
+    :returns: bool
+
+    """
+    node = _unwrap(estimator)
+    key, children = _nested(node)
+    if key is not None:
+        return all(can_partial_fit(child) for child in children)
+    return _stateless(node) or hasattr(node, 'partial_fit')
+
+
+def _takes_classes(node):
+    return not _stateless(node) and hasattr(node, 'partial_fit') and \
+        'classes' in inspect.signature(node.partial_fit).parameters
+
+
+def takes_classes(estimator):
+    """ Whether a node of an estimator takes the classes in partial_fit,
+        eg: a classifier
+
+    :estimator: the estimator, eg: a tictac
+    :returns: bool
+
+    """
+    node = _unwrap(estimator)
+    key, children = _nested(node)
+    if key is not None:
+        return any(takes_classes(child) for child in children)
+    return _takes_classes(node)
+
+
+def partial_fit(estimator, X, y=None, classes=None, transform=False):
+    """ Update an estimator whose nodes can all partial_fit with a chunk
+
+    :estimator: the estimator, eg: a tictac
+    :X: chunk of samples
+    :y: chunk of targets
+    :classes: all the targets - passed to nodes whose partial_fit takes it
+    :transform: bool - whether to return the output of the estimator
+    :returns: the output for X if transform else None
+
+    """
+    node = _detach(estimator)
+    key, children = _nested(node)
+    if key == 'steps':
+        for i, child in enumerate(children):
+            last = i == len(children) - 1
+            X = partial_fit(child, X, y, classes, transform or not last)
+        return X if transform else None
+    if key == 'transformer_list':
+        for child in children:
+            partial_fit(child, X, y, classes)
+        return node.transform(X) if transform else None
+    if not _stateless(node):
+        kwargs = dict()
+        if classes is not None and _takes_classes(node):
+            kwargs['classes'] = classes
+        node.partial_fit(X, y, **kwargs)
+    return node.transform(X) if transform else None
+
+
+def fit_dataset(estimator, dataset, epochs=1):
+    """ Fit an estimator on a dataset, chunk by chunk if all its nodes can
+        partial_fit, otherwise on all of the data at once
+
+    :estimator: the estimator, eg: a tictac
+    :dataset: Dataset
+    :epochs: int - passes over the data when fitting chunk by chunk
+    :returns: estimator
+
+    """
+    if not can_partial_fit(estimator):
+        log.info('Not every node can partial_fit - reading %s' % dataset)
+        X, y = dataset.read()
+        return estimator.fit(X, y)
+    # only classifiers need a pass over the targets to find the classes
+    classes = dataset.get_classes() if takes_classes(estimator) else None
+    for epoch in range(epochs):
+        for X, y in dataset.chunks():
+            partial_fit(estimator, X, y, classes)
+    return estimator
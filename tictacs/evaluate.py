@@ -0,0 +1,355 @@
+""" evaluation of tictacs with k-fold or held out scoring
+
+    The evaluation section of a recipe sets how the tictac is evaluated, eg:
+
+    evaluation:
+      method: kfold
+      folds: 5
+      metrics: [accuracy, f1_macro]
+      n_jobs: 4
+      memory: /tmp/steps
+
+    Folds are evaluated in a pool of processes. Steps are memoized, so the
+    upstream steps fitted on a fold and their outputs are reused when the
+    tictac is evaluated again with only its downstream steps changed - set
+    memory to a directory for workers and later runs to share them. Test
+    samples are predicted in chunks and metrics are accumulated from counts,
+    so predictions of large test sets are never all in memory at once.
+"""
+import copy
+import time
+import logging
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .memo import StepCache, get_step_cache, memoize
+from .runner import SharedData, _data
+from .utils import take
+from .search import _init_search_worker
+from .predcache import set_cache
+from .stream import effective_n_jobs
+
+log = logging.getLogger(__name__)
+
+METHODS = ('kfold', 'holdout')
+CLASSIFICATION_METRICS = ('accuracy', 'precision_macro', 'recall_macro',
+                          'f1_macro', 'precision_micro', 'recall_micro',
+                          'f1_micro', 'precision_weighted',
+                          'recall_weighted', 'f1_weighted')
+REGRESSION_METRICS = ('mse', 'rmse', 'mae', 'r2')
+CHUNK_SIZE = 10000
+# options of the evaluation section and their defaults
+DEFAULTS = {'method': 'kfold', 'folds': 5, 'test_size': 0.25,
+            'metrics': None, 'n_jobs': 1, 'memory': None,
+            'chunk_size': CHUNK_SIZE, 'random_state': 0}
+
+# steps fitted on folds by evaluations in this process without a memory
+_memory = StepCache()
+
+
+class ConfusionCounts(object):
+
+    """ Confusion matrix of a classifier, updated a chunk at a time """
+
+    def __init__(self, labels):
+        """ Create empty counts
+
+        :labels: array of all the labels, sorted
+
+        """
+        self.labels = np.asarray(labels)
+        self.counts = np.zeros((len(labels), len(labels)), dtype=np.int64)
+
+    def _index(self, y):
+        y = np.asarray(y)
+        index = np.searchsorted(self.labels, y)
+        index[index == len(self.labels)] = 0
+        unknown = self.labels[index] != y
+        if unknown.any():
+            raise ValueError('Unknown labels: %s' % np.unique(y[unknown]))
+        return index
+
+    def update(self, y_true, y_pred):
+        """ Count a chunk of predictions
+
+        :y_true: the targets
+        :y_pred: the predictions
+
+        """
+        np.add.at(self.counts, (self._index(y_true), self._index(y_pred)), 1)
+
+    def merge(self, other):
+        """ Add the counts of other to these
+
+        :returns: self
+
+        """
+        self.counts += other.counts
+        return self
+
+    def metrics(self, names):
+        """ Compute metrics from the counts
+
+        :names: list of str - see CLASSIFICATION_METRICS
+        :returns: dictionary of name -> value
+
+        """
+        counts = self.counts.astype(np.float64)
+        tp = np.diag(counts)
+        true = counts.sum(axis=1)
+        predicted = counts.sum(axis=0)
+        total = counts.sum()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(predicted > 0, tp / predicted, 0.)
+            recall = np.where(true > 0, tp / true, 0.)
+            f1 = np.where(precision + recall > 0,
+                          2 * precision * recall / (precision + recall), 0.)
+        # macro averages are over the labels that occur
+        present = (true + predicted) > 0
+        weights = true / total if total else true
+        accuracy = tp.sum() / total if total else 0.
+        values = {'accuracy': accuracy}
+        for name, per_label in (('precision', precision), ('recall', recall),
+                                ('f1', f1)):
+            values[name + '_macro'] = per_label[present].mean() \
+                if present.any() else 0.
+            # every sample has one label, so micro averages are accuracy
+            values[name + '_micro'] = accuracy
+            values[name + '_weighted'] = (per_label * weights).sum()
+        return dict((name, float(values[name])) for name in names)
+
+
+class ErrorSums(object):
+
+    """ Sums of the errors of a regressor, updated a chunk at a time """
+
+    def __init__(self):
+        self.n = 0
+        self.squared = 0.
+        self.absolute = 0.
+        self.total = 0.
+        self.total_squared = 0.
+
+    def update(self, y_true, y_pred):
+        """ Add the errors of a chunk of predictions
+
+        :y_true: the targets
+        :y_pred: the predictions
+
+        """
+        y_true = np.asarray(y_true, dtype=np.float64)
+        errors = y_true - np.asarray(y_pred, dtype=np.float64)
+        self.n += len(y_true)
+        self.squared += float(np.dot(errors, errors))
+        self.absolute += float(np.abs(errors).sum())
+        self.total += float(y_true.sum())
+        self.total_squared += float(np.dot(y_true, y_true))
+
+    def merge(self, other):
+        """ Add the sums of other to these
+
+        :returns: self
+
+        """
+        for key in ('n', 'squared', 'absolute', 'total', 'total_squared'):
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+        return self
+
+    def metrics(self, names):
+        """ Compute metrics from the sums
+
+        :names: list of str - see REGRESSION_METRICS
+        :returns: dictionary of name -> value
+
+        """
+        n = max(self.n, 1)
+        variance = self.total_squared - self.total ** 2 / n
+        values = {'mse': self.squared / n,
+                  'rmse': (self.squared / n) ** .5,
+                  'mae': self.absolute / n,
+                  'r2': 1. - self.squared / variance if variance > 0
+                  else 0.}
+        return dict((name, float(values[name])) for name in names)
+
+
+def get_options(evaluation=None, **overrides):
+    """ Combine the evaluation section of a recipe with the defaults
+
+    :evaluation: dictionary - the evaluation section
+    :overrides: options that take precedence over the section
+    :returns: dictionary of options
+
+    """
+    options = dict(DEFAULTS)
+    options.update(evaluation or dict())
+    options.update((key, value) for key, value in overrides.items()
+                   if value is not None)
+    unknown = set(options) - set(DEFAULTS)
+    if unknown:
+        raise ValueError('Unknown evaluation options: %s, expected: %s'
+                         % (', '.join(sorted(unknown)),
+                            ', '.join(sorted(DEFAULTS))))
+    if options['method'] not in METHODS:
+        raise ValueError('Unknown evaluation method %s, expected one of: %s'
+                         % (options['method'], ', '.join(METHODS)))
+    return options
+
+
+def score_chunks(estimator, chunks, counts):
+    """ Predict chunks of samples and update counts with the predictions
+
+    :estimator: the fitted estimator
+    :chunks: iterable of (X, y) chunks, eg: Dataset.chunks()
+    :counts: ConfusionCounts or ErrorSums
+    :returns: counts
+
+    """
+    for X, y in chunks:
+        counts.update(y, estimator.predict(X))
+    return counts
+
+
+def _chunks(X, y, indices, chunk_size):
+    for start in range(0, len(indices), chunk_size):
+        chunk = indices[start:start + chunk_size]
+        yield take(X, chunk), take(y, chunk)
+
+
+def _evaluate_fold(estimator, X, y, fold, train, test, labels, chunk_size):
+    """ Fit a clone of the estimator on the train samples of a fold and
+        count its errors on the test samples
+
+    :returns: dictionary with the fold, counts, timings and error
+
+    """
+    from sklearn.base import clone
+    result = {'fold': fold, 'n_train': len(train), 'n_test': len(test),
+              'counts': None, 'fit_time': 0., 'score_time': 0.,
+              'error': None}
+    try:
+        start = time.time()
+        model = clone(estimator)
+        # the samples of the folds are not worth remembering
+        set_cache(model, None)
+        model.fit(take(X, train), take(y, train))
+        scored = time.time()
+        counts = ConfusionCounts(labels) if labels is not None \
+            else ErrorSums()
+        score_chunks(model, _chunks(X, y, test, chunk_size), counts)
+        result['counts'] = counts
+        result['fit_time'] = scored - start
+        result['score_time'] = time.time() - scored
+    except Exception:
+        result['error'] = traceback.format_exc()
+    return result
+
+
+def _evaluate_shared(fold, train, test, labels, chunk_size):
+    """ Evaluate a fold on the data shared with the worker """
+    return _evaluate_fold(_data['estimator'], _data['X'], _data.get('y'),
+                          fold, train, test, labels, chunk_size)
+
+
+def evaluate(estimator, X, y, evaluation=None, **overrides):
+    """ Evaluate an estimator with k-fold or held out scoring
+
+    :estimator: a tictac or the path of a recipe
+    :X: the data
+    :y: the targets
+    :evaluation: dictionary of options, the evaluation section of the
+                 recipe by default:
+                 method - 'kfold' or 'holdout'
+                 folds - int number of folds of kfold
+                 test_size - float share of samples held out by holdout
+                 metrics - list of str, see CLASSIFICATION_METRICS and
+                           REGRESSION_METRICS
+                 n_jobs - int number of processes to evaluate folds in,
+                          -1 for one per cpu
+                 memory - where to cache fitted steps and their outputs,
+                          see memo.get_step_cache
+                 chunk_size - int number of test samples to predict at once
+                 random_state - int seed of the splits
+    :overrides: options that take precedence over evaluation
+    :returns: dictionary with the mean and std of each metric over the
+              folds, the metrics of the pooled counts of all folds and the
+              results of each fold
+
+    """
+    from sklearn.base import clone, is_classifier
+    from sklearn.model_selection import KFold, StratifiedKFold, \
+        ShuffleSplit, StratifiedShuffleSplit
+    if isinstance(estimator, str):
+        from .parse import from_recipe
+        estimator = from_recipe(estimator)
+    if evaluation is None:
+        evaluation = getattr(estimator, 'evaluation', None)
+    options = get_options(evaluation, **overrides)
+    y_all = np.asarray(y)
+    classifier = is_classifier(estimator)
+    labels = np.unique(y_all) if classifier else None
+    metrics = options['metrics'] or (['accuracy', 'f1_macro'] if classifier
+                                     else ['r2', 'mse'])
+    known = CLASSIFICATION_METRICS if classifier else REGRESSION_METRICS
+    unknown = [name for name in metrics if name not in known]
+    if unknown:
+        raise ValueError('Unknown metrics: %s, expected some of: %s'
+                         % (', '.join(unknown), ', '.join(known)))
+    seed = options['random_state']
+    if options['method'] == 'kfold':
+        splitter = StratifiedKFold if classifier else KFold
+        splitter = splitter(n_splits=options['folds'], shuffle=True,
+                            random_state=seed)
+    else:
+        splitter = StratifiedShuffleSplit if classifier else ShuffleSplit
+        splitter = splitter(n_splits=1, test_size=options['test_size'],
+                            random_state=seed)
+    folds = list(splitter.split(np.zeros(len(y_all)),
+                                y_all if classifier else None))
+    memory = get_step_cache(options['memory']) or _memory
+    memoized = memoize(clone(estimator), memory)
+    chunk_size = options['chunk_size']
+
+    results = []
+    n_jobs = min(effective_n_jobs(options['n_jobs']), len(folds))
+    if n_jobs == 1:
+        for fold, (train, test) in enumerate(folds):
+            results.append(_evaluate_fold(memoized, X, y, fold, train, test,
+                                          labels, chunk_size))
+    else:
+        shared = SharedData(X=X, y=y)
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs,
+                                     initializer=_init_search_worker,
+                                     initargs=(shared, memoized)) as pool:
+                futures = [pool.submit(_evaluate_shared, fold, train, test,
+                                       labels, chunk_size)
+                           for fold, (train, test) in enumerate(folds)]
+                for future in as_completed(futures):
+                    results.append(future.result())
+        finally:
+            shared.cleanup()
+    results.sort(key=lambda result: result['fold'])
+
+    pooled = None
+    for result in results:
+        if result['error'] is not None:
+            log.error('Fold %d failed:\n%s' % (result['fold'],
+                                               result['error']))
+            continue
+        result['metrics'] = result['counts'].metrics(metrics)
+        if pooled is None:
+            pooled = copy.deepcopy(result['counts'])
+        else:
+            pooled.merge(result['counts'])
+    scored = [result['metrics'] for result in results
+              if result['error'] is None]
+    output = {'folds': [dict((key, value) for key, value in result.items()
+                             if key != 'counts') for result in results],
+              'metrics': dict(), 'std': dict(), 'pooled': dict()}
+    if scored:
+        for name in metrics:
+            values = [fold_metrics[name] for fold_metrics in scored]
+            output['metrics'][name] = float(np.mean(values))
+            output['std'][name] = float(np.std(values))
+        output['pooled'] = pooled.metrics(metrics)
+    return output
@@ -0,0 +1,299 @@
+""" timing and memory instrumentation of every node of a pipeline """
+import json
+import time
+import functools
+import threading
+import tracemalloc
+from .metrics import describe
+from .wrappers import EstimatorWrapper
+
+# methods we time - anything else is passed to the estimator untimed
+METHODS = ('fit', 'fit_transform', 'transform', 'predict')
+
+
+class Profile(object):
+
+    """ Statistics of calls to the nodes of a pipeline, keyed by the path
+        of labels from the root of the pipeline to the node. Nodes running
+        in other processes (eg: FeatureUnion with n_jobs > 1 on a process
+        backend) record to a copy of the profile that is lost. """
+
+    def __init__(self, trace_memory=False):
+        """ Create an empty profile
+
+        :trace_memory: bool - start tracemalloc so that the allocations of
+                       each call are recorded. Slows down python code.
+
+        """
+        # path tuple -> method -> dictionary of statistics
+        self.stats = dict()
+        self.lock = threading.Lock()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'Profile of %d nodes' % len(self.stats)
+
+    def __deepcopy__(self, memo):
+        """ Copies of the pipeline (eg: clones) record to the same profile """
+        return self
+
+    def __getstate__(self):
+        return {'stats': self.stats}
+
+    def __setstate__(self, state):
+        self.stats = state['stats']
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """ Forget all statistics """
+        with self.lock:
+            self.stats.clear()
+
+    def record(self, path, method, wall, alloc, X, out):
+        """ Record a call to a node
+
+        :path: tuple of str - labels from the root to the node
+        :method: str - name of the method called
+        :wall: float - seconds the call took
+        :alloc: int - bytes allocated during the call or None if unknown
+        :X: the input of the call
+        :out: the output of the call
+
+        """
+        x_info = describe(X)
+        out_info = describe(out) if out is not None else {}
+        with self.lock:
+            node = self.stats.setdefault(tuple(path), dict())
+            entry = node.setdefault(method, {'calls': 0, 'wall': 0.,
+                                             'alloc': None,
+                                             'rows_in': 0, 'bytes_in': 0,
+                                             'rows_out': 0, 'bytes_out': 0})
+            entry['calls'] += 1
+            entry['wall'] += wall
+            if alloc is not None:
+                entry['alloc'] = (entry['alloc'] or 0) + alloc
+            entry['rows_in'] += x_info.get('rows', 0)
+            entry['bytes_in'] += x_info.get('nbytes', 0)
+            entry['rows_out'] += out_info.get('rows', 0)
+            entry['bytes_out'] += out_info.get('nbytes', 0)
+
+    def report(self):
+        """ Get the statistics as a tree keyed by label. Each node has its
+            statistics per method and its children.
+
+        :returns: dictionary
+
+        """
+        tree = dict()
+        with self.lock:
+            for path in sorted(self.stats):
+                children = tree
+                for label in path:
+                    node = children.setdefault(label, {'methods': dict(),
+                                                       'children': dict()})
+                    children = node['children']
+                node['methods'] = dict((method, dict(entry)) for method, entry
+                                       in self.stats[path].items())
+        return tree
+
+    def to_json(self, indent=2):
+        """ Get the report as json
+
+        :returns: str
+
+        """
+        return json.dumps(self.report(), indent=indent, sort_keys=True)
+
+    def to_folded(self):
+        """ Get the wall time spent in each node, excluding the time spent
+            in its children, in the folded stack format flame graph tools
+            read: one line per node with labels separated by ; followed by
+            microseconds.
+
+        :returns: str
+
+        """
+        lines = []
+
+        def walk(prefix, children):
+            for label, node in sorted(children.items()):
+                path = prefix + [label.replace(';', ':')]
+                total = sum(entry['wall']
+                            for entry in node['methods'].values())
+                nested = sum(entry['wall']
+                             for child in node['children'].values()
+                             for entry in child['methods'].values())
+                own = total - nested if node['methods'] else 0.
+                if own > 0:
+                    lines.append('%s %d' % (';'.join(path),
+                                            round(own * 1e6)))
+                walk(path, node['children'])
+        walk([], self.report())
+        return '\n'.join(lines)
+
+
+def _timed(profile, path, method, call, X, *args, **kwargs):
+    """ Call a method of a node and record the call in a profile
+
+    :profile: Profile to record the call in
+    :path: tuple of str - labels from the root to the node
+    :method: str - name of the method
+    :call: the bound method
+    :returns: what the method returns
+
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    out = call(X, *args, **kwargs)
+    wall = time.perf_counter() - start
+    alloc = tracemalloc.get_traced_memory()[0] - before \
+        if tracing else None
+    # fit returns the estimator - not interesting as output
+    profile.record(path, method, wall, alloc, X,
+                   None if method == 'fit' else out)
+    return out
+
+
+class InstrumentedStep(EstimatorWrapper):
+
+    """ Wraps a node of a pipeline so that calls to fit, fit_transform,
+        transform and predict are recorded in a Profile. """
+
+    def __init__(self, estimator, path, profile):
+        """ Wrap a node
+
+        :estimator: the estimator instance of the node
+        :path: tuple of str - labels from the root to the node
+        :profile: Profile to record calls in
+
+        """
+        super(InstrumentedStep, self).__init__(estimator)
+        self.path = tuple(path)
+        self.profile = profile
+
+    def __sklearn_clone__(self):
+        """ Clone the wrapped estimator but keep recording to the profile """
+        from sklearn.base import clone
+        return InstrumentedStep(clone(self.estimator), self.path,
+                                self.profile)
+
+    def _call(self, method, X, *args, **kwargs):
+        return _timed(self.profile, self.path, method,
+                      getattr(self.estimator, method), X, *args, **kwargs)
+
+    def fit(self, X, y=None, **fit_params):
+        self._call('fit', X, y, **fit_params)
+        return self
+
+    @property
+    def fit_transform(self):
+        """ Only available if the wrapped estimator can transform """
+        self.estimator.transform
+        return self._fit_transform
+
+    def _fit_transform(self, X, y=None, **fit_params):
+        if hasattr(self.estimator, 'fit_transform'):
+            return self._call('fit_transform', X, y, **fit_params)
+        self.fit(X, y, **fit_params)
+        return self._call('transform', X)
+
+    @property
+    def transform(self):
+        """ Only available if the wrapped estimator can transform """
+        self.estimator.transform
+        return self._transform
+
+    def _transform(self, X):
+        return self._call('transform', X)
+
+    @property
+    def predict(self):
+        """ Only available if the wrapped estimator can predict """
+        self.estimator.predict
+        return self._predict
+
+    def _predict(self, X):
+        return self._call('predict', X)
+
+
+def root_path(tictac):
+    """ Get the path the calls to a tictac itself are recorded under - the
+        label of the root of the pipeline its instrumented steps know
+
+    :tictac: the tictac
+    :returns: tuple of str
+
+    """
+    for key in ('steps', 'transformer_list'):
+        for entry in getattr(tictac, key, None) or ():
+            if isinstance(entry[1], InstrumentedStep):
+                return entry[1].path[:-1]
+    return (type(tictac).__mro__[1].__name__,)
+
+
+class RootMethod(object):
+
+    """ Descriptor that records the calls to a method of an instrumented
+        tictac in its profile, so the report has the time spent in the
+        tictac itself and not only in its steps. Tictacs that are not
+        instrumented call the method directly. """
+
+    def __init__(self, name, method):
+        """ Wrap a method
+
+        :name: str - name of the method
+        :method: the method or descriptor, eg: that of the base class
+
+        """
+        self.name = name
+        self.method = method
+        self.__doc__ = getattr(method, '__doc__', None)
+
+    def __get__(self, obj, owner=None):
+        bound = self.method.__get__(obj, owner)
+        profile = getattr(obj, 'profile', None) if obj is not None else None
+        if not isinstance(profile, Profile):
+            return bound
+        path = root_path(obj)
+
+        @functools.wraps(bound)
+        def timed(X, *args, **kwargs):
+            return _timed(profile, path, self.name, bound, X, *args,
+                          **kwargs)
+        return timed
+
+
+def add_root_methods(cls):
+    """ Record the calls to the timed methods of a tictac class when its
+        instances are instrumented
+
+    :cls: the tictac class
+
+    """
+    for name in METHODS:
+        for klass in cls.__mro__:
+            if name in vars(klass):
+                setattr(cls, name, RootMethod(name, vars(klass)[name]))
+                break
+
+
+def get_profile(instrument):
+    """ Convert the instrument argument accepted by from_recipe to a Profile
+
+    :instrument: None or False for no instrumentation, True for a new
+                 Profile that traces memory or a Profile to record to
+    :returns: Profile or None
+
+    """
+    if instrument is None or instrument is False:
+        return None
+    if isinstance(instrument, Profile):
+        return instrument
+    return Profile(trace_memory=True)
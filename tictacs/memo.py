@@ -0,0 +1,504 @@
+""" memoization of the outputs of pipeline steps. Steps are keyed by the
+    content of their input and a signature of their definition so that
+    identical steps are only fitted once even across different recipes """
+import os
+import copy
+import json
+import pickle
+import hashlib
+import logging
+import weakref
+import tempfile
+from collections import OrderedDict
+from .wrappers import EstimatorWrapper
+
+# marker for things that are not in the cache
+_missing = object()
+
+
+def canonical(obj):
+    """ Get a deterministic string representation of yaml like data
+
+    :obj: the data - dicts, lists and scalars
+    :returns: str
+
+    """
+    return json.dumps(obj, sort_keys=True, default=repr)
+
+
+def signature(*parts):
+    """ Combine strings into a short hex digest
+
+    :parts: str - the parts to combine
+    :returns: str - hex digest
+
+    """
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class _KnownDigests(object):
+
+    """ Remembers the digests of the last few objects the memoized steps
+        produced so that the next step doesn't need to hash their content.
+        Objects are only held by weak reference if they support it. """
+
+    def __init__(self, size=16):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def add(self, obj, digest):
+        try:
+            ref = weakref.ref(obj)
+        except TypeError:
+            # eg: lists - keep them alive so their id can't be reused
+            ref = (lambda obj: lambda: obj)(obj)
+        self.entries[id(obj)] = (ref, digest)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def get(self, obj):
+        entry = self.entries.get(id(obj))
+        if entry is not None and entry[0]() is obj:
+            return entry[1]
+        return None
+
+
+_known = _KnownDigests()
+
+
+def digest(data):
+    """ Hash the content of data. Numpy arrays, scipy sparse matrices, and
+        sequences of strings are hashed directly, anything else is pickled.
+
+    :data: the data to hash
+    :returns: str - hex digest
+
+    """
+    known = _known.get(data)
+    if known is not None:
+        return known
+    h = hashlib.blake2b(digest_size=20)
+    h.update(type(data).__name__.encode('utf-8'))
+    if data is None:
+        pass
+    elif hasattr(data, 'indptr') and hasattr(data, 'indices'):
+        # scipy csr / csc matrices
+        h.update(('%s %s' % (data.format, data.shape)).encode('utf-8'))
+        for arr in (data.indptr, data.indices, data.data):
+            _update_array(h, arr)
+    elif hasattr(data, 'tocsr') and hasattr(data, 'nnz'):
+        # other scipy sparse formats
+        return digest(data.tocsr())
+    elif hasattr(data, 'dtype') and hasattr(data, 'shape') \
+            and data.dtype != object:
+        _update_array(h, data)
+    elif isinstance(data, (list, tuple)) and \
+            all(isinstance(item, str) for item in data):
+        # join chunks of documents - much faster than hashing one by one
+        for start in range(0, len(data), 4096):
+            chunk = data[start:start + 4096]
+            h.update(repr([len(item) for item in chunk]).encode('utf-8'))
+            h.update(''.join(chunk).encode('utf-8', 'surrogatepass'))
+    else:
+        h.update(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    return h.hexdigest()
+
+
+def _update_array(h, arr):
+    h.update(('%s %s' % (arr.dtype.str, arr.shape)).encode('utf-8'))
+    if not arr.flags['C_CONTIGUOUS']:
+        arr = arr.copy(order='C')
+    # view as bytes so that any dtype can be passed as a buffer
+    h.update(arr.reshape(-1).view('u1'))
+
+
+def nbytes(obj):
+    """ Rough estimate of the memory used by an object
+
+    :obj: the object
+    :returns: int - number of bytes
+
+    """
+    if hasattr(obj, 'nbytes'):
+        return obj.nbytes
+    if hasattr(obj, 'indptr'):
+        return sum(arr.nbytes for arr in (obj.data, obj.indices, obj.indptr))
+    if isinstance(obj, (list, tuple)):
+        return sum(len(item) for item in obj
+                   if isinstance(item, (str, bytes))) + 8 * len(obj)
+    return 0
+
+
+class StepCache(object):
+
+    """ Two level cache for fitted steps and their outputs. The most
+        recently used entries are kept in memory, and all entries are pickled
+        to a directory on disk if a location is given. Both levels evict
+        the least recently used entries when they grow beyond their size.
+        Entries are not copied - copying a fitted step can cost as much as
+        fitting it - so values that were stored or looked up are shared with
+        the cache and must not be modified, see MemoizedStep.detach. """
+
+    def __init__(self, location=None, max_bytes=2 ** 30,
+                 memory_bytes=2 ** 28):
+        """ Create a cache for step outputs
+
+        :location: str - directory to store entries in or None to only
+                   keep them in memory
+        :max_bytes: int - size the directory is allowed to grow to
+        :memory_bytes: int - size the in memory entries are allowed to
+                       grow to
+
+        """
+        self.location = location
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger(__name__)
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'StepCache at: %s (hits: %d, misses: %d)' \
+            % (self.location, self.hits, self.misses)
+
+    def __getstate__(self):
+        """ Only the configuration is pickled - eg: when sent to a worker
+            process the worker starts with an empty memory level """
+        return {'location': self.location,
+                'max_bytes': self.max_bytes,
+                'memory_bytes': self.memory_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __deepcopy__(self, memo):
+        """ Copies of the steps (eg: clones) keep sharing the cache """
+        return self
+
+    def get(self, key, default=None):
+        """ Look up an entry
+
+        :key: str - key of the entry
+        :default: returned if there is no such entry
+        :returns: the entry
+
+        """
+        value = self._memory.get(key, _missing)
+        if value is not _missing:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return value[0]
+        if self.location is not None:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                value = pickle.loads(data)
+                # mark as recently used for eviction
+                os.utime(path, None)
+            except (IOError, OSError, EOFError, pickle.UnpicklingError):
+                value = _missing
+            if value is not _missing:
+                self._remember(key, value, len(data))
+                self.hits += 1
+                return value
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        """ Store an entry
+
+        :key: str - key of the entry
+        :value: the entry - must be picklable if the cache has a location
+
+        """
+        size = None
+        if self.location is not None:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            size = len(data)
+            try:
+                if not os.path.isdir(self.location):
+                    os.makedirs(self.location)
+                fd, tmp = tempfile.mkstemp(dir=self.location, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, self._path(key))
+                self._evict()
+            except (IOError, OSError) as e:
+                self.logger.warning('Could not store step in %s: %s'
+                                    % (self.location, e))
+        self._remember(key, value, size)
+
+    def clear(self):
+        """ Remove all entries from memory and disk """
+        self._memory.clear()
+        self._memory_size = 0
+        for path, _, _ in self._files():
+            os.remove(path)
+
+    def _remember(self, key, value, size=None):
+        if size is None:
+            size = nbytes(value)
+        if size > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= self._memory.pop(key)[1]
+        self._memory[key] = (value, size)
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            _, (_, old_size) = self._memory.popitem(last=False)
+            self._memory_size -= old_size
+
+    def _path(self, key):
+        return os.path.join(self.location, '%s.step' % key)
+
+    def _files(self):
+        """ List (path, size, mtime) of the entries on disk """
+        if self.location is None or not os.path.isdir(self.location):
+            return []
+        files = []
+        for name in os.listdir(self.location):
+            if name.endswith('.step'):
+                path = os.path.join(self.location, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((path, st.st_size, st.st_mtime))
+        return files
+
+    def _evict(self):
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        # least recently used first
+        for path, size, _ in sorted(files, key=lambda f: f[2]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def get_step_cache(memory):
+    """ Convert the memory argument accepted by from_recipe to a StepCache
+
+    :memory: None for no cache, a str path to a directory or a StepCache
+    :returns: StepCache or None
+
+    """
+    if memory is None or memory is False:
+        return None
+    if isinstance(memory, StepCache):
+        return memory
+    return StepCache(memory)
+
+
+def definition_digest(step):
+    """ Digest the unfitted definition of a step. Steps that can't be
+        pickled, eg: FunctionWrappers around lambdas or local functions,
+        are described by their parameters instead. The repr of such
+        functions contains their address, so their steps are only
+        shared within one process.
+
+    :step: the estimator of the step
+    :returns: str - hex digest
+
+    """
+    try:
+        return digest(step)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return signature(type(step).__module__, type(step).__name__,
+                         canonical(step.get_params(deep=True)))
+
+
+def memoize(estimator, cache):
+    """ Wrap the steps of a pipeline or feature union, including nested
+        ones, in MemoizedSteps. Steps that are already memoized are kept.
+        The signature of a step is the digest of its unfitted definition.
+
+    :estimator: the estimator - modified in place
+    :cache: StepCache to store fitted steps and outputs in
+    :returns: estimator
+
+    """
+    for key in ('steps', 'transformer_list'):
+        entries = getattr(estimator, key, None)
+        if not isinstance(entries, list):
+            continue
+        wrapped = []
+        for entry in entries:
+            label, step = entry[0], entry[1]
+            if not isinstance(step, MemoizedStep) and \
+                    hasattr(step, 'get_params'):
+                step = MemoizedStep(memoize(step, cache),
+                                    definition_digest(step), cache)
+            wrapped.append((label, step) + tuple(entry[2:]))
+        estimator.set_params(**{key: wrapped})
+    return estimator
+
+
+class MemoizedStep(EstimatorWrapper):
+
+    """ Wraps a step of a pipeline so that fitting it and transforming
+        with it are looked up in a StepCache first. Entries are keyed by the
+        signature of the step's definition and the digest of its input.
+        Outputs are registered with the digest they were stored under so the
+        next step down the pipeline doesn't need to hash them, which
+        means keys also capture the chain of upstream steps. """
+
+    def __init__(self, estimator, signature, cache):
+        """ Wrap a step
+
+        :estimator: the estimator instance of the step
+        :signature: str - digest of the step's definition in the recipe
+        :cache: StepCache to store fitted steps and outputs in
+
+        """
+        super(MemoizedStep, self).__init__(estimator)
+        self.signature = signature
+        self.cache = cache
+        # parameters changed through set_params since we were created
+        self.overrides = dict()
+
+    def __sklearn_clone__(self):
+        """ Clone the wrapped estimator but keep the same cache """
+        from sklearn.base import clone
+        step = MemoizedStep(clone(self.estimator), self.signature, self.cache)
+        step.overrides = dict(self.overrides)
+        return step
+
+    def set_params(self, **params):
+        """ Set parameters of the wrapped estimator. They change the key
+            of the step so they are remembered.
+
+        :returns: self
+
+        """
+        self.estimator.set_params(**params)
+        self.overrides.update(params)
+        return self
+
+    def current_signature(self):
+        """ Signature of the step taking into account parameters that
+            changed since it was parsed, including those of nested steps
+
+        :returns: str - hex digest
+
+        """
+        parts = [self.signature, canonical(sorted(self.overrides.items()))]
+        params = self.estimator.get_params(deep=False)
+        for key in sorted(params):
+            value = params[key]
+            if isinstance(value, (list, tuple)):
+                for item in value:
+                    if isinstance(item, (list, tuple)):
+                        item = item[-1]
+                    if isinstance(item, MemoizedStep):
+                        parts.append(item.current_signature())
+        return signature(*parts)
+
+    def detach(self):
+        """ Give the step a private copy of its fitted estimator, which is
+            shared with the cache, so that it can be modified in place. The
+            copy no longer matches its key, so its outputs aren't cached.
+
+        :returns: self
+
+        """
+        if getattr(self, 'fit_key_', None) is not None:
+            self.estimator_ = copy.deepcopy(self.estimator_)
+            self.fit_key_ = None
+        return self
+
+    def _fit_key(self, X, y, fit_params):
+        parts = ['fit', self.current_signature(), digest(X), digest(y)]
+        if fit_params:
+            parts.append(digest(sorted(fit_params.items())))
+        return signature(*parts)
+
+    def fit(self, X, y=None, **fit_params):
+        """ Fit the step or load the fitted step from the cache
+
+        :returns: self
+
+        """
+        key = self._fit_key(X, y, fit_params)
+        fitted = self.cache.get(key, _missing)
+        if fitted is _missing:
+            # fit a copy so entries in the cache are never refitted
+            fitted = copy.deepcopy(self.estimator)
+            fitted.fit(X, y, **fit_params)
+            self.cache.set(key, fitted)
+        self.estimator_ = fitted
+        self.fit_key_ = key
+        return self
+
+    @property
+    def fit_transform(self):
+        """ Only available if the wrapped estimator can transform """
+        self.wrapped().transform
+        return self._fit_transform
+
+    def _fit_transform(self, X, y=None, **fit_params):
+        """ Fit the step and transform X, using the cache for both
+
+        :returns: transformed X
+
+        """
+        key = self._fit_key(X, y, fit_params)
+        out_key = signature('output', key)
+        Xt = self.cache.get(out_key, _missing)
+        if Xt is not _missing:
+            fitted = self.cache.get(key, _missing)
+            if fitted is not _missing:
+                self.estimator_ = fitted
+                self.fit_key_ = key
+                _known.add(Xt, out_key)
+                return Xt
+        fitted = copy.deepcopy(self.estimator)
+        if hasattr(fitted, 'fit_transform'):
+            Xt = fitted.fit_transform(X, y, **fit_params)
+        else:
+            Xt = fitted.fit(X, y, **fit_params).transform(X)
+        self.cache.set(key, fitted)
+        self.cache.set(out_key, Xt)
+        self.estimator_ = fitted
+        self.fit_key_ = key
+        _known.add(Xt, out_key)
+        return Xt
+
+    @property
+    def transform(self):
+        """ Only available if the wrapped estimator can transform """
+        self.wrapped().transform
+        return self._transform
+
+    def _transform(self, X):
+        """ Transform X with the fitted step, using the cache if the step
+            was fitted through it
+
+        :returns: transformed X
+
+        """
+        fit_key = getattr(self, 'fit_key_', None)
+        if fit_key is None:
+            return self.wrapped().transform(X)
+        key = signature('transform', fit_key, digest(X))
+        Xt = self.cache.get(key, _missing)
+        if Xt is _missing:
+            Xt = self.estimator_.transform(X)
+            self.cache.set(key, Xt)
+        _known.add(Xt, key)
+        return Xt
@@ -0,0 +1,159 @@
+""" cheap structured metrics about data flowing through a pipeline and
+    sinks to send them to """
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+
+def describe(X, sample=100):
+    """ Describe data without looking at all of it. The memory footprint of
+        sequences of python objects is estimated from a sample of them.
+
+    :X: the data - an array, sparse matrix or sequence
+    :sample: int - number of elements to sample from sequences
+    :returns: dictionary with rows, type, dtype, shape, nnz, density and
+              nbytes where they make sense
+
+    """
+    info = {'type': type(X).__name__}
+    shape = getattr(X, 'shape', None)
+    if shape is not None:
+        info['shape'] = list(shape)
+        info['rows'] = shape[0] if shape else 1
+        dtype = getattr(X, 'dtype', None)
+        info['dtype'] = str(dtype) if dtype is not None else None
+    if hasattr(X, 'nnz'):
+        # scipy sparse matrix
+        info['nnz'] = X.nnz
+        cells = shape[0] * shape[1] if len(shape) == 2 else 0
+        info['density'] = float(X.nnz) / cells if cells else 0.
+        info['nbytes'] = sum(getattr(X, attr).nbytes
+                             for attr in ('data', 'indices', 'indptr',
+                                          'row', 'col')
+                             if hasattr(getattr(X, attr, None), 'nbytes'))
+    elif hasattr(X, 'nbytes'):
+        info['nbytes'] = X.nbytes
+    elif hasattr(X, '__len__'):
+        rows = len(X)
+        info['rows'] = rows
+        if rows and isinstance(X, (list, tuple)):
+            step = max(1, rows // sample)
+            items = X[::step][:sample]
+            info['dtype'] = type(items[0]).__name__
+            sizes = [len(item) if hasattr(item, '__len__') else 1
+                     for item in items]
+            # references in the sequence plus estimated size of elements
+            info['nbytes'] = int(8 * rows +
+                                 rows * float(sum(sizes)) / len(sizes))
+    return info
+
+
+class RingBufferSink(object):
+
+    """ Keeps the last capacity records in memory """
+
+    def __init__(self, capacity=1000):
+        self.records = deque(maxlen=capacity)
+
+    def __repr__(self):
+        return 'RingBufferSink with %d records' % len(self.records)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def clear(self):
+        self.records.clear()
+
+
+class JsonlSink(object):
+
+    """ Appends records to a file - one json object per line """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stream = None
+
+    def __repr__(self):
+        return 'JsonlSink to: %s' % self.path
+
+    def emit(self, record):
+        line = json.dumps(record, default=str) + '\n'
+        with self.lock:
+            if self.stream is None:
+                self.stream = open(self.path, 'a')
+            self.stream.write(line)
+            self.stream.flush()
+
+    def close(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+
+class LogSink(object):
+
+    """ Logs records as json at info level """
+
+    def __init__(self, name='tictacs.metrics'):
+        self.logger = logging.getLogger(name)
+
+    def __repr__(self):
+        return 'LogSink to: %s' % self.logger.name
+
+    def emit(self, record):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(json.dumps(record, default=str))
+
+
+SINKS = {'ring': RingBufferSink,
+         'jsonl': JsonlSink,
+         'log': LogSink}
+
+# sinks are shared by everything that asks for the same one
+_sinks = dict()
+_sinks_lock = threading.Lock()
+
+
+def get_sink(kind='ring', *args):
+    """ Get the sink of a kind, creating it the first time it is asked for
+
+    :kind: str - 'ring', 'jsonl' or 'log'
+    :args: arguments of the sink, eg: the path of a jsonl sink or the
+           capacity of a ring buffer
+    :returns: the sink
+
+    """
+    if kind not in SINKS:
+        raise ValueError('Sink should be one of %s, got %s'
+                         % (sorted(SINKS), kind))
+    key = (kind,) + args
+    with _sinks_lock:
+        if key not in _sinks:
+            _sinks[key] = SINKS[kind](*args)
+        return _sinks[key]
+
+
+# clock -> when a sentinel on that clock last saw data, in this thread
+_clocks = threading.local()
+
+
+def elapsed(clock=None):
+    """ Seconds since the last time this was called with the same clock in
+        this thread
+
+    :clock: hashable - name of the clock, eg: the one that the sentinels of
+            a pipeline share
+    :returns: float or None if this is the first call
+
+    """
+    now = time.perf_counter()
+    times = getattr(_clocks, 'times', None)
+    if times is None:
+        times = _clocks.times = dict()
+    last = times.get(clock)
+    times[clock] = now
+    return None if last is None else now - last
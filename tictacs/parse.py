@@ -1,8 +1,47 @@
-import yaml
+import time
 import inspect
+import functools
 import importlib
 import logging
 from .wrappers import FunctionWrapper
+from .cache import read_recipe, get_cache, INCLUDE
+from .memo import MemoizedStep, get_step_cache, canonical, signature
+from .dag import TictacGroup, detach
+from .stream import chunked, map_ordered
+from .instrument import InstrumentedStep, get_profile, add_root_methods
+from .store import save, MIN_BYTES
+from .predcache import add_methods, invalidate
+
+
+# objects we have already looked up keyed by (package, name)
+_resolved = dict()
+# methods after which a tictac no longer matches the others of its group
+DETACHING_METHODS = ('fit', 'fit_transform', 'fit_predict', 'partial_fit',
+                     'set_params')
+
+
+def resolve(package, name):
+    """ Import package and get the object called name from it. Lookups are
+        remembered so each one is only done once per process.
+
+    :package: str - dotted path of the package to import
+    :name: str - name of the object in the package
+    :returns: the object
+
+    """
+    try:
+        return _resolved[(package, name)]
+    except KeyError:
+        pkg = importlib.import_module(package)
+        obj = getattr(pkg, name)
+        _resolved[(package, name)] = obj
+        return obj
+
+
+class RedefinitionError(ValueError):
+
+    """ Raised when a recipe defines two different estimators with the same
+        label """
 
 
 class Conjurer(object):
@@ -11,14 +50,31 @@ class Conjurer(object):
 
     # Labels we use in yaml file.
     PIPE = 'pipeline'
+    # fragments merged into the recipe - see cache.read_recipe
+    INCLUDE = INCLUDE
     LABEL = 'label'
     STEPS = 'steps'
     TRANS = 'transformer_list'
     GRID = 'param_grid'
+    # sources of the training data - see data.get_dataset
+    DATA = 'data'
+    # options of the cache of predictions - see predcache.get_cache
+    PREDICT_CACHE = 'predict_cache'
+    # how the tictac is evaluated - see evaluate.evaluate
+    EVALUATION = 'evaluation'
+    # set to true in the recipe to instrument every node of the pipeline
+    INSTRUMENT = 'instrument'
+    # options of tictac.slim - see slim.slim
+    SLIM = 'slim_options'
+    # sections that are kept as they are instead of being parsed
+    RAW = (GRID, DATA, PREDICT_CACHE, EVALUATION, INSTRUMENT, SLIM)
     ESTIMATOR = 'estimator'
     ESTIMATOR_PKG = 'estimator_pkg'
     ESTIMATOR_PARAMS = 'estimator_params'
+    # how wrapped functions are applied - see FunctionWrapper.set_execution
+    WRAPPER_PARAMS = 'wrapper_params'
     RECIPE_LABEL = 'recipe'
+    PROFILE_LABEL = 'profile'
 
     # labels we need:
     # LABEL - name for it in order to be able to refer to it afterwards.
@@ -31,17 +87,40 @@ class Conjurer(object):
                                   ESTIMATOR_PKG,
                                   ]
 
-    def __init__(self, recipe):
+    def __init__(self, recipe, cache=None, lazy=False, memory=None,
+                 instrument=None):
         """ Load recipe and parse it
 
         :recipe: str - filename - path to recipe to parse
+        :cache: where to cache the parsed recipe - see cache.get_cache
+        :lazy: bool - if True labeled entries outside the pipeline are only
+               imported and instantiated if the pipeline refers to them
+        :memory: where to cache outputs of steps - see memo.get_step_cache
+        :instrument: whether to record timings and allocations of every
+                     node of the pipeline - see instrument.get_profile
 
         """
         # remember the file we were asked to parse
         self.recipe = recipe
+        # cache of parsed recipes - None if we read the yaml every time
+        self.cache = get_cache(cache)
         # keep all estimators with labels so we can access them
         # also we don't want to make two instances of the same thing
         self.estimators = dict()
+        # definitions of labeled estimators we haven't instantiated yet
+        self.definitions = dict()
+        # (path, digest) of the fragments the recipe includes
+        self.deps = []
+        self.lazy = lazy
+        # seconds spent importing and constructing each estimator by label
+        self.timings = dict()
+        # digests of the definitions of estimators by label - nested
+        # estimators are part of the definition of their parent
+        self.signatures = dict()
+        # cache for outputs of steps - None if steps are not memoized
+        self.memory = get_step_cache(memory)
+        # profile nodes record to - None if they are not instrumented
+        self.profile = get_profile(instrument)
         # keep parsed definitions that we want to create object with
         self.parsed = dict()
         # keep what class the output of parse should be
@@ -57,46 +136,60 @@ class Conjurer(object):
 
         """
         try:
-            with open(self.recipe, 'r') as conf:
-                self.logger.info('Reading recipe from file: %s..'
-                                 % self.recipe)
-                # entries at first level of dictionary when yaml is parsed
-                root_entries = yaml.load(conf.read())
-                # iterate over keys and parse all labels apart from pipeline
-                # this caches them and makes them available to be accessed
-                # in pipeline using their label instead of repeating the
-                # whole definition
-                self.parsed[Conjurer.RECIPE_LABEL] = self.recipe
-                for key, val in root_entries.items():
-                    try:
-                        if key != Conjurer.PIPE:
-                            self.parse_pipe(root_entries[key])
-                            self.logger.info('Added entry %s..' % key)
-                    except (ValueError, TypeError):
-                        # if we could not parse it, it means that it wasn't
-                        # an estimator instance, append it to stuff we pass
-                        # to class - will probably be handy for quick settings
+            self.logger.info('Reading recipe from file: %s..' % self.recipe)
+            # entries at first level of dictionary when yaml is parsed
+            # merged with the fragments it includes
+            root_entries, self.deps = read_recipe(self.recipe, self.cache)
+            # iterate over keys and parse all labels apart from pipeline
+            # this caches them and makes them available to be accessed
+            # in pipeline using their label instead of repeating the
+            # whole definition
+            self.parsed[Conjurer.RECIPE_LABEL] = self.recipe
+            for key, val in root_entries.items():
+                try:
+                    if key in Conjurer.RAW:
+                        # label addressed parameters to search over, data
+                        # sources and options are kept as they are
                         self.parsed[key] = val
+                    elif key != Conjurer.PIPE:
+                        if self.lazy:
+                            self.define(val)
+                        else:
+                            self.parse_pipe(val)
                         self.logger.info('Added entry %s..' % key)
-                        self.logger.warning('Added entry %s has been '
-                                            'interpreted as data' % key)
-                # now we parse pipe - labels used earlier can be used
-                model = self.parse_pipe(root_entries[Conjurer.PIPE])
-                # keep class name
-                self.class_type = model.__class__
-                # keep data of instance
-                self.parsed.update(model.get_params(deep=False))
-                return self.parsed
+                except RedefinitionError:
+                    raise
+                except (ValueError, TypeError):
+                    # if we could not parse it, it means that it wasn't
+                    # an estimator instance, append it to stuff we pass
+                    # to class - will probably be handy for quick settings
+                    self.parsed[key] = val
+                    self.logger.info('Added entry %s..' % key)
+                    self.logger.warning('Added entry %s has been '
+                                        'interpreted as data' % key)
+            if self.profile is None and \
+                    root_entries.get(Conjurer.INSTRUMENT) is True:
+                self.profile = get_profile(True)
+            if self.profile is not None:
+                self.parsed[Conjurer.PROFILE_LABEL] = self.profile
+            # now we parse pipe - labels used earlier can be used
+            model = self.parse_pipe(root_entries[Conjurer.PIPE])
+            # keep class name
+            self.class_type = model.__class__
+            # keep data of instance
+            self.parsed.update(model.get_params(deep=False))
+            return self.parsed
         except IOError:
             raise AttributeError('%s - filename specified not found'
                                  % self.recipe)
 
-    def parse_pipe(self, yaml_dict, depth=0):
+    def parse_pipe(self, yaml_dict, depth=0, path=()):
         """ Recursively parse the dictionary returned by yaml
             and replace the estimator nodes with actual estimator
             instances.
         :yaml_dict: the dictionary we got from loading the yaml recipe
         :depth: how deep we are in the parse of the dictionary
+        :path: tuple of the labels of the estimators we are nested in
         :returns: an estimator class instance
 
         """
@@ -111,6 +204,10 @@ class Conjurer(object):
             if type(yaml_dict) is str:
                 if yaml_dict in self.estimators:
                     return self.estimators[yaml_dict]
+                elif yaml_dict in self.definitions:
+                    # only instantiate lazy definitions once they are used
+                    return self.parse_pipe(self.definitions[yaml_dict],
+                                           depth, path)
                 else:
                     raise ValueError('Label "%s" that was used at depth %s '
                                      'does not correspond to the declaration '
@@ -139,7 +236,9 @@ class Conjurer(object):
         # below is None if estimator has no nested estimators
         if param_keyvals is not None:
             # key determines whether it is a pipeline or feature union
-            key, estim_dicts = param_keyvals
+            # copy so that the yaml tree stays intact for lazy definitions
+            key, estim_dicts = param_keyvals[0], list(param_keyvals[1])
+            params = dict(params)
             # for each entry in the parameters - parse them
             # the should be estimators or labels of estimators defined
             # in the outer scope
@@ -155,20 +254,39 @@ class Conjurer(object):
                                     'a label defined in the outer scope, but '
                                     'label was of type %s' % type(entry))
                 # get the parsed estimator instance
-                estimator = self.parse_pipe(entry, depth+1)
+                node_path = path + (yaml_dict[Conjurer.LABEL],)
+                # one instance for each label - parse_pipe remembers it
+                estimator = self.parse_pipe(entry, depth+1, node_path)
+                if self.memory is not None:
+                    estimator = MemoizedStep(estimator,
+                                             self.signatures[label],
+                                             self.memory)
+                if self.profile is not None:
+                    estimator = InstrumentedStep(estimator,
+                                                 node_path + (label,),
+                                                 self.profile)
                 # replace the entries in the list with a tuple
                 # label, estimator instance as expected by sklearn
                 estim_dicts[index] = (label, estimator)
-                # remember it - one instance for each label
-                # TODO add redefinition errors when there exist
-                # different estimators with same label
-                self.estimators[label] = estimator
             params[key] = estim_dicts
         label = yaml_dict[Conjurer.LABEL]
         estimator = yaml_dict[Conjurer.ESTIMATOR]
         package = yaml_dict[Conjurer.ESTIMATOR_PKG]
-        pkg = importlib.import_module(package)
-        est = getattr(pkg, estimator)
+        node_signature = self.signature(package, estimator, params)
+        if self.definitions.get(label, yaml_dict) != yaml_dict:
+            raise RedefinitionError('Label "%s" at depth %s is already '
+                                    'defined differently' % (label, depth))
+        if label in self.estimators:
+            # eg: a fragment defines it and the pipeline repeats it
+            if self.signatures[label] != node_signature:
+                raise RedefinitionError('Label "%s" at depth %s is already '
+                                        'defined differently'
+                                        % (label, depth))
+            return self.estimators[label]
+        self.signatures[label] = node_signature
+        start = time.time()
+        est = resolve(package, estimator)
+        imported = time.time()
         # if what we imported is a class - we suppose it is an estimator
         if inspect.isclass(est):
             estimator_instance = est(**params)
@@ -176,13 +294,60 @@ class Conjurer(object):
         # and we wrap it in a class that calls the method on transform
         else:
             estimator_instance = FunctionWrapper(est, **params)
-        # if params is None we have passed no options
+            wrapper_params = yaml_dict.get(Conjurer.WRAPPER_PARAMS)
+            if wrapper_params:
+                estimator_instance.set_execution(**wrapper_params)
+        self.timings[label] = {'import': imported - start,
+                               'construct': time.time() - imported}
+        self.logger.info('Created %s in %.4fs (import %.4fs)'
+                         % (label, time.time() - start, imported - start))
         # remember it - one instance for each label
-        # TODO add redefinition errors when there exist
-        # different estimators with same label
         self.estimators[label] = estimator_instance
         return estimator_instance
 
+    def signature(self, package, estimator, params):
+        """ Get a digest of the definition of an estimator. Nested estimators
+            are represented by their label and signature so this needs to be
+            called after they have been parsed.
+
+        :package: str - package of the estimator
+        :estimator: str - name of the estimator
+        :params: dictionary - parameters of the estimator
+        :returns: str - hex digest
+
+        """
+        params = dict(params)
+        param_keyvals = Conjurer.parse_params(params)
+        if param_keyvals is not None:
+            key, entries = param_keyvals
+            params[key] = [(label, self.signatures[label])
+                           for label, _ in entries]
+        return signature(package, estimator, canonical(params))
+
+    def define(self, yaml_dict):
+        """ Remember the definitions of labeled estimators in yaml_dict
+            without importing or instantiating them. Nested labeled
+            estimators can be referred to as well.
+
+        :yaml_dict: dictionary of an estimator definition from the recipe
+
+        """
+        if type(yaml_dict) is not dict or Conjurer.missing_keys(yaml_dict):
+            raise ValueError('Expected an estimator definition')
+        nodes = [yaml_dict]
+        while nodes:
+            node = nodes.pop()
+            label = node[Conjurer.LABEL]
+            if self.definitions.setdefault(label, node) != node:
+                raise RedefinitionError('Label "%s" is already defined '
+                                        'differently' % label)
+            param_keyvals = Conjurer.parse_params(
+                node.get(Conjurer.ESTIMATOR_PARAMS))
+            if param_keyvals is not None:
+                nodes.extend(entry for entry in param_keyvals[1]
+                             if type(entry) is dict and
+                             not Conjurer.missing_keys(entry))
+
     @staticmethod
     def parse_params(param_dict):
         """ Parse parameters dictionary of estimator.
@@ -229,10 +394,96 @@ class Conjurer(object):
                 if key not in yaml_dict.keys()]
 
 
-def create_tac(base, params):
+class DetachingMethod(object):
+
+    """ Descriptor that gives a tictac that shares steps with others in a
+        TictacGroup its own copies of them before a method of its base
+        class changes the model - see dag.detach """
+
+    def __init__(self, name, method):
+        """ Wrap a method
+
+        :name: str - name of the method
+        :method: the method or descriptor of the base class
+
+        """
+        self.name = name
+        self.method = method
+        self.__doc__ = getattr(method, '__doc__', None)
+
+    def __get__(self, obj, owner=None):
+        bound = self.method.__get__(obj, owner)
+        if obj is None:
+            return bound
+
+        @functools.wraps(bound)
+        def detaching(*args, **kwargs):
+            detach(obj)
+            return bound(*args, **kwargs)
+        return detaching
+
+
+def add_detaching_methods(cls, base):
+    """ Make the methods of a tictac class that change the model detach it
+        from its group first
+
+    :cls: the tictac class
+    :base: the class it extends
+
+    """
+    for name in DETACHING_METHODS:
+        for klass in base.__mro__:
+            if name in vars(klass):
+                setattr(cls, name, DetachingMethod(name, vars(klass)[name]))
+                break
+
+
+# Tictac classes we have created keyed by base class and parameter names
+_tictac_classes = dict()
+
+
+def create_tac(base, params, init=None):
     """ Dynamically choose what class the Tictac should inherit from.
+        Classes are created once for each base class, set of parameter
+        names and constructor and reused afterwards.
+    :base: the class to extend
+    :params: dictionary of constructor parameters - only the names matter
+    :init: constructor to use instead of generating one, eg: the one a
+           compiled plan defines
     :returns: The Tictac class that extends base class
 
+    """
+    key = (base, tuple(params), init)
+    try:
+        return _tictac_classes[key]
+    except KeyError:
+        pass
+    tictac_class = _create_tac(base, key[1], init)
+    _tictac_classes[key] = tictac_class
+    return tictac_class
+
+
+def _restore_tac(base, param_names):
+    """ Create an empty instance of the Tictac class of a base class and
+        parameter names, for store.load
+
+    :base: the class the Tictac extends
+    :param_names: tuple of str - names of the constructor parameters
+    :returns: the instance, without its state
+
+    """
+    tictac_class = create_tac(base, dict.fromkeys(param_names))
+    return tictac_class.__new__(tictac_class)
+
+
+def _create_tac(base, param_names, init=None):
+    """ Create the Tictac class that extends base class
+
+    :base: the class to extend
+    :param_names: tuple of str - names of the constructor parameters
+    :init: constructor to use instead of generating one
+    :returns: The Tictac class
+
     """
 
     class Tictac(base):
@@ -242,12 +493,18 @@ def create_tac(base, params):
 
         # __init__ is overrided later in sklearn case!
 
+        # no __slots__: base estimators already have a __dict__, so they
+        # would not make the attributes any more compact
+        # what the class is created from, so store can create it again
+        _tictac_base = base
+        _tictac_params = param_names
+
         def __reduce__(self):
             """ Make this dynamically inherited class picklable
             :returns: tuple
 
             """
-            return(base.__new__, (base,), self.__dict__)
+            return (base.__new__, (base,), self.__dict__)
 
         def __repr__(self):
             """ Lets make this python console friendly """
@@ -276,15 +533,147 @@ def create_tac(base, params):
             self._cleanup()
             self.__init__(**Conjurer(filename).parse())
 
+        def dataset(self):
+            """ Get the training data the data section of the recipe
+                describes
+
+            :returns: data.Dataset
+
+            """
+            from .data import get_dataset
+            return get_dataset(getattr(self, Conjurer.DATA, None),
+                               self.recipe)
+
+        def fit_data(self, epochs=1):
+            """ Fit on the data section of the recipe, chunk by chunk if
+                every node is stateless or has partial_fit
+
+            :epochs: int - passes over the data when fitting in chunks
+            :returns: self
+
+            """
+            from .data import fit_dataset
+            try:
+                return fit_dataset(self, self.dataset(), epochs=epochs)
+            finally:
+                invalidate(self)
+
+        def reload(self, filename=None, X=None, y=None):
+            """ Reload the recipe keeping the fitted nodes whose definition
+                and upstream steps didn't change - see reload.reload
+
+            :filename: str - the recipe, the one we were built from if None
+            :X: if given only the rebuilt nodes are fitted on X and y
+            :y: the training targets
+            :returns: dictionary of the label paths of the nodes that were
+                      kept and rebuilt
+
+            """
+            from .reload import reload
+            return reload(self, filename, X, y)
+
+        def save(self, path, min_bytes=MIN_BYTES):
+            """ Save the tictac to a directory so that its large arrays can
+                be memory mapped when loaded with tictacs.load
+
+            :path: str - directory to save to - a tictac saved there before
+                   is replaced, see store.save
+            :min_bytes: int - arrays at least this large get their own file
+
+            """
+            save(self, path, min_bytes=min_bytes)
+
+        def slim(self, **kwargs):
+            """ Slim the fitted tictac in place for serving - see
+                slim.slim for the arguments, which default to the
+                slim_options entry of the recipe
+
+            :returns: dictionary with the footprint before and after and
+                      what was dropped, compacted, downcast and shared
+
+            """
+            from .slim import slim
+            try:
+                return slim(self, **kwargs)
+            finally:
+                invalidate(self)
+
+        def search(self, X, y=None, **kwargs):
+            """ Cross validate the candidates of the param_grid of the
+                recipe - see search.search for the arguments
+
+            :X: the training data
+            :y: the training targets
+            :returns: dictionary with the best_params, best_score,
+                      best_estimator and the results of every evaluation
+
+            """
+            from .search import search
+            return search(self, X, y, **kwargs)
+
+        def evaluate(self, X, y, **kwargs):
+            """ Evaluate the tictac as the evaluation section of the
+                recipe says - see evaluate.evaluate for the arguments
+
+            :X: the data
+            :y: the targets
+            :returns: dictionary with the metrics over the folds and the
+                      results of each fold
+
+            """
+            from .evaluate import evaluate
+            return evaluate(self, X, y, **kwargs)
+
+        def predict_stream(self, X, chunk_size=1000, n_jobs=1,
+                           backend='thread', prefetch=None):
+            """ Predict on an iterable of any size in chunks
+
+            :X: iterable of samples, eg: a file object with one per line
+            :chunk_size: int - number of samples to predict at a time
+            :n_jobs: int - number of threads or processes to predict with,
+                     -1 for one per cpu
+            :backend: str - 'thread' or 'process'
+            :prefetch: int - number of chunks in flight, 2 * n_jobs default
+            :returns: generator of the predictions for each chunk in order
+
+            """
+            return map_ordered(self, 'predict', chunked(X, chunk_size),
+                               n_jobs=n_jobs, backend=backend,
+                               prefetch=prefetch)
+
+        def transform_stream(self, X, chunk_size=1000, n_jobs=1,
+                             backend='thread', prefetch=None):
+            """ Transform an iterable of any size in chunks
+
+            :X: iterable of samples, eg: a file object with one per line
+            :chunk_size: int - number of samples to transform at a time
+            :n_jobs: int - number of threads or processes to transform with,
+                     -1 for one per cpu
+            :backend: str - 'thread' or 'process'
+            :prefetch: int - number of chunks in flight, 2 * n_jobs default
+            :returns: generator of the transformed chunks in order
+
+            """
+            return map_ordered(self, 'transform', chunked(X, chunk_size),
+                               n_jobs=n_jobs, backend=backend,
+                               prefetch=prefetch)
+
+    # tictacs of a group get their own steps before they are changed
+    add_detaching_methods(Tictac, base)
+    # cache predictions if the recipe asks to and notice refitting
+    add_methods(Tictac)
+    # record the calls to the tictac itself if it is instrumented
+    add_root_methods(Tictac)
+
     # if base is sklearn
     # we need a constructor with all params in the definition
     # in order to be compatible - (check the clone function to see why)
-    if hasattr(base, '_get_param_names'):
+    if init is not None:
+        setattr(Tictac, '__init__', init)
+    elif hasattr(base, '_get_param_names'):
         # keep paramaters that we will pass to base constructor
-        super_params = dict()
-        for key, value in params.items():
-            if key in base._get_param_names():
-                super_params[key] = value
+        base_params = set(base._get_param_names())
+        super_params = [key for key in param_names if key in base_params]
 
         # TODO - think about injection
         # meta meta programming - define our constructor
@@ -293,12 +682,12 @@ def create_tac(base, params):
                     '    if super_params:\n'
                     '        super(Tictac, self).__init__(%s)') \
             % (', ' + ', '.join('%s' % key
-                                for key in params.keys())
-                if params.keys()
+                                for key in param_names)
+                if param_names
                 else '',
                '\n    '.join('self.%s = %s' % (key, key)
-                             for key in params.keys()),
-               (', '.join('%s=%s' % (key, key) for key in super_params.keys()))
+                             for key in param_names),
+               (', '.join('%s=%s' % (key, key) for key in super_params))
                )
         # define our function
         exec(init_str, locals())
@@ -306,16 +695,160 @@ def create_tac(base, params):
     return Tictac
 
 
-def from_recipe(filename):
+def from_recipe(filename, cache=None, lazy=False, memory=None,
+                instrument=None):
     """ Get a Tictac instance from a recipe by passing in the path to
         the file containing the recipe
 
     :filename: str - path to the yaml file containing the recipe
+    :cache: None to always parse the yaml, True to cache parsed recipes in
+            the default location, or a directory / RecipeCache to use
+    :lazy: bool - if True return a LazyTictac that only parses the recipe
+           and imports the estimators it uses once it is first used
+    :memory: None, or a directory / StepCache to store the fitted steps
+             and their outputs in so identical steps are only fitted once
+    :instrument: True or a Profile to record the time and memory spent in
+                 each node of the pipeline - the profile is available as
+                 the profile attribute of the tictac. Recipes can also
+                 set instrument: true at the top level. True starts
+                 tracemalloc to record the bytes each call allocates,
+                 which slows down python code; pass Profile() to only
+                 record timings.
+
+    If the recipe has been compiled with tictacs compile and has not
+    changed since, the tictac is built by its plan instead of parsing it.
+    The plan takes precedence over cache, which is only used when the
+    recipe is parsed.
 
     """
+    if lazy:
+        return LazyTictac(filename, cache=cache, memory=memory,
+                          instrument=instrument)
+    if instrument is None or instrument is False:
+        from .compile import load_plan
+        plan = load_plan(filename)
+        if plan is not None:
+            return plan.build(filename, memory=get_step_cache(memory))
     # create a parser
-    parser = Conjurer(filename)
+    parser = Conjurer(filename, cache=cache, memory=memory,
+                      instrument=instrument)
     entries = parser.parse()
     class_type = parser.class_type
     tictac_class = create_tac(class_type, entries)
     return tictac_class(**entries)
+
+
+def from_recipes(filenames, cache=None, lazy=False, memory=None,
+                 instrument=None):
+    """ Get a TictacGroup from several recipes. Top level steps that have
+        the same definition and the same upstream steps in different
+        recipes are merged so that fitting the group only fits them once.
+
+    :filenames: list of str - paths to the yaml files containing the recipes
+    :cache: None to always parse the yaml, True to cache parsed recipes in
+            the default location, or a directory / RecipeCache to use
+    :lazy: bool - if True labeled estimators the pipelines don't refer to
+           are never imported. The tictacs are built right away since
+           their steps are needed to merge them.
+    :memory: None, or a directory / StepCache to store the fitted steps
+             and their outputs in - see from_recipe
+    :instrument: True or a Profile to record the time and memory spent in
+                 each node of the pipelines - see from_recipe
+    :returns: TictacGroup - tictacs keyed by filename
+
+    """
+    group = TictacGroup()
+    for filename in filenames:
+        parser = Conjurer(filename, cache=cache, lazy=lazy, memory=memory,
+                          instrument=instrument)
+        entries = parser.parse()
+        tictac = create_tac(parser.class_type, entries)(**entries)
+        if hasattr(tictac, 'steps'):
+            chain, key = [], ''
+            for label, estimator in tictac.steps:
+                # key of a step depends on all the steps before it
+                key = signature(key, parser.signatures.get(label, label))
+                chain.append((key, label, estimator))
+        else:
+            # nothing to share if the recipe is a single estimator
+            chain = [(signature(filename), filename, tictac)]
+        group.add(filename, tictac, chain)
+    return group
+
+
+class LazyTictac(object):
+
+    """ Stand in for a Tictac that builds it the first time any of its
+        attributes are accessed, eg: on the first call to fit, transform
+        or get_params. Labeled estimators the pipeline doesn't refer to
+        are never imported. """
+
+    def __init__(self, recipe, cache=None, memory=None, instrument=None):
+        """ Create a stand in for the Tictac a recipe describes
+
+        :recipe: str - path to the yaml file containing the recipe
+        :cache: where to cache the parsed recipe - see cache.get_cache
+        :memory: where to cache outputs of steps - see memo.get_step_cache
+        :instrument: whether to record timings and allocations of every
+                     node of the pipeline - see instrument.get_profile
+
+        """
+        self.recipe = recipe
+        self.cache = cache
+        self.memory = memory
+        self.instrument = instrument
+        # seconds spent importing and constructing each estimator by label
+        # populated once the tictac is built
+        self.timings = dict()
+        self._tictac = None
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        if self._tictac is None:
+            return 'LazyTictac for recipe: %s (not built yet)' % self.recipe
+        return repr(self._tictac)
+
+    def __getattr__(self, name):
+        """ Anything we don't have ourselves is looked up on the tictac """
+        # guard against lookups before __init__ has run, eg: when unpickling
+        if name.startswith('__') or name == '_tictac':
+            raise AttributeError(name)
+        return getattr(self.build(), name)
+
+    def __reduce__(self):
+        """ Pickle the tictac if we built it, otherwise just the recipe
+        :returns: tuple
+
+        """
+        if self._tictac is None:
+            return (LazyTictac, (self.recipe, self.cache, self.memory,
+                                 self.instrument))
+        return self._tictac.__reduce__()
+
+    def __sklearn_clone__(self):
+        """ Cloning gives an unfitted copy of the tictac itself """
+        from sklearn.base import clone
+        return clone(self.build())
+
+    @property
+    def built(self):
+        """ Whether the tictac has been built yet """
+        return self._tictac is not None
+
+    def build(self):
+        """ Parse the recipe and create the tictac if we haven't already
+
+        :returns: the Tictac instance
+
+        """
+        if self._tictac is None:
+            parser = Conjurer(self.recipe, cache=self.cache, lazy=True,
+                              memory=self.memory, instrument=self.instrument)
+            entries = parser.parse()
+            tictac_class = create_tac(parser.class_type, entries)
+            self._tictac = tictac_class(**entries)
+            self.timings = parser.timings
+        return self._tictac
@@ -0,0 +1,384 @@
+""" cache of the predictions of a tictac keyed by the content of the input
+
+    Recipes enable it with a predict_cache entry, eg:
+
+    predict_cache:
+      max_entries: 100000
+      max_bytes: 67108864
+      ttl: 3600
+
+    or predict_cache: true for the defaults. predict, predict_proba and
+    decision_function then look each sample up by a hash of its content and
+    of the fitted model, pass only the samples that were not found to the
+    pipeline and put the results back in the order of the input. Fitting
+    the tictac again, or changing its parameters, gives it a new fingerprint
+    so results from before are not used.
+
+    Only fit, partial_fit and set_params of the tictac itself renew the
+    fingerprint. Changing a nested step directly, eg:
+    tictac.named_steps['svm'].set_params(C=10) or fitting it on its own,
+    keeps serving the results of the old model - call invalidate(tictac)
+    afterwards.
+"""
+import sys
+import time
+import pickle
+import hashlib
+import functools
+import itertools
+import threading
+import weakref
+from collections import OrderedDict
+from .utils import take
+
+# methods whose results are cached
+CACHED_METHODS = ('predict', 'predict_proba', 'predict_log_proba',
+                  'decision_function')
+# methods that change the fitted model
+FITTING_METHODS = ('fit', 'fit_transform', 'fit_predict', 'partial_fit',
+                   'set_params')
+MAX_ENTRIES = 100000
+MAX_BYTES = 2 ** 26
+# rough memory python needs for an entry on top of its key and value
+ENTRY_OVERHEAD = 200
+# marker for results that are not in the cache
+_missing = object()
+
+# tictac -> PredictionCache or None if it doesn't cache predictions
+_caches = weakref.WeakKeyDictionary()
+# tictac -> fingerprint of its fitted model
+_fingerprints = weakref.WeakKeyDictionary()
+_generations = itertools.count()
+_lock = threading.Lock()
+
+
+def _is_array(value):
+    """ Whether a value is a numpy array, without importing numpy - if
+        nothing imported it, nothing can be an array """
+    np = sys.modules.get('numpy')
+    return np is not None and isinstance(value, np.ndarray)
+
+
+def row_key(row):
+    """ Hash the content of a sample
+
+    :row: str, bytes, numpy row, sparse row or anything picklable
+    :returns: bytes - 16 byte digest
+
+    """
+    # each kind of row is tagged so rows of different types never share
+    # a key, eg: 'bX' and b'X'
+    if isinstance(row, str):
+        data = b'str\0' + row.encode('utf-8', 'surrogatepass')
+    elif isinstance(row, bytes):
+        data = b'bytes\0' + row
+    elif _is_array(row) and not row.dtype.hasobject:
+        header = 'array\0%s %s\0' % (row.dtype.str, row.shape)
+        data = header.encode('utf-8') + \
+            sys.modules['numpy'].ascontiguousarray(row).tobytes()
+    elif hasattr(row, 'indices') and hasattr(row, 'data'):
+        row = row.tocsr()
+        header = 'sparse\0%s %s %s %d\0' % (row.dtype.str,
+                                            row.indices.dtype.str,
+                                            row.shape, row.nnz)
+        data = header.encode('utf-8') + row.indices.tobytes() + \
+            row.data.tobytes()
+    else:
+        data = b'pickle\0' + pickle.dumps(row, pickle.HIGHEST_PROTOCOL)
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _rows(X):
+    """ Split X into samples """
+    if hasattr(X, 'iloc'):
+        return [row for _, row in X.iterrows()]
+    if hasattr(X, 'getrow'):
+        return [X.getrow(i) for i in range(X.shape[0])]
+    return X
+
+
+class PredictionCache(object):
+
+    """ Least recently used results bounded in number and memory, that
+        expire ttl seconds after they were computed. Safe to share between
+        threads and between tictacs. """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES,
+                 ttl=None):
+        """ Create a cache
+
+        :max_entries: int - number of results to keep at most
+        :max_bytes: int - estimated memory to use at most
+        :ttl: float - seconds results are used for, forever if None
+
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        # key -> (result, expiry time, size) in order of use
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'PredictionCache of %d results (%d hits, %d misses)' \
+            % (len(self), self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """ Get the counters of the cache to size it with
+
+        :returns: dictionary
+
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.,
+                'evictions': self.evictions, 'entries': len(self),
+                'bytes': self.nbytes}
+
+    def clear(self):
+        """ Forget all results, keeping the counters """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def get(self, keys):
+        """ Look up results
+
+        :keys: list of keys
+        :returns: list of the results, _missing for the keys not found
+
+        """
+        now = time.time()
+        found = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] is not None and \
+                        entry[1] < now:
+                    self._remove(key)
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    found.append(_missing)
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    found.append(entry[0])
+        return found
+
+    def put(self, keys, results):
+        """ Store results, evicting the least recently used ones while the
+            cache is over its bounds
+
+        :keys: list of keys
+        :results: list of results - a result for each key
+
+        """
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            for key, result in zip(keys, results):
+                if _is_array(result):
+                    # don't keep the whole batch alive through a view
+                    result = result.copy()
+                if key in self._entries:
+                    self._remove(key)
+                size = ENTRY_OVERHEAD + len(key) + \
+                    getattr(result, 'nbytes', 8)
+                self._entries[key] = (result, expires, size)
+                self.nbytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self.nbytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.nbytes -= self._entries.pop(key)[2]
+
+    def call(self, method, name, fingerprint, X):
+        """ Call a prediction method only on the samples of X that are not
+            in the cache
+
+        :method: the bound method
+        :name: str - name of the method
+        :fingerprint: str - fingerprint of the model the method belongs to
+        :X: the samples
+        :returns: array of the results for all samples in order, whether
+                  they were found in the cache or not
+
+        """
+        import numpy as np
+        if not (hasattr(X, '__len__') and hasattr(X, '__getitem__')):
+            # iterators would be used up by the keys
+            X = list(X)
+        rows = _rows(X)
+        prefix = ('%s\0%s\0' % (fingerprint, name)).encode('utf-8')
+        keys = [prefix + row_key(row) for row in rows]
+        results = self.get(keys)
+        # first position of each distinct sample that was not found
+        missing = dict()
+        for i, result in enumerate(results):
+            if result is _missing:
+                missing.setdefault(keys[i], i)
+        if missing:
+            indices = list(missing.values())
+            computed = method(take(X, indices) if len(indices) < len(keys)
+                              else X)
+            if len(indices) == len(keys):
+                self.put(keys, computed)
+                return np.asarray(computed)
+            self.put(list(missing), computed)
+            computed = dict(zip(missing, computed))
+            results = [computed[key] if result is _missing else result
+                       for key, result in zip(keys, results)]
+        return np.asarray(results)
+
+
+def get_cache(tictac):
+    """ Get the cache of the predictions of a tictac, created from its
+        predict_cache entry the first time
+
+    :tictac: the tictac
+    :returns: PredictionCache or None
+
+    """
+    try:
+        return _caches[tictac]
+    except KeyError:
+        pass
+    except TypeError:
+        # can't be weakly referenced
+        return None
+    options = getattr(tictac, 'predict_cache', None)
+    if options is True:
+        cache = PredictionCache()
+    elif isinstance(options, dict):
+        cache = PredictionCache(**options)
+    else:
+        cache = None
+    with _lock:
+        return _caches.setdefault(tictac, cache)
+
+
+def set_cache(tictac, cache):
+    """ Set the cache of the predictions of a tictac - caches can be shared
+        by tictacs since the keys include the model fingerprint
+
+    :tictac: the tictac
+    :cache: PredictionCache, or None to stop caching
+
+    """
+    _caches[tictac] = cache
+
+
+def fingerprint(tictac):
+    """ Get a token that identifies the fitted model of a tictac. It changes
+        whenever the tictac is fitted or its parameters are set, but not
+        when its nested steps are changed directly - see invalidate.
+
+    :tictac: the tictac
+    :returns: str
+
+    """
+    with _lock:
+        if tictac not in _fingerprints:
+            _fingerprints[tictac] = '%x.%d' % (id(tictac), next(_generations))
+        return _fingerprints[tictac]
+
+
+def invalidate(tictac, config=False):
+    """ Give a tictac a new fingerprint after its model changed, eg: after
+        fitting or setting the parameters of one of its steps directly
+
+    :tictac: the tictac
+    :config: bool - also create its cache again from its predict_cache entry
+
+    """
+    try:
+        _fingerprints.pop(tictac, None)
+        if config:
+            _caches.pop(tictac, None)
+    except TypeError:
+        pass
+
+
+class CachedMethod(object):
+
+    """ Descriptor that puts a cache in front of a prediction method of the
+        base class of a tictac. The method is only available when it is in
+        the base class, eg: predict_proba of a Pipeline whose last step has
+        it. """
+
+    def __init__(self, name, method):
+        """ Wrap a method
+
+        :name: str - name of the method
+        :method: the method or descriptor of the base class
+
+        """
+        self.name = name
+        self.method = method
+        self.__doc__ = getattr(method, '__doc__', None)
+
+    def __get__(self, obj, owner=None):
+        bound = self.method.__get__(obj, owner)
+        if obj is None:
+            return bound
+        cache = get_cache(obj)
+        if cache is None:
+            return bound
+
+        @functools.wraps(bound)
+        def cached(X, **params):
+            if params:
+                return bound(X, **params)
+            return cache.call(bound, self.name, fingerprint(obj), X)
+        return cached
+
+
+class FittingMethod(CachedMethod):
+
+    """ Descriptor that renews the fingerprint of a tictac after a method
+        of its class changes the model. """
+
+    def __get__(self, obj, owner=None):
+        bound = self.method.__get__(obj, owner)
+        if obj is None:
+            return bound
+        config = self.name == 'set_params'
+
+        @functools.wraps(bound)
+        def fitting(*args, **kwargs):
+            try:
+                return bound(*args, **kwargs)
+            finally:
+                invalidate(obj, config)
+        return fitting
+
+
+def add_methods(cls):
+    """ Add the cached prediction methods and the fitting methods that
+        renew the fingerprint to a tictac class
+
+    :cls: the tictac class
+
+    """
+    for names, wrapper in ((CACHED_METHODS, CachedMethod),
+                           (FITTING_METHODS, FittingMethod)):
+        for name in names:
+            # the class may wrap the methods of its base already, eg: to
+            # detach the tictac from its group
+            for klass in cls.__mro__:
+                if name in vars(klass):
+                    setattr(cls, name, wrapper(name, vars(klass)[name]))
+                    break
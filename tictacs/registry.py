@@ -0,0 +1,380 @@
+""" registry of many tictacs loaded on demand within a memory budget
+
+    A long running service that scores with many tictacs registers them by
+    name and gets them from the registry when it needs them:
+
+    registry = Registry(max_bytes=2 ** 31)
+    registry.register('spam', 'models/spam')          # saved with save
+    registry.register('lang', 'recipes/lang.yaml')    # fit on its data
+    registry.get('spam').predict(texts)
+
+    Models are loaded the first time they are asked for, and only once when
+    many threads ask for the same model at the same time. Fitted nodes that
+    are identical in several models are shared by them and counted once
+    against the budget while any loaded model uses them, and the least
+    recently used models are evicted when the models take more memory than
+    the budget. Recipes are fit on their data section when they are loaded,
+    so registering the directories fitted tictacs were saved to loads them
+    much quicker. Classes that recipes refer to are imported once per process
+    and tictac classes are created once per base class and parameters, so
+    models built from recipes share them already.
+"""
+import os
+import pickle
+import hashlib
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from .parse import Conjurer, from_recipe
+from .store import load
+from .reload import NESTED, unwrap
+from .slim import footprint
+
+log = logging.getLogger(__name__)
+
+RECIPE_EXTENSIONS = ('.yaml', '.yml')
+
+# digest of a fitted node -> the node, shared by the models that have it
+_shared = weakref.WeakValueDictionary()
+_shared_lock = threading.Lock()
+
+
+class _DigestPickler(pickle.Pickler):
+
+    """ Pickler that refers to arrays mapped from files saved with save by
+        the digest of their content and their position instead of reading
+        their data """
+
+    def persistent_id(self, obj):
+        if isinstance(obj, np.ndarray):
+            return _mapped(obj)
+        return None
+
+
+class _HashWriter(object):
+
+    """ File like object that hashes what is written to it """
+
+    def __init__(self, h):
+        self.write = h.update
+
+
+def _mapped(arr):
+    """ Get what a mapped array is a view of, if the digest of the content
+        of the mapped file was stored when it was saved
+
+    :arr: array, eg: a np.memmap or a view of one
+    :returns: tuple of the content digest of the mapped array, byte offset
+              in it, shape, dtype and strides, or None if the array isn't
+              mapped from an array saved with save
+
+    """
+    root = arr
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+    content = getattr(root, 'content_digest', None)
+    if not isinstance(root, np.memmap) or content is None:
+        return None
+    position = arr.ctypes.data - root.ctypes.data
+    return ('memmap', content, position, arr.shape, arr.dtype.str,
+            arr.strides)
+
+
+def node_digest(node):
+    """ Get a digest of a node that is the same for nodes that pickle the
+        same. Arrays mapped from files saved with save are represented by
+        the digest of their content stored at save time, so they are not
+        read into memory. Other arrays are digested by their content.
+
+    :node: the node
+    :returns: str - hex digest
+
+    """
+    h = hashlib.sha1()
+    _DigestPickler(_HashWriter(h), pickle.HIGHEST_PROTOCOL).dump(node)
+    return h.hexdigest()
+
+
+def _fitted(node):
+    """ Whether a node has state it learned from data """
+    return any(name.endswith('_') and not name.startswith('__')
+               for name in getattr(unwrap(node), '__dict__', ()))
+
+
+def fitted_nodes(estimator):
+    """ Get the outermost fitted nested nodes of an estimator - the nodes
+        share_nodes can share
+
+    :estimator: the estimator, eg: a tictac
+    :returns: list of the nodes
+
+    """
+    found, seen = [], set()
+    nodes = [estimator]
+    while nodes:
+        node = unwrap(nodes.pop())
+        for key in NESTED:
+            entries = getattr(node, key, None)
+            if not isinstance(entries, list):
+                continue
+            for entry in entries:
+                child = entry[1]
+                if not hasattr(child, 'get_params') or id(child) in seen:
+                    continue
+                seen.add(id(child))
+                if _fitted(child):
+                    found.append(child)
+                else:
+                    nodes.append(child)
+    return found
+
+
+def share_nodes(estimator):
+    """ Replace the nested nodes of an estimator with identical nodes that
+        other estimators passed to share_nodes have, so that they are held
+        in memory once. Fitted nodes are identical if they pickle the same,
+        so they have the same definition and the same fitted state - see
+        node_digest. Nodes that have not been fitted are never shared, and
+        shared nodes must not be fitted again.
+
+    :estimator: the fitted estimator, eg: a tictac - modified in place
+    :returns: list of the nodes of other estimators it now uses
+
+    """
+    replaced = []
+    nodes = [estimator]
+    while nodes:
+        node = unwrap(nodes.pop())
+        for key in NESTED:
+            entries = getattr(node, key, None)
+            if not isinstance(entries, list):
+                continue
+            changed = False
+            for index, entry in enumerate(entries):
+                child = entry[1]
+                if not hasattr(child, 'get_params'):
+                    continue
+                if not _fitted(child):
+                    # eg: a pipeline - share the nodes in it instead
+                    nodes.append(child)
+                    continue
+                try:
+                    key_digest = node_digest(child)
+                except Exception:
+                    # eg: can't be pickled
+                    continue
+                with _shared_lock:
+                    shared = _shared.get(key_digest)
+                    if shared is None:
+                        try:
+                            _shared[key_digest] = child
+                        except TypeError:
+                            pass
+                if shared is None or shared is child:
+                    continue
+                entries[index] = (entry[0], shared) + tuple(entry[2:])
+                changed = True
+                replaced.append(shared)
+            if changed:
+                # lists are modified in place - set them so that estimators
+                # that validate their parameters see the change
+                node.set_params(**{key: entries})
+    return replaced
+
+
+def load_model(source):
+    """ Load a fitted model from a source
+
+    :source: str - directory a fitted tictac was saved to, or a recipe with
+             a data section to fit it on, see Tictac.fit_data
+    :returns: the fitted tictac
+
+    """
+    if os.path.isdir(source):
+        return load(source)
+    if source.endswith(RECIPE_EXTENSIONS):
+        tictac = from_recipe(source)
+        if getattr(tictac, Conjurer.DATA, None) is None:
+            raise ValueError('Recipe %s has no %s section to fit it on - '
+                             'register the directory the fitted tictac was '
+                             'saved to instead' % (source, Conjurer.DATA))
+        return tictac.fit_data()
+    raise ValueError('Expected %s to be a directory of a saved tictac or a '
+                     'recipe' % source)
+
+
+class Registry(object):
+
+    """ Tictacs by name, loaded on demand and evicted least recently used
+        first when they take more memory than the budget """
+
+    def __init__(self, max_bytes=2 ** 30, loader=load_model, share=True):
+        """ Create a registry
+
+        :max_bytes: int - memory budget of the loaded models. Memory mapped
+                    arrays are not counted as the os shares them.
+        :loader: callable that takes the source of a model and returns it
+        :share: bool - share identical fitted nodes between models
+
+        """
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.share = share
+        # name -> source
+        self.sources = dict()
+        # name -> (model, bytes, ids of its shareable nodes) least recently
+        # used first - bytes don't include the shareable nodes
+        self._models = OrderedDict()
+        # id of a shareable node -> [node, bytes, number of loaded models
+        # using it], so nodes are counted once while they are used
+        self._nodes = dict()
+        # name -> Future of the model being loaded
+        self._loading = dict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'Registry of %d models (%d loaded, %d bytes)' \
+            % (len(self.sources), len(self._models), self.nbytes)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __contains__(self, name):
+        return name in self.sources
+
+    def register(self, name, source=None):
+        """ Register a model - it is loaded when it is first asked for
+
+        :name: str - name to get the model by
+        :source: what the loader loads the model from, the name if None
+
+        """
+        with self._lock:
+            self.sources[name] = name if source is None else source
+            self._drop(name)
+
+    def unregister(self, name):
+        """ Forget a model and unload it """
+        with self._lock:
+            self.sources.pop(name, None)
+            self._drop(name)
+
+    def loaded(self):
+        """ Names of the loaded models, least recently used first
+
+        :returns: list of str
+
+        """
+        with self._lock:
+            return list(self._models)
+
+    def stats(self):
+        """ Get the counters of the registry
+
+        :returns: dictionary
+
+        """
+        with self._lock:
+            return {'models': len(self.sources), 'loaded': len(self._models),
+                    'bytes': self.nbytes, 'hits': self.hits,
+                    'loads': self.loads, 'evictions': self.evictions,
+                    'shared_nodes': len(self._nodes),
+                    'footprints': dict((name, entry[1]) for name, entry
+                                       in self._models.items())}
+
+    def get(self, name):
+        """ Get a model, loading it if it isn't loaded. Concurrent calls for
+            a model that isn't loaded wait for one load.
+
+        :name: str - name the model was registered with
+        :returns: the model
+        :raises: KeyError if no model was registered with the name
+
+        """
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                self._models.move_to_end(name)
+                self.hits += 1
+                return entry[0]
+            if name not in self.sources:
+                raise KeyError('No model registered as %r' % (name,))
+            future = self._loading.get(name)
+            owner = future is None
+            if owner:
+                future = self._loading[name] = Future()
+                source = self.sources[name]
+        if not owner:
+            return future.result()
+        try:
+            model = self.loader(source)
+            nodes = []
+            if self.share:
+                shared = share_nodes(model)
+                if shared:
+                    log.info('%s shares %d nodes with other models'
+                             % (name, len(shared)))
+                nodes = fitted_nodes(model)
+            # the nodes that can be shared are counted separately, once
+            # for all the models that use them
+            size = footprint(model, exclude=nodes)
+            node_sizes = [(node, footprint(node)) for node in nodes]
+        except BaseException as e:
+            with self._lock:
+                del self._loading[name]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[name]
+            # the model may have been unregistered while it loaded
+            if self.sources.get(name) is source:
+                self._models[name] = (model, size,
+                                      [id(node) for node, _ in node_sizes])
+                self.nbytes += size
+                for node, node_size in node_sizes:
+                    ref = self._nodes.get(id(node))
+                    if ref is None:
+                        self._nodes[id(node)] = [node, node_size, 1]
+                        self.nbytes += node_size
+                    else:
+                        ref[2] += 1
+                self.loads += 1
+                self._evict(keep=name)
+        log.info('Loaded %s from %s (%d bytes)' % (name, source, size))
+        future.set_result(model)
+        return model
+
+    def _drop(self, name):
+        entry = self._models.pop(name, None)
+        if entry is None:
+            return
+        self.nbytes -= entry[1]
+        for node_id in entry[2]:
+            ref = self._nodes[node_id]
+            ref[2] -= 1
+            if not ref[2]:
+                # no loaded model uses the node any more
+                del self._nodes[node_id]
+                self.nbytes -= ref[1]
+
+    def _evict(self, keep):
+        """ Evict least recently used models while over the budget, apart
+            from the model with name keep """
+        for name in list(self._models):
+            if self.nbytes <= self.max_bytes:
+                break
+            if name != keep:
+                self._drop(name)
+                self.evictions += 1
+                log.info('Evicted %s' % name)
@@ -0,0 +1,352 @@
+""" incremental reload of the recipe of a tictac
+
+    The recipe is parsed again and every node of the new pipeline is
+    compared to the node with the same label in the current one. A node is
+    kept, fitted, if its definition is the same and, in a pipeline, the
+    steps before it are kept as well. Changed feature union branches are
+    replaced on their own. Only the replaced nodes need fitting again.
+
+    The tictac itself keeps its class, so a recipe whose root estimator or
+    root parameters changed can't be reloaded - create a new tictac with
+    from_recipe instead.
+"""
+import os
+import inspect
+import logging
+import threading
+from .parse import Conjurer
+from .memo import MemoizedStep, canonical, signature
+from .wrappers import EstimatorWrapper, FunctionWrapper
+from .instrument import InstrumentedStep
+from .predcache import invalidate
+from .cache import read_recipe
+
+log = logging.getLogger(__name__)
+
+# parameters of estimators that hold nested estimators
+NESTED = (Conjurer.STEPS, Conjurer.TRANS)
+
+
+def unwrap(node):
+    """ Get the estimator inside any wrappers of a node - the fitted one if
+        a wrapper keeps a fitted copy """
+    while isinstance(node, EstimatorWrapper):
+        node = node.wrapped()
+    return node
+
+
+def node_signature(node):
+    """ Digest of the definition of a node - its class and its parameters,
+        with nested nodes represented by their label and signature. Fitting
+        doesn't change it, so it can be compared to that of a new node.
+
+    :node: the estimator instance, possibly wrapped
+    :returns: str - hex digest
+
+    """
+    inner = unwrap(node)
+    if isinstance(inner, FunctionWrapper):
+        # the arguments and execution settings aren't parameters
+        params = dict(vars(inner))
+    else:
+        params = node.get_params(deep=False)
+    for key in NESTED:
+        if isinstance(params.get(key), list):
+            params[key] = [(entry[0], node_signature(entry[1]))
+                           for entry in params[key]]
+    return signature(type(inner).__module__, type(inner).__name__,
+                     canonical(params))
+
+
+def _options(tictac):
+    """ Get the step cache and profile the nodes of a tictac use, so that
+        new nodes are memoized and instrumented like the old ones
+
+    :returns: StepCache or None, Profile or None
+
+    """
+    memory, profile = None, getattr(tictac, Conjurer.PROFILE_LABEL, None)
+    nodes = [tictac]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, MemoizedStep) and memory is None:
+            memory = node.cache
+        if isinstance(node, InstrumentedStep) and profile is None:
+            profile = node.profile
+        if isinstance(node, EstimatorWrapper):
+            nodes.append(node.estimator)
+            continue
+        for key in NESTED:
+            entries = getattr(node, key, None)
+            if isinstance(entries, list):
+                nodes.extend(entry[1] for entry in entries)
+    return memory, profile
+
+
+def _merge(old, new, path, report, partial, kept):
+    """ Merge the nested nodes of new with the unchanged ones of old
+
+    :old: the current node
+    :new: the node parsed from the new recipe - modified in place
+    :path: tuple of labels of the node
+    :report: dictionary of lists of the paths of kept and rebuilt nodes
+    :partial: dictionary of id of merged node -> key of its nested nodes
+    :kept: set of ids of the nodes that were kept
+    :returns: the node to use
+
+    """
+    if node_signature(old) == node_signature(new):
+        report['kept'].append(path)
+        kept.add(id(old))
+        return old
+    old_inner, new_inner = unwrap(old), unwrap(new)
+    for key in NESTED:
+        old_entries = getattr(old_inner, key, None)
+        new_entries = getattr(new_inner, key, None)
+        if type(old_inner) is not type(new_inner) or \
+                not isinstance(old_entries, list) or \
+                not isinstance(new_entries, list):
+            continue
+        old_nodes = dict((entry[0], entry[1]) for entry in old_entries)
+        merged, upstream_kept = [], True
+        for entry in new_entries:
+            label, node = entry[0], entry[1]
+            # in a pipeline steps can only be kept if all before them are
+            if label in old_nodes and \
+                    (upstream_kept or key != Conjurer.STEPS):
+                node = _merge(old_nodes[label], node, path + (label,),
+                              report, partial, kept)
+            else:
+                report['rebuilt'].append(path + (label,))
+            upstream_kept = upstream_kept and node is old_nodes.get(label)
+            merged.append((label, node) + tuple(entry[2:]))
+        new_inner.set_params(**{key: merged})
+        partial[id(new)] = key
+        return new
+    report['rebuilt'].append(path)
+    return new
+
+
+def _refit(node, X, y, partial, kept, transform):
+    """ Fit the nodes of a merged tree that were rebuilt
+
+    :node: the node
+    :partial: dictionary returned by _merge
+    :kept: set of ids of the nodes that were kept
+    :transform: bool - whether the output of the node is needed
+    :returns: the output of the node if transform else None
+
+    """
+    if id(node) in kept:
+        return node.transform(X) if transform else None
+    key = partial.get(id(node))
+    if key == Conjurer.STEPS:
+        steps = [step for _, step in unwrap(node).steps
+                 if step is not None and step != 'passthrough']
+        for i, step in enumerate(steps):
+            X = _refit(step, X, y, partial, kept,
+                       transform or i < len(steps) - 1)
+        return X if transform else None
+    if key == Conjurer.TRANS:
+        for _, branch in unwrap(node).transformer_list:
+            if branch is not None and branch != 'drop':
+                _refit(branch, X, y, partial, kept, False)
+        return node.transform(X) if transform else None
+    if transform:
+        if hasattr(node, 'fit_transform'):
+            return node.fit_transform(X, y)
+        return node.fit(X, y).transform(X)
+    node.fit(X, y)
+    return None
+
+
+def _param_names(cls):
+    """ Names of the constructor parameters of a class """
+    return sorted(name for name, param
+                  in inspect.signature(cls.__init__).parameters.items()
+                  if name != 'self' and param.kind != param.VAR_KEYWORD)
+
+
+def _is_fitted(tictac):
+    """ Whether a tictac was fitted, for the estimators sklearn can tell """
+    try:
+        from sklearn.exceptions import NotFittedError
+        from sklearn.utils.validation import check_is_fitted
+    except ImportError:
+        return False
+    try:
+        check_is_fitted(tictac)
+    except (NotFittedError, TypeError):
+        return False
+    return True
+
+
+def reload(tictac, filename=None, X=None, y=None):
+    """ Reload the recipe of a tictac keeping the fitted nodes that didn't
+        change. The attributes of the tictac are replaced by a single
+        assignment once the new ones are ready, so it can keep serving
+        predictions meanwhile.
+
+    :tictac: the tictac
+    :filename: str - the recipe, the one the tictac was built from if None
+    :X: if given the rebuilt nodes are fitted on X and y - the kept nodes
+        are only used to transform X. Required if the tictac was fitted and
+        nodes changed.
+    :y: the training targets
+    :returns: dictionary of the label paths of the nodes that were kept and
+              rebuilt
+
+    """
+    filename = filename or tictac.recipe
+    memory, profile = _options(tictac)
+    parser = Conjurer(filename, memory=memory, instrument=profile)
+    entries = parser.parse()
+    if not isinstance(tictac, parser.class_type) or \
+            _param_names(type(tictac)) != sorted(entries):
+        raise ValueError('The root estimator or its parameters changed in '
+                         '%s - create a new tictac with from_recipe'
+                         % filename)
+    report = {'kept': [], 'rebuilt': []}
+    partial, kept = dict(), set()
+    if isinstance(entries.get(Conjurer.STEPS), list):
+        old = dict((label, step) for label, step in tictac.steps)
+        steps, upstream_kept = [], True
+        for label, step in entries[Conjurer.STEPS]:
+            if label in old and upstream_kept:
+                step = _merge(old[label], step, (label,), report, partial,
+                              kept)
+            else:
+                report['rebuilt'].append((label,))
+            upstream_kept = upstream_kept and step is old.get(label)
+            steps.append((label, step))
+        entries[Conjurer.STEPS] = steps
+    else:
+        report['rebuilt'].append(())
+    if X is None and report['rebuilt'] and _is_fitted(tictac):
+        raise ValueError('Nodes %s of %s changed and need fitting - pass X '
+                         'and y to reload'
+                         % (', '.join('.'.join(path) or 'root'
+                                      for path in report['rebuilt']),
+                            filename))
+    # the class of the tictac, not the one create_tac would give, so that
+    # a tictac of a compiled plan keeps its constructor
+    new = type(tictac)(**entries)
+    if X is not None and report['rebuilt']:
+        if Conjurer.STEPS in entries:
+            partial[id(new)] = Conjurer.STEPS
+        _refit(new, X, y, partial, kept, False)
+    log.info('Reloaded %s - kept %d nodes, rebuilt %d'
+             % (filename, len(report['kept']), len(report['rebuilt'])))
+    # swap the content in one go
+    tictac.__dict__ = new.__dict__
+    invalidate(tictac, config=True)
+    return report
+
+
+class Watcher(object):
+
+    """ Polls the recipe of a tictac and the fragments it includes and
+        reloads it when they change. Errors in the new recipe are logged
+        and the tictac is left as it was. """
+
+    def __init__(self, tictac, filename=None, interval=1., X=None, y=None,
+                 callback=None):
+        """ Create a watcher - call start to begin watching
+
+        :tictac: the tictac to reload
+        :filename: str - the recipe, the one the tictac was built from if
+                   None
+        :interval: float - seconds between checks
+        :X: data to fit the rebuilt nodes on, see reload
+        :y: the training targets
+        :callback: called with the report of each reload
+
+        """
+        self.tictac = tictac
+        self.filename = filename or tictac.recipe
+        self.interval = interval
+        self.X = X
+        self.y = y
+        self.callback = callback
+        self.reloads = 0
+        self._files = self._included()
+        self._stamp = self._stat()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'Watcher of %s (%d reloads)' % (self.filename, self.reloads)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _included(self):
+        """ Get the recipe and the fragments it includes """
+        try:
+            deps = read_recipe(self.filename)[1]
+        except Exception:
+            deps = []
+        return [self.filename] + [path for path, _ in deps]
+
+    def _stat(self):
+        stamps = []
+        for filename in self._files:
+            try:
+                st = os.stat(filename)
+            except OSError:
+                return None
+            stamps.append((st.st_mtime_ns, st.st_size))
+        return tuple(stamps)
+
+    def check(self):
+        """ Reload the recipe if it changed since the last check
+
+        :returns: the report of the reload or None if nothing changed
+
+        """
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return None
+        try:
+            report = reload(self.tictac, self.filename, self.X, self.y)
+        except Exception:
+            log.exception('Could not reload %s' % self.filename)
+            report = None
+        # the recipe may include other fragments now
+        self._files = self._included()
+        self._stamp = self._stat()
+        if report is None:
+            return None
+        self.reloads += 1
+        if self.callback is not None:
+            self.callback(report)
+        return report
+
+    def start(self):
+        """ Start checking in a background thread
+
+        :returns: self
+
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop checking """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
@@ -0,0 +1,350 @@
+""" evaluate many recipes on the same dataset in parallel
+
+    Example: tictacs run recipes/ -d texts.txt -l labels.txt
+    or: python -m tictacs.runner recipes/ -d texts.txt -l labels.txt
+"""
+import os
+import sys
+import glob
+import time
+import shutil
+import logging
+import tempfile
+import traceback
+from argparse import ArgumentParser
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .parse import from_recipe
+from .stream import effective_n_jobs
+from .utils import take
+
+log = logging.getLogger(__name__)
+
+
+class MappedText(Sequence):
+
+    """ Read only list of strings decoded on access from a memory mapped
+        utf-8 buffer, so that processes mapping the same file share one copy
+        of the text. Each access decodes the string again. """
+
+    def __init__(self, text, offsets):
+        """ Wrap a buffer
+
+        :text: uint8 array - the strings encoded one after the other
+        :offsets: int array - where each string starts, and where the last
+                  one ends
+
+        """
+        self.text = text
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if not isinstance(index, (int, np.integer)):
+            # eg: an array of indices
+            return [self[i] for i in index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('MappedText index out of range')
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.text[start:end].tobytes().decode('utf-8')
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'MappedText of %d strings' % len(self)
+
+
+class SharedData(object):
+
+    """ Data written to memory mapped files in a temporary directory so that
+        worker processes can map it instead of having it pickled to them.
+        Arrays are stored as .npy files, lists of strings as one utf-8
+        encoded buffer and the offsets of each string in it, which are
+        mapped back as a MappedText. """
+
+    def __init__(self, location=None, **data):
+        """ Write data to files
+
+        :location: str - directory to write to, a temporary one by default
+        :data: the data to share by name - arrays, sparse matrices or lists
+               of strings. Sparse matrices in formats other than csr and
+               csc are shared as csr.
+
+        """
+        self.location = location or tempfile.mkdtemp(prefix='tictacs-')
+        # name -> (kind, metadata) so workers know how to read the data back
+        self.entries = dict()
+        for name, value in data.items():
+            if value is not None:
+                self.entries[name] = self._write(name, value)
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'SharedData at: %s (%s)' % (self.location,
+                                           ', '.join(sorted(self.entries)))
+
+    def _path(self, name, suffix):
+        return os.path.join(self.location, '%s.%s.npy' % (name, suffix))
+
+    def _write(self, name, value):
+        if hasattr(value, 'tocsr') and hasattr(value, 'nnz') and \
+                value.format not in ('csr', 'csc'):
+            # coo, dok, lil.. don't have the arrays of compressed formats
+            value = value.tocsr()
+        if hasattr(value, 'indptr') and hasattr(value, 'indices'):
+            parts = ('data', 'indices', 'indptr')
+            for part in parts:
+                np.save(self._path(name, part), getattr(value, part))
+            return ('sparse', (value.format, value.shape))
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            np.save(self._path(name, 'array'), value)
+            return ('array', None)
+        if all(isinstance(item, str) for item in value):
+            encoded = [item.encode('utf-8') for item in value]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(item) for item in encoded], out=offsets[1:])
+            np.save(self._path(name, 'offsets'), offsets)
+            np.save(self._path(name, 'text'),
+                    np.frombuffer(b''.join(encoded), dtype=np.uint8))
+            return ('text', None)
+        # anything else, eg: a list of labels
+        np.save(self._path(name, 'array'), np.asarray(value))
+        return ('array', None)
+
+    def load(self, name):
+        """ Map data back into memory
+
+        :name: str - name the data was shared with
+        :returns: the data or None if there is no such data
+
+        """
+        if name not in self.entries:
+            return None
+        kind, meta = self.entries[name]
+        if kind == 'array':
+            return np.load(self._path(name, 'array'), mmap_mode='r')
+        if kind == 'text':
+            return MappedText(np.load(self._path(name, 'text'),
+                                      mmap_mode='r'),
+                              np.load(self._path(name, 'offsets'),
+                                      mmap_mode='r'))
+        import scipy.sparse as sp
+        fmt, shape = meta
+        parts = [np.load(self._path(name, part), mmap_mode='r')
+                 for part in ('data', 'indices', 'indptr')]
+        cls = sp.csr_matrix if fmt == 'csr' else sp.csc_matrix
+        return cls(tuple(parts), shape=shape, copy=False)
+
+    def cleanup(self):
+        """ Remove the files """
+        shutil.rmtree(self.location, ignore_errors=True)
+
+
+# data of the worker process - loaded once when the worker starts
+_data = dict()
+
+
+def _init_worker(shared):
+    for name in shared.entries:
+        _data[name] = shared.load(name)
+
+
+def _reset_peak_rss():
+    """ Reset the peak resident set size of this process where the os
+        lets us (linux), so that the peak we read is that of one task """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def _peak_rss():
+    """ Peak resident set size of this process in MB """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.
+    except (IOError, OSError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        # eg: on windows
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on mac, kilobytes elsewhere
+    return peak / (1024. ** 2 if sys.platform == 'darwin' else 1024.)
+
+
+def evaluate(recipe):
+    """ Fit the tictac of a recipe on the shared training data and score it
+        on the test data. Runs in a worker process.
+
+    :recipe: str - path to the recipe
+    :returns: dictionary of results
+
+    """
+    result = {'recipe': recipe, 'score': None, 'error': None}
+    _reset_peak_rss()
+    wall, cpu = time.time(), time.process_time()
+    try:
+        tictac = from_recipe(recipe)
+        tictac.fit(_data['X'], _data.get('y'))
+        result['score'] = tictac.score(_data['X_test'], _data.get('y_test'))
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['wall'] = time.time() - wall
+    result['cpu'] = time.process_time() - cpu
+    result['peak_rss'] = _peak_rss()
+    return result
+
+
+def find_recipes(path):
+    """ Get the recipes in a directory
+
+    :path: str - directory or a single recipe
+    :returns: list of str - paths of the recipes
+
+    """
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, '*.yaml')) +
+                      glob.glob(os.path.join(path, '*.yml')))
+    return [path]
+
+
+def split(X, y, test_size=0.25, random_state=0):
+    """ Shuffle and split data into a training and a test set
+
+    :returns: X, y, X_test, y_test
+
+    """
+    indices = np.random.RandomState(random_state).permutation(len(X))
+    cut = len(indices) - int(round(len(indices) * test_size))
+    train, test = np.sort(indices[:cut]), np.sort(indices[cut:])
+    return take(X, train), take(y, train), take(X, test), take(y, test)
+
+
+def run(recipes, X, y=None, X_test=None, y_test=None, n_jobs=-1,
+        test_size=0.25):
+    """ Fit and score recipes in a pool of processes. Results are yielded
+        as soon as each recipe finishes.
+
+    :recipes: str or list of str - a directory of recipes or their paths
+    :X: the training data
+    :y: the training targets
+    :X_test: the test data - a split of X is used if None
+    :y_test: the test targets
+    :n_jobs: int - number of processes, one per cpu by default - see
+             stream.effective_n_jobs
+    :test_size: float - fraction of X held out if X_test is None
+    :returns: generator of dictionaries with the score, wall time, cpu
+              time and peak resident memory in MB of each recipe
+
+    """
+    if isinstance(recipes, str):
+        recipes = find_recipes(recipes)
+    if X_test is None:
+        X, y, X_test, y_test = split(X, y, test_size=test_size)
+    shared = SharedData(X=X, y=y, X_test=X_test, y_test=y_test)
+    pool = ProcessPoolExecutor(max_workers=effective_n_jobs(n_jobs),
+                               initializer=_init_worker, initargs=(shared,))
+    try:
+        futures = [pool.submit(evaluate, recipe) for recipe in recipes]
+        for future in as_completed(futures):
+            result = future.result()
+            if result['error'] is not None:
+                log.error('Recipe %s failed:\n%s'
+                          % (result['recipe'], result['error']))
+            yield result
+    finally:
+        # if the caller stops early, eg: with a break, only wait for the
+        # recipes in progress
+        pool.shutdown(cancel_futures=True)
+        shared.cleanup()
+
+
+def format_row(result):
+    """ Format a result as a row of the results table
+
+    :result: dictionary returned by evaluate
+    :returns: str
+
+    """
+    score = 'failed' if result['error'] else '%.4f' % result['score']
+    return '%-40s %10s %9.2f %9.2f %10.1f' % (
+        result['recipe'], score, result['wall'], result['cpu'],
+        result['peak_rss'])
+
+
+HEADER = '%-40s %10s %9s %9s %10s' % ('recipe', 'score', 'wall (s)',
+                                      'cpu (s)', 'rss (MB)')
+
+
+def read_lines(filename):
+    """ Read a file with one entry per line, or a .npy file """
+    if filename.endswith('.npy'):
+        return np.load(filename, mmap_mode='r')
+    with open(filename) as f:
+        return [line.rstrip('\n') for line in f]
+
+
+def add_arguments(parser):
+    """ Add the arguments of the runner to a command line parser
+
+    :parser: argparse.ArgumentParser
+
+    """
+    parser.add_argument('recipes',
+                        help='Directory of recipes or path to a recipe')
+    parser.add_argument('--data', '-d', required=True,
+                        help='Training data - text file with one document '
+                             'per line or .npy file')
+    parser.add_argument('--labels', '-l', required=True,
+                        help='Training labels - one per line or .npy file')
+    parser.add_argument('--test-data', help='Test data, same format as data')
+    parser.add_argument('--test-labels', help='Test labels')
+    parser.add_argument('--test-size', type=float, default=0.25,
+                        help='Fraction of the data to hold out if no test '
+                             'data is given')
+    parser.add_argument('--jobs', '-j', type=int, default=-1,
+                        help='Number of processes, defaults to cpu count')
+
+
+def main(args):
+    """ Evaluate the recipes and print a table of the results as each one
+        finishes
+
+    :args: argparse.Namespace - the arguments add_arguments defines
+    :returns: int - exit status
+
+    """
+    X, y = read_lines(args.data), read_lines(args.labels)
+    X_test = read_lines(args.test_data) if args.test_data else None
+    y_test = read_lines(args.test_labels) if args.test_labels else None
+    print(HEADER)
+    for result in run(args.recipes, X, y, X_test, y_test, n_jobs=args.jobs,
+                      test_size=args.test_size):
+        print(format_row(result))
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Evaluate recipes in parallel')
+    add_arguments(parser)
+    sys.exit(main(parser.parse_args()))
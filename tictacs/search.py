@@ -0,0 +1,406 @@
+""" search over the param_grid section of a recipe
+
+    The param_grid section maps parameters of the nodes of the pipeline,
+    addressed by label, to the values to try, eg:
+
+    param_grid:
+      svm.C: [0.1, 1, 10]
+      count words.ngram_range: [!tuple [1, 1], !tuple [1, 2]]
+
+    Candidates are cross validated fold by fold in a pool of processes.
+    Steps are memoized so candidates that only differ in the final node
+    reuse the upstream steps fitted on each fold: they are evaluated together
+    by one worker, which keeps the steps in its memory. To share steps
+    between workers pass a directory as memory, see memo.get_step_cache.
+    Successive halving evaluates all candidates on a small subsample and
+    only the best ones on more data. At the timeout the workers are
+    terminated, so a fit in progress doesn't hold the search up. Without
+    workers, ie: n_jobs=1, the timeout is only checked between folds and a
+    fit in progress always runs to the end.
+"""
+import math
+import time
+import queue
+import logging
+import traceback
+import multiprocessing
+import numpy as np
+from .memo import StepCache, get_step_cache, memoize, canonical
+from .runner import SharedData, _init_worker, _data
+from .utils import take
+from .stream import effective_n_jobs
+
+log = logging.getLogger(__name__)
+
+STRATEGIES = ('grid', 'halving')
+
+
+def expand_grid(param_grid):
+    """ Get all combinations of the values in a param grid
+
+    :param_grid: dictionary of parameter -> list of values, or a list of
+                 such dictionaries whose combinations are concatenated
+    :returns: list of dictionaries of parameter -> value
+
+    """
+    if isinstance(param_grid, dict):
+        param_grid = [param_grid]
+    candidates = []
+    for grid in param_grid:
+        keys = sorted(grid)
+        combinations = [dict()]
+        for key in keys:
+            values = grid[key]
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            combinations = [dict(combination, **{key: value})
+                            for combination in combinations
+                            for value in values]
+        candidates.extend(combinations)
+    return candidates
+
+
+def label_paths(estimator):
+    """ Get the sklearn parameter paths of the labeled nodes of a pipeline
+
+    :estimator: the pipeline
+    :returns: dictionary of label -> list of paths, eg: 'svm' -> ['svm']
+              and 'count' -> ['union__count']
+
+    """
+    paths = dict()
+    for key in estimator.get_params(deep=True):
+        parts = key.split('__')
+        for i in range(len(parts) - 1):
+            path = '__'.join(parts[:i + 1])
+            found = paths.setdefault(parts[i], [])
+            if path not in found:
+                found.append(path)
+    return paths
+
+
+def to_sklearn(params, paths):
+    """ Convert label addressed parameters to sklearn parameters. Parameters
+        without a label, eg: svm__C or memory, are kept as they are. A label
+        used in several places of the pipeline sets the parameter in all.
+
+    :params: dictionary of 'label.param' -> value
+    :paths: dictionary returned by label_paths
+    :returns: dictionary of sklearn parameter -> value
+
+    """
+    converted = dict()
+    for key, value in params.items():
+        label, dot, name = key.rpartition('.')
+        if not dot:
+            converted[key] = value
+            continue
+        if label not in paths:
+            raise ValueError('Label "%s" of param_grid entry "%s" is not a '
+                             'node of the pipeline, expected one of: %s'
+                             % (label, key, ', '.join(sorted(paths))))
+        for path in paths[label]:
+            converted['%s__%s' % (path, name)] = value
+    return converted
+
+
+def _evaluate(estimator, X, y, candidates, folds, scoring, deadline=None):
+    """ Cross validate candidates. Folds are the outer loop so the upstream
+        steps fitted on a fold are reused by all candidates sharing them.
+
+    :estimator: the memoized estimator to clone for each candidate
+    :candidates: list of (index, sklearn params)
+    :folds: list of (fold, train indices, test indices)
+    :scoring: str or callable - see sklearn.metrics.check_scoring
+    :deadline: float - time after which no more folds are evaluated
+    :returns: list of (index, fold, score, seconds, error)
+
+    """
+    from sklearn.base import clone
+    from sklearn.metrics import check_scoring
+    results = []
+    for fold, train, test in folds:
+        if deadline is not None and time.time() >= deadline:
+            break
+        X_train, y_train = take(X, train), take(y, train)
+        X_test, y_test = take(X, test), take(y, test)
+        for index, params in candidates:
+            start = time.time()
+            score, error = float('nan'), None
+            try:
+                model = clone(estimator).set_params(**params)
+                model.fit(X_train, y_train)
+                score = check_scoring(model, scoring)(model, X_test, y_test)
+            except Exception:
+                error = traceback.format_exc()
+            results.append((index, fold, float(score), time.time() - start,
+                            error))
+    return results
+
+
+def _init_search_worker(shared, estimator):
+    _init_worker(shared)
+    # the worker keeps one estimator so its steps share the memory cache
+    _data['estimator'] = estimator
+
+
+def _evaluate_shared(candidates, folds, scoring, deadline):
+    """ Cross validate candidates on the data shared with the worker """
+    return _evaluate(_data['estimator'], _data['X'], _data.get('y'),
+                     candidates, folds, scoring, deadline)
+
+
+def _group(candidates, final):
+    """ Group candidates that only differ in the parameters of the final
+        step, so that they can be evaluated by the same worker
+
+    :candidates: list of (index, sklearn params)
+    :final: str - name of the final step or None
+    :returns: list of lists of (index, sklearn params)
+
+    """
+    groups = dict()
+    for index, params in candidates:
+        upstream = sorted((key, value) for key, value in params.items()
+                          if final is None or
+                          not key.startswith(final + '__'))
+        groups.setdefault(canonical(upstream), []).append((index, params))
+    return list(groups.values())
+
+
+def _rungs(n_candidates, n_samples, factor, min_resources):
+    """ Number of samples to evaluate the candidates on at each rung of
+        successive halving. The last rung uses all samples and has at most
+        factor candidates.
+
+    :returns: list of int
+
+    """
+    n_rungs, remaining = 1, n_candidates
+    while remaining > factor:
+        remaining = int(math.ceil(remaining / float(factor)))
+        n_rungs += 1
+    return [min(n_samples, max(min_resources,
+                               n_samples // factor ** (n_rungs - 1 - rung)))
+            for rung in range(n_rungs)]
+
+
+def _subsample_order(n_samples, y, random_state):
+    """ Shuffle the samples so that the first n of them are a subsample.
+        If labels are given the classes are interleaved so that every
+        subsample has about the same class proportions as the data.
+
+    :returns: array of indices
+
+    """
+    order = np.random.RandomState(random_state).permutation(n_samples)
+    if y is None:
+        return order
+    _, classes = np.unique(y[order], return_inverse=True)
+    position = np.zeros(n_samples)
+    for cls in range(classes.max() + 1):
+        members = np.flatnonzero(classes == cls)
+        position[members] = (np.arange(len(members)) + .5) / len(members)
+    return order[np.argsort(position, kind='stable')]
+
+
+def search(estimator, X, y=None, param_grid=None, cv=3, scoring=None,
+           n_jobs=1, strategy='grid', factor=3, min_resources=None,
+           timeout=None, memory=None, refit=True, random_state=0):
+    """ Cross validate the candidates of a param grid and find the best one
+
+    :estimator: a tictac or the path of a recipe
+    :X: the training data
+    :y: the training targets
+    :param_grid: label addressed parameter grid, the param_grid section of
+                 the recipe by default
+    :cv: int - number of folds or a sklearn cross validation splitter
+    :scoring: str or callable - the estimator's score method by default
+    :n_jobs: int - number of processes to evaluate candidates in, -1 for
+             one per cpu
+    :strategy: str - 'grid' to evaluate every candidate on all the data
+               or 'halving' for successive halving
+    :factor: int - only 1 / factor of the candidates make it to the next
+             rung of successive halving, which has factor times the samples
+    :min_resources: int - samples of the first rung of successive halving
+    :timeout: float - seconds after which the evaluations in progress are
+              stopped and the best candidate so far is returned. With
+              n_jobs=1 a fit in progress is not stopped, only the folds
+              after it.
+    :memory: where to cache fitted steps - see memo.get_step_cache. A
+             directory lets workers share the steps they fitted.
+    :refit: bool - fit the best candidate on all the data
+    :random_state: int - seed of the subsamples of successive halving
+    :returns: dictionary with the best_params, best_score, best_estimator
+              if refit and the results of every evaluation
+
+    """
+    from sklearn.base import clone, is_classifier
+    from sklearn.model_selection import check_cv
+    if isinstance(estimator, str):
+        from .parse import from_recipe
+        estimator = from_recipe(estimator)
+    if param_grid is None:
+        param_grid = getattr(estimator, 'param_grid', None)
+    if not param_grid:
+        raise ValueError('No param_grid to search - add a param_grid section '
+                         'to the recipe or pass one')
+    if strategy not in STRATEGIES:
+        raise ValueError('Unknown strategy %s, expected one of: %s'
+                         % (strategy, ', '.join(STRATEGIES)))
+    deadline = time.time() + timeout if timeout is not None else None
+    paths = label_paths(estimator)
+    grid = expand_grid(param_grid)
+    candidates = [(index, to_sklearn(params, paths))
+                  for index, params in enumerate(grid)]
+    memoized = memoize(clone(estimator),
+                       get_step_cache(memory) or StepCache())
+    steps = getattr(memoized, 'steps', None)
+    final = steps[-1][0] if steps else None
+
+    n_samples = X.shape[0] if hasattr(X, 'shape') else len(X)
+    y_all = np.asarray(y) if y is not None else None
+    classifier = is_classifier(estimator)
+    n_splits = check_cv(cv, y_all, classifier=classifier).get_n_splits()
+    if strategy == 'halving':
+        rungs = _rungs(len(candidates), n_samples, factor,
+                       min_resources or 2 * n_splits)
+    else:
+        rungs = [n_samples]
+    order = _subsample_order(n_samples, y_all if classifier else None,
+                             random_state)
+
+    results = []
+    pool = shared = None
+    n_jobs = effective_n_jobs(n_jobs)
+    if n_jobs != 1:
+        shared = SharedData(X=X, y=y)
+        # a multiprocessing pool, since unlike ProcessPoolExecutor it can
+        # terminate the workers in the middle of a fit
+        pool = multiprocessing.Pool(n_jobs, initializer=_init_search_worker,
+                                    initargs=(shared, memoized))
+    try:
+        for rung, resources in enumerate(rungs):
+            if resources < n_samples:
+                subset = np.sort(order[:resources])
+            else:
+                subset = np.arange(n_samples)
+            y_subset = take(y_all, subset)
+            splitter = check_cv(cv, y_subset, classifier=classifier)
+            folds = [(fold, subset[train], subset[test])
+                     for fold, (train, test) in enumerate(
+                         splitter.split(subset, y_subset))]
+            groups = _group(candidates, final)
+            if pool is not None:
+                # a task per group and fold so the candidates of a group
+                # share the upstream steps in the memory of one worker, the
+                # folds of a group one after the other so that at the
+                # deadline as many candidates as possible have all scores
+                tasks = [(group, [fold]) for group in groups
+                         for fold in folds]
+            else:
+                tasks = [(group, folds) for group in groups]
+            log.info('Rung %d: %d candidates on %d samples'
+                     % (rung, len(candidates), resources))
+            evaluations, timed_out = _run(tasks, memoized, X, y, scoring,
+                                          pool, deadline)
+            if timed_out:
+                pool.terminate()
+                pool.join()
+                pool = None
+            scores = dict()
+            for index, fold, score, seconds, error in evaluations:
+                entry = scores.setdefault(index, {'scores': [], 'fit_time': 0.,
+                                                  'error': None})
+                entry['scores'].append((fold, score))
+                entry['fit_time'] += seconds
+                if error is not None:
+                    log.error('Candidate %s failed:\n%s'
+                              % (grid[index], error))
+                    entry['error'] = error
+            ranked = []
+            for index, entry in sorted(scores.items()):
+                fold_scores = [score for _, score in sorted(entry['scores'])]
+                complete = len(fold_scores) == len(folds)
+                mean = float(np.mean(fold_scores)) if complete \
+                    else float('nan')
+                if not np.isnan(mean):
+                    ranked.append((-mean, index))
+                results.append({
+                    'candidate': index,
+                    'params': grid[index],
+                    'rung': rung,
+                    'resources': resources,
+                    'scores': fold_scores,
+                    'mean_score': mean,
+                    'fit_time': entry['fit_time'],
+                    'error': entry['error']})
+            if deadline is not None and time.time() >= deadline:
+                log.warning('Search timed out after rung %d' % rung)
+                break
+            keep = int(math.ceil(len(candidates) / float(factor)))
+            survivors = set(index for _, index in sorted(ranked)[:keep])
+            candidates = [candidate for candidate in candidates
+                          if candidate[0] in survivors]
+            if not candidates:
+                break
+    finally:
+        if pool is not None:
+            # every task has finished unless something failed
+            pool.terminate()
+            pool.join()
+        if shared is not None:
+            shared.cleanup()
+
+    # best of the last rung that was evaluated, on the most samples
+    scored = [result for result in results
+              if not np.isnan(result['mean_score'])]
+    output = {'results': results, 'best_params': None,
+              'best_score': None, 'best_estimator': None}
+    if not scored:
+        log.error('No candidate could be evaluated')
+        return output
+    best = max(scored, key=lambda result: (result['resources'],
+                                           result['mean_score']))
+    output['best_params'] = best['params']
+    output['best_score'] = best['mean_score']
+    if refit:
+        best_estimator = clone(estimator)
+        best_estimator.set_params(**to_sklearn(best['params'], paths))
+        output['best_estimator'] = best_estimator.fit(X, y)
+    return output
+
+
+def _run(tasks, estimator, X, y, scoring, pool, deadline):
+    """ Evaluate tasks in the pool or in this process if there is none,
+        stopping at the deadline
+
+    :tasks: list of (candidates, folds)
+    :returns: list of (index, fold, score, seconds, error) and whether
+              tasks were still pending in the pool at the deadline
+
+    """
+    evaluations = []
+    if pool is None:
+        for candidates, folds in tasks:
+            evaluations.extend(_evaluate(estimator, X, y, candidates, folds,
+                                         scoring, deadline))
+        return evaluations, False
+    # results and errors of the tasks in the order they finish
+    finished = queue.Queue()
+    for candidates, folds in tasks:
+        pool.apply_async(_evaluate_shared,
+                         (candidates, folds, scoring, deadline),
+                         callback=finished.put, error_callback=finished.put)
+    for _ in tasks:
+        remaining = None
+        if deadline is not None:
+            remaining = max(0., deadline - time.time())
+        try:
+            result = finished.get(timeout=remaining)
+        except queue.Empty:
+            return evaluations, True
+        if isinstance(result, BaseException):
+            raise result
+        evaluations.extend(result)
+    return evaluations, False
@@ -0,0 +1,423 @@
+""" serve predictions of a fitted tictac over http, batching concurrent
+    requests together so that predict runs on many samples at a time
+
+    Example: python -m tictacs.serve -m model_dir --port 8000
+             python -m tictacs.serve -r recipe.yaml -d texts.txt -l labels.txt
+
+    POST /predict with {"instances": [...]} returns {"predictions": [...]}
+    GET /metrics returns latency and batch size histograms and queue depth
+"""
+import json
+import time
+import asyncio
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets in milliseconds
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+# largest request body we read into memory
+MAX_BODY_BYTES = 2 ** 24
+
+
+def to_list(predictions):
+    """ Convert predictions to a list of json serializable values """
+    if hasattr(predictions, 'tolist'):
+        return predictions.tolist()
+    return [p.item() if hasattr(p, 'item') else p for p in predictions]
+
+
+class Histogram(object):
+
+    """ Counts of values that fall into buckets """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        # one more count for values larger than the last bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.
+        self.n = 0
+
+    def add(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.total += value
+        self.n += 1
+
+    def to_dict(self):
+        labels = ['<=%s' % bound for bound in self.buckets]
+        labels.append('>%s' % self.buckets[-1])
+        return {'buckets': dict(zip(labels, self.counts)),
+                'count': self.n,
+                'mean': self.total / self.n if self.n else None}
+
+
+class MicroBatcher(object):
+
+    """ Collects concurrent prediction requests into batches of at most
+        max_batch_size samples, waiting at most max_wait seconds for a
+        batch to fill up, and runs predict on each batch in an executor. """
+
+    def __init__(self, model, max_batch_size=64, max_wait=0.005,
+                 executor=None):
+        """ Create a batcher - call start from within the event loop
+
+        :model: anything with a predict method, eg: a fitted tictac
+        :max_batch_size: int - most samples to predict at once
+        :max_wait: float - seconds to wait for more requests once the
+                   first request of a batch arrived
+        :executor: executor to run predict in, a single thread by default
+                   that is shut down when the batcher stops
+
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # an executor we were given is left to its owner to shut down
+        self.own_executor = executor is None
+        self.executor = executor
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.batch_sizes = Histogram((1, 2, 4, 8, 16, 32, 64, 128, 256,
+                                      512, 1024))
+        self.queue = None
+        self.task = None
+
+    def start(self):
+        """ Start batching - must be called from within the event loop """
+        self.queue = asyncio.Queue()
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """ Stop batching """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.own_executor and self.executor is not None:
+            # don't block the loop on a predict that is still running
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    @property
+    def queue_depth(self):
+        """ Number of requests waiting to be batched """
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def predict(self, instances):
+        """ Predict on a list of instances as part of a batch
+
+        :instances: list of samples
+        :returns: list of predictions
+
+        """
+        if not instances:
+            return []
+        future = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self.queue.put((list(instances), future))
+        try:
+            return await future
+        finally:
+            self.latency.add((time.perf_counter() - start) * 1000.)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        pending = None
+        while True:
+            batch = [pending or await self.queue.get()]
+            pending = None
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if size + len(item[0]) > self.max_batch_size:
+                    # doesn't fit - it starts the next batch
+                    pending = item
+                    break
+                batch.append(item)
+                size += len(item[0])
+            await self._predict(loop, batch, size)
+
+    async def _predict(self, loop, batch, size):
+        samples = [sample for instances, _ in batch for sample in instances]
+        self.batch_sizes.add(size)
+        try:
+            predictions = await loop.run_in_executor(
+                self.executor, self.model.predict, samples)
+            predictions = to_list(predictions)
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            # predict each request on its own so that only the requests
+            # that fail by themselves get the error
+            for item in batch:
+                await self._predict(loop, [item], len(item[0]))
+            return
+        start = 0
+        for instances, future in batch:
+            end = start + len(instances)
+            if not future.done():
+                future.set_result(predictions[start:end])
+            start = end
+
+    def metrics(self):
+        """ Get the current metrics
+
+        :returns: dictionary
+
+        """
+        return {'queue_depth': self.queue_depth,
+                'latency_ms': self.latency.to_dict(),
+                'batch_size': self.batch_sizes.to_dict()}
+
+
+class BadRequest(ValueError):
+
+    """ Raised when a request can't be parsed """
+
+    status = '400 Bad Request'
+
+
+class PayloadTooLarge(BadRequest):
+
+    """ Raised when the body of a request is larger than we accept """
+
+    status = '413 Payload Too Large'
+
+
+class Server(object):
+
+    """ Minimal http/1.1 server in front of a MicroBatcher listening on a
+        tcp port or a unix socket """
+
+    def __init__(self, model, max_body_bytes=MAX_BODY_BYTES,
+                 **batcher_params):
+        """ Create a server
+
+        :model: anything with a predict method, eg: a fitted tictac
+        :max_body_bytes: int - requests with larger bodies are answered
+                         with 413 without reading the body
+        :batcher_params: passed to MicroBatcher
+
+        """
+        self.max_body_bytes = max_body_bytes
+        self.batcher = MicroBatcher(model, **batcher_params)
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8000, path=None):
+        """ Start listening
+
+        :host: str - address to listen on
+        :port: int - port to listen on, 0 for any free port
+        :path: str - listen on this unix socket instead of a port
+        :returns: self
+
+        """
+        self.batcher.start()
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle,
+                                                          path=path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host,
+                                                     port)
+        return self
+
+    @property
+    def port(self):
+        """ Port we are listening on """
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """ Stop listening and batching """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except BadRequest as e:
+                    # we can't tell where the next request starts
+                    await self._respond(writer, e.status,
+                                        {'error': str(e)}, False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload = await self._route(method, target, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        data = json.dumps(payload).encode('utf-8')
+        writer.write(('HTTP/1.1 %s\r\n'
+                      'Content-Type: application/json\r\n'
+                      'Content-Length: %d\r\n'
+                      'Connection: %s\r\n\r\n'
+                      % (status, len(data),
+                         'keep-alive' if keep_alive else 'close')
+                      ).encode('ascii') + data)
+        await writer.drain()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) < 2:
+            raise BadRequest('Expected a request line with a method and a '
+                             'target')
+        method, target = parts[:2]
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise BadRequest('Expected Content-Length to be a number of '
+                             'bytes')
+        if length > self.max_body_bytes:
+            raise PayloadTooLarge('Expected at most %d bytes of body, got '
+                                  '%d' % (self.max_body_bytes, length))
+        body = await reader.readexactly(length) if length else b''
+        return method, target, headers, body
+
+    async def _route(self, method, target, body):
+        if method == 'POST' and target == '/predict':
+            try:
+                instances = json.loads(body.decode('utf-8'))['instances']
+            except (ValueError, KeyError, TypeError):
+                instances = None
+            if not isinstance(instances, list):
+                return '400 Bad Request', {'error': 'Expected json with a '
+                                                    'list of instances'}
+            try:
+                predictions = await self.batcher.predict(instances)
+            except Exception as e:
+                log.exception('Prediction failed')
+                return '500 Internal Server Error', {'error': str(e)}
+            return '200 OK', {'predictions': predictions}
+        if method == 'GET' and target == '/metrics':
+            return '200 OK', self.batcher.metrics()
+        if method == 'GET' and target == '/health':
+            return '200 OK', {'status': 'ok'}
+        return '404 Not Found', {'error': 'No route for %s %s'
+                                          % (method, target)}
+
+
+def load_model(model=None, recipe=None, data=None, labels=None):
+    """ Get the tictac to serve
+
+    :model: str - directory a fitted tictac was saved to
+    :recipe: str - recipe to build the tictac from if no model is given
+    :data: str - file with one training sample per line to fit the recipe,
+           if None the recipe is fitted on its data section like
+           registry.load_model does, see Tictac.fit_data
+    :labels: str - file with one training label per line
+    :returns: the fitted tictac
+
+    """
+    if model is not None:
+        from .store import load
+        return load(model)
+    if recipe is None:
+        raise ValueError('Either a saved model or a recipe is needed')
+    from .parse import from_recipe, Conjurer
+    if data is None:
+        tictac = from_recipe(recipe)
+        if getattr(tictac, Conjurer.DATA, None) is None:
+            raise ValueError('Recipe %s has no %s section to fit it on - '
+                             'pass the training data' % (recipe,
+                                                         Conjurer.DATA))
+        return tictac.fit_data()
+    with open(data) as f:
+        X = [line.rstrip('\n') for line in f]
+    y = None
+    if labels is not None:
+        with open(labels) as f:
+            y = [line.rstrip('\n') for line in f]
+    tictac = from_recipe(recipe)
+    tictac.fit(X, y)
+    return tictac
+
+
+async def serve(model, host='127.0.0.1', port=8000, path=None,
+                **server_params):
+    """ Serve predictions of model until cancelled """
+    server = await Server(model, **server_params).start(host, port, path)
+    log.info('Serving on %s' % (path or '%s:%d' % (host, server.port)))
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Serve predictions of a tictac')
+    parser.add_argument('--model', '-m',
+                        help='Directory a fitted tictac was saved to')
+    parser.add_argument('--recipe', '-r',
+                        help='Recipe to build and fit if no model is given')
+    parser.add_argument('--data', '-d',
+                        help='Training data to fit the recipe on, one '
+                             'sample per line - the data section of the '
+                             'recipe by default')
+    parser.add_argument('--labels', '-l',
+                        help='Training labels, one per line')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix-socket', dest='path',
+                        help='Listen on a unix socket instead of a port')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait', type=float, default=0.005,
+                        help='Seconds to wait for a batch to fill up')
+    parser.add_argument('--max-body-bytes', type=int, default=MAX_BODY_BYTES,
+                        help='Largest request body to accept')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    tictac = load_model(args.model, args.recipe, args.data, args.labels)
+    try:
+        asyncio.run(serve(tictac, args.host, args.port, args.path,
+                          max_batch_size=args.max_batch_size,
+                          max_wait=args.max_wait,
+                          max_body_bytes=args.max_body_bytes))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,326 @@
+""" slimming fitted tictacs for serving
+
+    Fitted estimators keep state that is only needed for training or that
+    takes more memory than predicting needs. slim walks the nodes of a
+    fitted tictac and:
+
+    - drops training only attributes, eg: stop_words_ of vectorizers
+    - if the recipe opts in, replaces dict vocabularies with a
+      CompactVocabulary - a few arrays instead of a python string and int
+      object per term, at the cost of slower lookups
+    - if the recipe opts in, downcasts float64 coefficients to float32
+      where no value overflows or underflows. This rounds them, so
+      predictions close to a decision boundary can change
+    - makes nodes share equal fitted arrays and vocabularies so they are
+      held, pickled and saved once
+
+    Recipes choose what is done with a slim_options entry, eg:
+
+    slim_options:
+      vocabulary: true
+      downcast: true
+
+    A slimmed tictac predicts as before, up to the rounding of downcast,
+    but should not be fitted again.
+    The arrays are plain numpy arrays, so tictacs saved with save after
+    slimming map them from disk and share them between processes.
+"""
+import gc
+import sys
+from zlib import crc32
+import types
+import logging
+from collections.abc import Mapping
+import numpy as np
+from .parse import Conjurer
+from .memo import digest, MemoizedStep
+from .reload import NESTED
+from .wrappers import EstimatorWrapper
+
+log = logging.getLogger(__name__)
+
+# fitted attributes only needed for training or inspection
+TRAINING_ONLY = ('stop_words_', 'loss_curve_', 'validation_scores_',
+                 'oob_decision_function_', 'oob_prediction_')
+# entries of the recipe kept on the tictac that predicting doesn't need
+RECIPE_ONLY = (Conjurer.GRID, Conjurer.DATA, Conjurer.EVALUATION)
+# fitted arrays that are only multiplied with the input, so float32 is
+# enough precision for them
+DOWNCAST = ('coef_', 'intercept_', 'idf_', 'components_',
+            'feature_log_prob_', 'class_log_prior_')
+# smaller arrays are not worth sharing
+MIN_SHARE_BYTES = 1024
+# what slim does unless the recipe or the caller say otherwise -
+# CompactVocabulary makes vectorizing slower and downcasting is lossy so
+# they are opt in
+DEFAULTS = {'vocabulary': False, 'downcast': False, 'share': True}
+
+
+class CompactVocabulary(Mapping):
+
+    """ Read only mapping of term -> index stored in arrays. The terms are
+        utf-8 encoded one after the other in one byte array and found with
+        an open addressing hash table of their crc32 hashes. Each term takes
+        its length plus about 12 bytes instead of over a hundred in a dict.
+        Lookups are a python method call of about a microsecond instead of
+        a dict lookup, which slows down vectorizing by a few times. """
+
+    def __init__(self, vocabulary):
+        """ Compact a vocabulary
+
+        :vocabulary: dictionary of str term -> int index, the indices
+                     being 0 to len(vocabulary) - 1
+
+        """
+        terms = [None] * len(vocabulary)
+        for term, index in vocabulary.items():
+            if 0 <= index < len(terms):
+                terms[index] = term.encode('utf-8', 'surrogatepass')
+        if any(term is None for term in terms):
+            raise ValueError('Expected the indices of the vocabulary to be '
+                             '0 to %d' % (len(terms) - 1))
+        lengths = np.fromiter((len(term) for term in terms), dtype=np.int64,
+                              count=len(terms))
+        index_dtype = np.int32 if lengths.sum() < 2 ** 31 else np.int64
+        self.offsets = np.zeros(len(terms) + 1, dtype=index_dtype)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.terms = np.frombuffer(b''.join(terms), dtype=np.uint8)
+        # at most half full so that probe sequences stay short
+        size = 1 << max(1, 2 * len(terms) - 1).bit_length()
+        # slot -> index + 1 of the term hashed there, 0 if empty
+        self.table = np.zeros(size, dtype=np.int32)
+        mask = size - 1
+        for index, term in enumerate(terms):
+            slot = crc32(term) & mask
+            while self.table[slot]:
+                slot = (slot + 1) & mask
+            self.table[slot] = index + 1
+        self._views = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_views'] = None
+        return state
+
+    def _get_views(self):
+        # memoryviews index in c, much faster than numpy scalars
+        if self._views is None:
+            self._views = tuple(memoryview(np.ascontiguousarray(arr))
+                                for arr in (self.table, self.offsets,
+                                            self.terms))
+        return self._views
+
+    def __getitem__(self, term):
+        table, offsets, terms = self._views or self._get_views()
+        try:
+            encoded = term.encode('utf-8', 'surrogatepass')
+        except AttributeError:
+            raise KeyError(term)
+        mask = len(table) - 1
+        slot = crc32(encoded) & mask
+        entry = table[slot]
+        while entry:
+            if terms[offsets[entry - 1]:offsets[entry]] == encoded:
+                return entry - 1
+            slot = (slot + 1) & mask
+            entry = table[slot]
+        raise KeyError(term)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def term(self, index):
+        """ Get the term with an index
+
+        :index: int
+        :returns: str
+
+        """
+        offsets, terms = self.offsets, self.terms
+        return terms[offsets[index]:offsets[index + 1]].tobytes() \
+            .decode('utf-8', 'surrogatepass')
+
+    def __iter__(self):
+        return (self.term(index) for index in range(len(self)))
+
+    def items(self):
+        return ((self.term(index), index) for index in range(len(self)))
+
+    def values(self):
+        return iter(range(len(self)))
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'CompactVocabulary of %d terms' % len(self)
+
+
+def footprint(obj, exclude=()):
+    """ Estimate the memory an object holds - itself and everything it
+        references apart from classes, functions and modules. Memory
+        mapped arrays are not counted since the os shares them.
+
+    :obj: the object, eg: a tictac
+    :exclude: objects not to count, along with what only they reference
+    :returns: int - number of bytes
+
+    """
+    skip = (type, types.ModuleType, types.FunctionType,
+            types.BuiltinFunctionType, types.MethodType)
+    seen, total, todo = set(id(item) for item in exclude), 0, [obj]
+    while todo:
+        item = todo.pop()
+        if id(item) in seen or isinstance(item, skip):
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            if not isinstance(item, np.memmap):
+                # includes the data if the array owns it, views count the
+                # header and the owner of the data counts the data once
+                total += sys.getsizeof(item)
+                if item.base is not None:
+                    todo.append(item.base)
+            continue
+        total += sys.getsizeof(item)
+        todo.extend(gc.get_referents(item))
+    return total
+
+
+def _detach(node):
+    """ Get the estimator inside any wrappers of a node, giving memoized
+        steps a private copy of it so that slimming doesn't change the cache
+        of fitted steps """
+    while isinstance(node, EstimatorWrapper):
+        if isinstance(node, MemoizedStep):
+            node.detach()
+        node = node.wrapped()
+    return node
+
+
+def _nodes(node, path=()):
+    """ Get the nodes of a tree of estimators, including the estimators
+        held in the fitted attributes of nodes, eg: a TfidfVectorizer's
+        TfidfTransformer
+
+    :returns: list of (label path, unwrapped node)
+
+    """
+    inner = _detach(node)
+    found = [(path, inner)]
+    for key in NESTED:
+        entries = getattr(inner, key, None)
+        if isinstance(entries, list):
+            for entry in entries:
+                if hasattr(entry[1], 'get_params'):
+                    found.extend(_nodes(entry[1], path + (entry[0],)))
+    params = inner.get_params(deep=False) if hasattr(inner, 'get_params') \
+        else dict()
+    for name, value in vars(inner).items():
+        if name not in params and hasattr(value, 'get_params'):
+            found.extend(_nodes(value, path + (name,)))
+    return found
+
+
+def _safe_float32(arr):
+    cast = arr.astype(np.float32)
+    return np.array_equal(np.isfinite(cast), np.isfinite(arr)) and \
+        np.count_nonzero(cast) == np.count_nonzero(arr)
+
+
+def get_options(tictac, **options):
+    """ Get what slim does to a tictac - the defaults, updated with the
+        slim_options entry of its recipe and then with the options given
+
+    :tictac: the tictac
+    :options: bool values of vocabulary, downcast and share, None to keep
+              the value of the recipe
+    :returns: dictionary of option -> bool
+
+    """
+    recipe = getattr(tictac, Conjurer.SLIM, None) or dict()
+    if not isinstance(recipe, dict):
+        raise ValueError('Expected the slim_options entry of the recipe to '
+                         'map options to values, got %r' % (recipe,))
+    unknown = set(recipe) - set(DEFAULTS)
+    if unknown:
+        raise ValueError('Unknown slim options %s, expected some of: %s'
+                         % (', '.join(sorted(unknown)),
+                            ', '.join(sorted(DEFAULTS))))
+    resolved = dict(DEFAULTS, **recipe)
+    resolved.update((key, value) for key, value in options.items()
+                    if value is not None)
+    return resolved
+
+
+def slim(tictac, vocabulary=None, downcast=None, share=None):
+    """ Slim a fitted tictac in place for serving. Options left to None
+        come from the slim_options entry of the recipe, or DEFAULTS.
+
+    :tictac: the fitted tictac
+    :vocabulary: bool - replace dict vocabularies with CompactVocabulary,
+                 off by default since lookups get slower
+    :downcast: bool - downcast float64 coefficients to float32, off by
+               default since predictions can change slightly
+    :share: bool - make nodes share equal fitted arrays and vocabularies
+    :returns: dictionary with the footprint in bytes before and after and
+              the label path and attribute of what was dropped, compacted,
+              downcast and shared
+
+    """
+    options = get_options(tictac, vocabulary=vocabulary, downcast=downcast,
+                          share=share)
+    vocabulary = options['vocabulary']
+    downcast = options['downcast']
+    share = options['share']
+    report = {'before': footprint(tictac), 'dropped': [], 'compacted': [],
+              'downcast': [], 'shared': []}
+    for key in RECIPE_ONLY:
+        if getattr(tictac, key, None) is not None:
+            setattr(tictac, key, None)
+            report['dropped'].append(((), key))
+    # digest -> first instance of equal arrays and vocabularies
+    instances = dict()
+    seen = set()
+    for path, node in _nodes(tictac):
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        for name in TRAINING_ONLY:
+            if name in vars(node):
+                delattr(node, name)
+                report['dropped'].append((path, name))
+        for name, value in list(vars(node).items()):
+            if not name.endswith('_') or name.startswith('_'):
+                continue
+            if vocabulary and type(value) is dict and value and \
+                    name.startswith('vocabulary') and \
+                    all(type(term) is str for term in value):
+                try:
+                    value = CompactVocabulary(value)
+                    report['compacted'].append((path, name))
+                except (ValueError, TypeError):
+                    log.warning('Could not compact %s of %s'
+                                % (name, '/'.join(path)))
+            if downcast and name in DOWNCAST and \
+                    type(value) is np.ndarray and \
+                    value.dtype == np.float64 and _safe_float32(value):
+                value = value.astype(np.float32)
+                report['downcast'].append((path, name))
+            if share and (isinstance(value, CompactVocabulary) or
+                          type(value) is np.ndarray and
+                          value.nbytes >= MIN_SHARE_BYTES):
+                if isinstance(value, CompactVocabulary):
+                    key = digest(value.terms) + digest(value.table)
+                else:
+                    key = digest(value)
+                if instances.setdefault(key, value) is not value:
+                    value = instances[key]
+                    report['shared'].append((path, name))
+            if value is not getattr(node, name):
+                setattr(node, name, value)
+    report['after'] = footprint(tictac)
+    log.info('Slimmed tictac from %d to %d bytes'
+             % (report['before'], report['after']))
+    return report
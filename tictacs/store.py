@@ -0,0 +1,177 @@
+""" saving fitted tictacs so that their large arrays can be memory mapped
+
+    A saved tictac is a directory with a small pickle of the object graph
+    and one .npy file for each large numeric array in it, including the
+    buffers of scipy sparse matrices. On load the arrays are mapped read
+    only, so loading is quick and processes loading the same model share
+    one copy of the arrays through the os page cache. A digest of the
+    content of each array is written along with it and set as the
+    content_digest attribute of the mapped array, so arrays can be
+    compared without reading them. """
+import os
+import json
+import pickle
+import uuid
+import shutil
+import hashlib
+
+MODEL_FILE = 'model.pkl'
+ARRAY_DIR = 'arrays'
+# index of array -> digest of its content, in the array directory
+DIGEST_FILE = 'digests.json'
+# arrays smaller than this are kept in the pickle
+MIN_BYTES = 2 ** 16
+
+
+class _ArrayPickler(pickle.Pickler):
+
+    """ Pickler that writes large numeric arrays to separate files """
+
+    def __init__(self, f, directory, min_bytes):
+        pickle.Pickler.__init__(self, f, pickle.HIGHEST_PROTOCOL)
+        import numpy
+        self.numpy = numpy
+        self.directory = directory
+        self.min_bytes = min_bytes
+        # id of array -> index, so shared arrays are written once
+        self.written = dict()
+        # keep arrays alive so ids are not reused while pickling
+        self.arrays = []
+
+    def persistent_id(self, obj):
+        if type(obj) is not self.numpy.ndarray and \
+                not isinstance(obj, self.numpy.memmap):
+            return None
+        if obj.dtype.hasobject or obj.nbytes < self.min_bytes:
+            return None
+        index = self.written.get(id(obj))
+        if index is None:
+            index = len(self.arrays)
+            contiguous = self.numpy.ascontiguousarray(obj)
+            # np.save pads the header so the data is 64 byte aligned
+            self.numpy.save(os.path.join(self.directory, '%d.npy' % index),
+                            contiguous)
+            self.written[id(obj)] = index
+            self.arrays.append(obj)
+            self.digests.append(array_digest(contiguous))
+        return ('ndarray', index)
+
+    def reducer_override(self, obj):
+        """ Pickle tictacs so that their Tictac class is created again from
+            its base and parameter names when they are loaded, instead of
+            loading them as instances of the base class """
+        cls = type(obj)
+        if '_tictac_base' not in vars(cls):
+            return NotImplemented
+        from .parse import _restore_tac
+        # base classes can add to the state, eg: the sklearn version
+        state = getattr(obj, '__getstate__', lambda: obj.__dict__)()
+        return (_restore_tac, (cls._tictac_base, cls._tictac_params), state)
+
+    def dump(self, obj):
+        self.digests = []
+        pickle.Pickler.dump(self, obj)
+        with open(os.path.join(self.directory, DIGEST_FILE), 'w') as f:
+            json.dump(self.digests, f)
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+
+    """ Unpickler that maps arrays written by _ArrayPickler """
+
+    def __init__(self, f, directory, mmap_mode):
+        pickle.Unpickler.__init__(self, f)
+        import numpy
+        self.numpy = numpy
+        self.directory = directory
+        self.mmap_mode = mmap_mode
+        self.loaded = dict()
+        try:
+            with open(os.path.join(directory, DIGEST_FILE)) as f:
+                self.digests = json.load(f)
+        except (IOError, OSError, ValueError):
+            # saved before digests were
+            self.digests = []
+
+    def persistent_load(self, pid):
+        kind, index = pid
+        if kind != 'ndarray':
+            raise pickle.UnpicklingError('Unknown persistent id %s' % kind)
+        if index not in self.loaded:
+            path = os.path.join(self.directory, '%d.npy' % index)
+            arr = self.numpy.load(path, mmap_mode=self.mmap_mode)
+            if isinstance(arr, self.numpy.memmap) and \
+                    index < len(self.digests):
+                arr.content_digest = self.digests[index]
+            self.loaded[index] = arr
+        return self.loaded[index]
+
+
+def array_digest(arr):
+    """ Digest of the dtype, shape and data of a contiguous array
+
+    :arr: c contiguous array
+    :returns: str - hex digest
+
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(('%s %s' % (arr.dtype.str, arr.shape)).encode('utf-8'))
+    h.update(arr.reshape(-1).view('u1'))
+    return h.hexdigest()
+
+
+def save(tictac, path, min_bytes=MIN_BYTES):
+    """ Save a fitted tictac to a directory. A tictac already saved in the
+        directory is replaced. The tictac is written to a directory next to
+        it that is then renamed to path, so loading never finds a tictac
+        that is half written - while the old one is swapped for the new one
+        path briefly doesn't exist.
+
+    :tictac: the tictac, or any picklable estimator
+    :path: str - directory to save to
+    :min_bytes: int - arrays at least this large are stored in their own
+                file so they can be memory mapped
+    :raises ValueError: if path exists and is not an empty directory or a
+                        directory a tictac was saved to
+
+    """
+    path = os.path.abspath(path)
+    if os.path.exists(path) and not (
+            os.path.isdir(path) and
+            (not os.listdir(path) or
+             os.path.isfile(os.path.join(path, MODEL_FILE)))):
+        raise ValueError('Refusing to replace %s, which is not a directory a '
+                         'tictac was saved to' % path)
+    parent, name = os.path.split(path)
+    tmp = os.path.join(parent, '.%s.tmp-%s' % (name, uuid.uuid4().hex))
+    old = None
+    try:
+        directory = os.path.join(tmp, ARRAY_DIR)
+        os.makedirs(directory)
+        with open(os.path.join(tmp, MODEL_FILE), 'wb') as f:
+            _ArrayPickler(f, directory, min_bytes).dump(tictac)
+        if os.path.exists(path):
+            # directories can't be replaced by rename, move the old aside
+            old = os.path.join(parent,
+                               '.%s.old-%s' % (name, uuid.uuid4().hex))
+            os.replace(path, old)
+        os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if old is not None:
+        # processes that mapped its arrays keep them until they unmap them
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def load(path, mmap=True):
+    """ Load a tictac saved with save
+
+    :path: str - directory the tictac was saved to
+    :mmap: bool - map arrays read only instead of reading them into memory
+    :returns: the tictac, with its Tictac class created again
+
+    """
+    directory = os.path.join(path, ARRAY_DIR)
+    with open(os.path.join(path, MODEL_FILE), 'rb') as f:
+        return _ArrayUnpickler(f, directory, 'r' if mmap else None).load()
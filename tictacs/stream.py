@@ -0,0 +1,118 @@
+""" helpers for processing data in chunks so that memory stays bounded """
+import os
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+BACKENDS = ('thread', 'process')
+
+
+def chunked(iterable, size):
+    """ Split an iterable into lists of at most size elements
+
+    :iterable: any iterable
+    :size: int - number of elements per chunk
+    :returns: generator of lists, or of slices if iterable is a list,
+              tuple or array
+
+    """
+    if size < 1:
+        raise ValueError('Chunk size must be positive, got %s' % size)
+    if isinstance(iterable, (list, tuple)) or hasattr(iterable, 'shape'):
+        # slice sequences and arrays - for arrays slices are views
+        for start in range(0, iterable.shape[0] if hasattr(iterable, 'shape')
+                           else len(iterable), size):
+            yield iterable[start:start + size]
+        return
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def effective_n_jobs(n_jobs):
+    """ Get the number of workers to use
+
+    :n_jobs: int - number of workers, negative to count back from the
+             number of cpus, eg: -1 for all cpus
+    :returns: int
+
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+# object the worker processes call methods of - set when they start
+_target = None
+
+
+def _set_target(target):
+    global _target
+    _target = target
+
+
+def _call_target(method, chunk):
+    return getattr(_target, method)(chunk)
+
+
+def _call(target, method, chunk):
+    return getattr(target, method)(chunk)
+
+
+def map_ordered(target, method, chunks, n_jobs=1, backend='thread',
+                prefetch=None):
+    """ Call a method of target on each chunk, possibly in a pool of threads
+        or processes, yielding results in the order of the chunks. At most
+        prefetch chunks are read ahead so memory stays bounded.
+
+    :target: the object whose method we call, eg: a tictac. With the
+             process backend it is pickled once per worker.
+    :method: str - name of the method to call on each chunk
+    :chunks: iterable of chunks
+    :n_jobs: int - number of workers, 1 or None to call the method in this
+             thread, negative to count back from the number of cpus, see
+             effective_n_jobs
+    :backend: str - 'thread' or 'process'
+    :prefetch: int - number of chunks in flight, defaults to 2 * n_jobs
+    :returns: generator of the results for each chunk
+
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Backend should be one of %s, got %s'
+                         % (BACKENDS, backend))
+    n_jobs = effective_n_jobs(n_jobs)
+    if n_jobs == 1:
+        for chunk in chunks:
+            yield getattr(target, method)(chunk)
+        return
+    prefetch = prefetch or 2 * n_jobs
+    if backend == 'thread':
+        pool = ThreadPoolExecutor(max_workers=n_jobs)
+
+        def submit(chunk):
+            return pool.submit(_call, target, method, chunk)
+    else:
+        pool = ProcessPoolExecutor(max_workers=n_jobs,
+                                   initializer=_set_target,
+                                   initargs=(target,))
+
+        def submit(chunk):
+            return pool.submit(_call_target, method, chunk)
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(submit(chunk))
+            if len(pending) >= prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # don't wait for chunks nobody will ask for if we stop early
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
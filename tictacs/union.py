@@ -0,0 +1,253 @@
+""" a feature union that runs its branches in threads
+
+    Recipes use it like sklearn's FeatureUnion:
+
+    - label: features
+      estimator: ThreadedUnion
+      estimator_pkg: tictacs.union
+      estimator_params:
+        transformer_list:
+          - ...
+"""
+import copy
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from sklearn.base import clone
+from sklearn.pipeline import FeatureUnion
+from sklearn.feature_extraction.text import CountVectorizer, \
+    HashingVectorizer
+from .memo import canonical
+from .stream import effective_n_jobs
+
+# parameters of text vectorizers that decide how documents are analyzed
+ANALYSIS_PARAMS = ('input', 'encoding', 'decode_error', 'strip_accents',
+                   'lowercase', 'preprocessor', 'tokenizer', 'stop_words',
+                   'token_pattern', 'ngram_range', 'analyzer')
+
+
+def _identity(tokens):
+    """ Analyzer of documents that have already been analyzed """
+    return tokens
+
+
+# parameters that make a vectorizer take analyzed documents
+PRE_ANALYZED = {'input': 'content', 'strip_accents': None, 'lowercase': False,
+                'preprocessor': None, 'tokenizer': None, 'stop_words': None,
+                'token_pattern': None, 'ngram_range': (1, 1),
+                'analyzer': _identity}
+
+
+def hstack_csr(blocks, weights=None, dtype=None):
+    """ Stack sparse matrices horizontally into one csr matrix, writing
+        each block straight into its place in the output.
+
+    :blocks: list of sparse matrices with the same number of rows
+    :weights: list of float or None - multiply each block by its weight
+    :dtype: dtype of the output, the common dtype of the blocks by default
+    :returns: csr matrix
+
+    """
+    import scipy.sparse as sp
+    blocks = [block.tocsr() for block in blocks]
+    weights = weights or [None] * len(blocks)
+    n_rows = blocks[0].shape[0]
+    n_cols = sum(block.shape[1] for block in blocks)
+    nnz = sum(block.nnz for block in blocks)
+    if dtype is None:
+        dtype = np.result_type(*[block.dtype for block in blocks])
+    index_dtype = np.int32 if max(nnz, n_cols) < 2 ** 31 else np.int64
+    counts = [np.diff(block.indptr) for block in blocks]
+    indptr = np.zeros(n_rows + 1, dtype=index_dtype)
+    np.cumsum(sum(counts), out=indptr[1:])
+    data = np.empty(nnz, dtype=dtype)
+    indices = np.empty(nnz, dtype=index_dtype)
+    # where the entries of the current block start in each row
+    starts = indptr[:-1].astype(np.int64)
+    col_offset = 0
+    for block, count, weight in zip(blocks, counts, weights):
+        if block.nnz:
+            # position of each entry of the block in the output
+            dest = np.repeat(starts - block.indptr[:-1], count) + \
+                np.arange(block.nnz)
+            data[dest] = block.data if weight is None \
+                else block.data * weight
+            indices[dest] = block.indices + col_offset
+        starts += count
+        col_offset += block.shape[1]
+    out = sp.csr_matrix((data, indices, indptr), shape=(n_rows, n_cols))
+    out.has_sorted_indices = all(block.has_sorted_indices
+                                 for block in blocks)
+    return out
+
+
+class ThreadedUnion(FeatureUnion):
+
+    """ FeatureUnion whose branches are fitted and applied in a pool of
+        threads instead of processes, so the data isn't pickled to them,
+        and whose sparse outputs are written straight into one csr matrix.
+        Text vectorizer branches that analyze documents the same way can
+        share one analysis of the documents. Like FeatureUnion the branches
+        are cloned before fitting. Outputs are numpy arrays or csr matrices,
+        set_output only accepts the default. """
+
+    def __init__(self, transformer_list, *, n_jobs=None,
+                 transformer_weights=None, verbose=False,
+                 verbose_feature_names_out=True, share_analysis=True):
+        """ Create the union
+
+        :transformer_list: list of (label, transformer)
+        :n_jobs: int - number of threads, 1 if None and -1 for one per cpu
+                 - see stream.effective_n_jobs
+        :transformer_weights: dictionary of label -> weight of the output
+        :share_analysis: bool - analyze the documents once for vectorizer
+                         branches that analyze them the same way
+
+        """
+        super(ThreadedUnion, self).__init__(
+            transformer_list, n_jobs=n_jobs,
+            transformer_weights=transformer_weights, verbose=verbose,
+            verbose_feature_names_out=verbose_feature_names_out)
+        self.share_analysis = share_analysis
+
+    def _branches(self):
+        """ Group the branches by the way they analyze documents
+
+        :returns: list of (name, transformer, weight, group) - group is the
+                  key of the analysis the branch shares, or None
+
+        """
+        self.transformer_list = list(self.transformer_list)
+        self._validate_transformers()
+        self._validate_transformer_weights()
+        branches = list(self._iter())
+        keys = [None] * len(branches)
+        if self.share_analysis:
+            for i, (_, trans, _) in enumerate(branches):
+                if isinstance(trans, (CountVectorizer, HashingVectorizer)) \
+                        and not callable(trans.analyzer) \
+                        and trans.input == 'content':
+                    params = trans.get_params(deep=False)
+                    keys[i] = canonical([(param, params[param])
+                                         for param in ANALYSIS_PARAMS])
+        # only share analyses used by more than one branch
+        for i, key in enumerate(keys):
+            if keys.count(key) < 2:
+                keys[i] = None
+        return [branch + (key,) for branch, key in zip(branches, keys)]
+
+    def _analyze(self, branches, X):
+        """ Analyze X once for each group of branches, the groups in the
+            pool of threads
+
+        :returns: dictionary of group -> list of analyzed documents
+
+        """
+        analyzers = dict()
+        for _, trans, _, key in branches:
+            if key is not None and key not in analyzers:
+                analyzers[key] = trans.build_analyzer()
+
+        def analyze_all(item):
+            key, analyze = item
+            return key, [analyze(doc) for doc in X]
+        return dict(self._map(analyze_all, list(analyzers.items())))
+
+    def _map(self, func, items):
+        n_jobs = effective_n_jobs(self.n_jobs)
+        if n_jobs == 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(n_jobs, len(items))) as pool:
+            return list(pool.map(func, items))
+
+    def fit(self, X, y=None, **fit_params):
+        """ Fit all branches on X
+
+        :returns: self
+
+        """
+        self._fit(X, y, False, fit_params)
+        return self
+
+    def fit_transform(self, X, y=None, **fit_params):
+        """ Fit all branches on X and stack their outputs
+
+        :returns: the stacked outputs
+
+        """
+        return self._fit(X, y, True, fit_params)
+
+    def _fit(self, X, y, transform, fit_params):
+        branches = self._branches()
+        analyzed = self._analyze(branches, X)
+
+        def fit_one(branch):
+            name, trans, weight, key = branch
+            trans = clone(trans)
+            if key is None:
+                if not transform:
+                    return trans.fit(X, y, **fit_params), None
+                if hasattr(trans, 'fit_transform'):
+                    return trans, trans.fit_transform(X, y, **fit_params)
+                return trans, trans.fit(X, y, **fit_params).transform(X)
+            # fit on the shared analysis and restore the parameters, which
+            # leaves the vectorizer fitted as if it had analyzed X itself
+            params = trans.get_params(deep=False)
+            trans.set_params(**PRE_ANALYZED)
+            try:
+                if transform:
+                    return trans, trans.fit_transform(analyzed[key], y)
+                return trans.fit(analyzed[key], y), None
+            finally:
+                trans.set_params(**dict((param, params[param])
+                                        for param in PRE_ANALYZED))
+        fitted = self._map(fit_one, branches)
+        self._update_transformer_list([trans for trans, _ in fitted])
+        if transform:
+            return self._stack(branches, [out for _, out in fitted], X)
+        return None
+
+    def set_output(self, *, transform=None):
+        """ Set the output container of transform and fit_transform - only
+            the default one is supported
+
+        :transform: str - 'default' or None
+        :returns: self
+
+        """
+        if transform not in (None, 'default'):
+            raise ValueError('ThreadedUnion outputs numpy arrays or csr '
+                             'matrices, set_output(transform=%r) is not '
+                             'supported' % (transform,))
+        return super(ThreadedUnion, self).set_output(transform=transform)
+
+    def transform(self, X):
+        """ Transform X with each branch and stack their outputs
+
+        :returns: the stacked outputs
+
+        """
+        branches = self._branches()
+        analyzed = self._analyze(branches, X)
+
+        def transform_one(branch):
+            name, trans, weight, key = branch
+            if key is None:
+                return trans.transform(X)
+            # a shallow copy takes the analyzed documents without changing
+            # the vectorizer other threads may be using
+            pre_analyzed = copy.copy(trans).set_params(**PRE_ANALYZED)
+            return pre_analyzed.transform(analyzed[key])
+        return self._stack(branches, self._map(transform_one, branches), X)
+
+    def _stack(self, branches, outputs, X):
+        import scipy.sparse as sp
+        if not outputs:
+            return np.zeros((X.shape[0] if hasattr(X, 'shape') else len(X),
+                             0))
+        weights = [weight for _, _, weight, _ in branches]
+        if any(sp.issparse(out) for out in outputs):
+            return hstack_csr([out if sp.issparse(out)
+                               else sp.csr_matrix(out) for out in outputs],
+                              weights)
+        return np.hstack([out if weight is None else out * weight
+                          for out, weight in zip(outputs, weights)])
@@ -0,0 +1,18 @@
+""" small helpers shared by modules that handle samples of data """
+
+
+def take(data, indices):
+    """ Get the samples of data at indices
+
+    :data: list, array, sparse matrix, pandas object or None
+    :indices: array of int
+    :returns: the samples, None if data is None
+
+    """
+    if data is None:
+        return None
+    if isinstance(data, list):
+        return [data[i] for i in indices]
+    if hasattr(data, 'iloc'):
+        return data.iloc[indices]
+    return data[indices]
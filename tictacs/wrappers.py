@@ -1,5 +1,9 @@
 """ wrappers for functions to components """
+import time
 import logging
+import itertools
+from .stream import chunked, map_ordered, effective_n_jobs
+from .metrics import describe, elapsed, get_sink
 
 
 class FunctionWrapper(object):
@@ -8,6 +12,16 @@ class FunctionWrapper(object):
         information about the data in order to transform it, so this
         class lets you wrap a function into an estimator object"""
 
+    # how the function is called - see set_execution
+    MODES = ('batch', 'element', 'chunk')
+    OUTPUTS = (None, 'list', 'array', 'sparse')
+    EXECUTION = ('mode', 'chunk_size', 'n_jobs', 'backend', 'output')
+    mode = 'batch'
+    chunk_size = 1000
+    n_jobs = 1
+    backend = 'thread'
+    output = None
+
     def __init__(self, function, *args, **kwargs):
         """ Initialize the wrapper. Import the package and instantiate
             an instance of the function passing the arguments"""
@@ -32,8 +46,110 @@ class FunctionWrapper(object):
         :returns: A tranformation of X implemented in function
 
         """
-        X = self.function(X, *self.args, **self.kwargs)
-        return X
+        n_jobs = effective_n_jobs(self.n_jobs)
+        if self.mode == 'batch' and n_jobs == 1:
+            X = self.function(X, *self.args, **self.kwargs)
+            return self._assemble([X]) if self.output else X
+        if self.mode == 'batch':
+            # if we run in parallel a batch is a chunk of X
+            size = X.shape[0] if hasattr(X, 'shape') else len(X)
+            chunks = chunked(X, max(1, -(-size // n_jobs)))
+        else:
+            chunks = chunked(X, self.chunk_size)
+        parts = map_ordered(self, '_apply', chunks, n_jobs=n_jobs,
+                            backend=self.backend)
+        return self._assemble(parts)
+
+    def set_execution(self, mode=None, chunk_size=None, n_jobs=None,
+                      backend=None, output=None):
+        """ Choose how the function is applied to the data
+
+        :mode: str - 'batch' calls the function once on the whole input,
+               'element' calls it once for each element and 'chunk' calls
+               it on chunks of chunk_size elements
+        :chunk_size: int - number of elements in a chunk
+        :n_jobs: int - number of threads or processes to apply the function
+                 with, -1 for as many as there are cpus. In batch mode the
+                 input is split in n_jobs chunks.
+        :backend: str - 'thread' or 'process'. Functions need to be
+                  defined in module scope for the process backend.
+        :output: str - 'list', 'array' or 'sparse' to convert the output,
+                 by default the type of the output of the function is kept
+        :returns: self
+
+        """
+        if mode is not None:
+            if mode not in FunctionWrapper.MODES:
+                raise ValueError('Mode should be one of %s, got %s'
+                                 % (FunctionWrapper.MODES, mode))
+            self.mode = mode
+        if output is not None:
+            if output not in FunctionWrapper.OUTPUTS:
+                raise ValueError('Output should be one of %s, got %s'
+                                 % (FunctionWrapper.OUTPUTS, output))
+            self.output = output
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        if n_jobs is not None:
+            self.n_jobs = n_jobs
+        if backend is not None:
+            self.backend = backend
+        return self
+
+    def __sklearn_clone__(self):
+        """ Clone with the same function, arguments and execution. They
+            can't all be parameters for clone to pass to the constructor,
+            since keyword arguments of the constructor go to the function.
+
+        :returns: an unfitted copy
+
+        """
+        clone = FunctionWrapper(self.function, *self.args, **self.kwargs)
+        clone.set_execution(**dict((name, getattr(self, name))
+                                   for name in FunctionWrapper.EXECUTION))
+        return clone
+
+    def _apply(self, chunk):
+        """ Apply the function to a chunk of the input """
+        if self.mode == 'element':
+            return [self.function(x, *self.args, **self.kwargs)
+                    for x in chunk]
+        return self.function(chunk, *self.args, **self.kwargs)
+
+    def _assemble(self, parts):
+        """ Join the outputs for each chunk into one output, copying them
+            only once
+
+        :parts: iterable of outputs of _apply
+        :returns: the joined output
+
+        """
+        parts = list(parts)
+        first = parts[0] if parts else []
+        output = self.output
+        if output is None:
+            if hasattr(first, 'tocsr'):
+                output = 'sparse'
+            elif hasattr(first, 'dtype') and hasattr(first, 'shape'):
+                output = 'array'
+            else:
+                output = 'list'
+        if output == 'list':
+            if len(parts) == 1 and isinstance(first, list):
+                return first
+            return list(itertools.chain.from_iterable(parts))
+        if output == 'sparse':
+            import scipy.sparse as sp
+            if len(parts) == 1 and hasattr(first, 'tocsr'):
+                return first
+            return sp.vstack([sp.csr_matrix(part) for part in parts],
+                             format='csr')
+        import numpy as np
+        if len(parts) == 1 and isinstance(first, np.ndarray):
+            return first
+        if all(isinstance(part, np.ndarray) for part in parts):
+            return np.concatenate(parts)
+        return np.asarray(list(itertools.chain.from_iterable(parts)))
 
     def get_params(self, deep=True):
         """Get parameters for this estimator.
@@ -52,6 +168,74 @@ class FunctionWrapper(object):
         return out
 
 
+class EstimatorWrapper(object):
+
+    """ Base for wrappers that add behaviour around an estimator while
+        looking like the estimator to whatever contains them. Attributes
+        that aren't found on the wrapper are looked up on the fitted
+        estimator_ if there is one, otherwise on the estimator. """
+
+    # special attributes we still want to look up on the estimator
+    DELEGATED_SPECIAL = ('__sklearn_tags__',)
+
+    def __init__(self, estimator):
+        """ Wrap an estimator
+
+        :estimator: the estimator instance to wrap
+
+        """
+        self.estimator = estimator
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return '%s(%r)' % (self.__class__.__name__, self.estimator)
+
+    def __getattr__(self, name):
+        """ Delegate lookups we can't handle to the wrapped estimator """
+        # guard against lookups before __init__ has run, eg: when unpickling
+        if name.startswith('__') and name not in self.DELEGATED_SPECIAL:
+            raise AttributeError(name)
+        attrs = self.__dict__
+        if 'estimator_' in attrs:
+            return getattr(attrs['estimator_'], name)
+        if 'estimator' in attrs:
+            return getattr(attrs['estimator'], name)
+        raise AttributeError(name)
+
+    def wrapped(self):
+        """ Get the estimator we should call - the fitted one if any
+
+        :returns: estimator instance
+
+        """
+        return self.__dict__.get('estimator_', self.estimator)
+
+    def __sklearn_is_fitted__(self):
+        """ We are fitted if the estimator we call is """
+        estimator = self.wrapped()
+        if hasattr(estimator, '__sklearn_is_fitted__'):
+            return estimator.__sklearn_is_fitted__()
+        return any(key.endswith('_') and not key.startswith('__')
+                   for key in vars(estimator))
+
+    def get_params(self, deep=True):
+        """ Parameters are those of the wrapped estimator so wrapping
+            doesn't change how they are addressed in the pipeline """
+        return self.estimator.get_params(deep=deep)
+
+    def set_params(self, **params):
+        """ Set parameters of the wrapped estimator
+
+        :returns: self
+
+        """
+        self.estimator.set_params(**params)
+        return self
+
+
 class Sentinel(object):
 
     """ Wrapper for debugging and checking the flow of the pipeline.
@@ -135,3 +319,94 @@ class Sentinel(object):
         """
         # no point in returning something else here
         return dict()
+
+
+class ProfilingSentinel(object):
+
+    """ Sentinel that records cheap metrics about the data that passes it
+        instead of printing it, so it can stay in the pipeline under load.
+        Records are sent to a sink, see metrics.get_sink. """
+
+    def __init__(self, name=None, sink='ring', path=None, capacity=1000,
+                 sample=100, clock=None):
+        """ Create a ProfilingSentinel
+
+        :name: str - name to tag records with
+        :sink: str - 'ring' to keep the records in memory, 'jsonl' to
+               append them to a file or 'log' to log them
+        :path: str - file to write to for the jsonl sink
+        :capacity: int - number of records the ring buffer keeps
+        :sample: int - number of elements sampled to estimate the size of
+                 sequences of python objects
+        :clock: str - sentinels with the same clock, eg: those of one
+                pipeline, record the seconds since the previous one of
+                them saw data as elapsed. Without a clock elapsed is the
+                time since this sentinel last saw data.
+        """
+        self.name = name
+        self.sink = sink
+        self.path = path
+        self.capacity = capacity
+        self.sample = sample
+        self.clock = clock
+        # the sink is looked up the first time we record something
+        self._sink = None
+
+    def __repr__(self):
+        """ User friendly string version
+        :returns: str representation
+
+        """
+        return 'ProfilingSentinel %s to %s sink' % (self.name, self.sink)
+
+    def __getstate__(self):
+        """ Sinks hold locks and files - look them up again after
+            unpickling """
+        state = dict(self.__dict__)
+        state['_sink'] = None
+        return state
+
+    def get_sink(self):
+        """ Get the sink records go to
+
+        :returns: the sink
+
+        """
+        if self._sink is None:
+            if self.sink == 'jsonl':
+                self._sink = get_sink('jsonl', self.path)
+            elif self.sink == 'ring':
+                self._sink = get_sink('ring', self.capacity)
+            else:
+                self._sink = get_sink(self.sink)
+        return self._sink
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        """ Not really a transform - just record metrics about X """
+        record = describe(X, sample=self.sample)
+        record['sentinel'] = self.name
+        record['time'] = time.time()
+        record['elapsed'] = elapsed(('clock', self.clock)
+                                    if self.clock is not None
+                                    else ('sentinel', id(self)))
+        self.get_sink().emit(record)
+        return X
+
+    def get_params(self, deep=True):
+        """Get parameters for this estimator.
+        Parameters
+        ----------
+        deep: boolean, optional
+            If True, will return the parameters for this estimator and
+            contained subobjects that are estimators.
+        Returns
+        -------
+        params : mapping of string to any
+            Parameter names mapped to their values.
+        """
+        return dict(name=self.name, sink=self.sink, path=self.path,
+                    capacity=self.capacity, sample=self.sample,
+                    clock=self.clock)